@@ -0,0 +1,161 @@
+"""Mixes overlapping speech into one output stream with NumPy.
+
+Two voices speaking at once, e.g. the co-hosts of a stream, are summed into
+one PCM stream instead of each opening its own. Every clip is decoded to
+float32 mono, resampled to the mixer rate and added to the samples still
+pending playback; the sum is clipped to 16 bits only when it is written to
+the output, so overlapping clips saturate instead of wrapping around.
+
+simpleaudio cannot append to a playing buffer, so a clip that arrives while
+another is playing restarts the output at the current position with the new
+mix. The restart costs one conversion of the pending samples.
+
+numpy is optional: without it AudioMixer cannot be built and the player
+plays each clip on its own.
+
+Examples:
+
+  mixer = AudioMixer(sample_rate=24000)
+  await asyncio.gather(mixer.play(wav_a), mixer.play(wav_b))
+  mixer.stop()
+"""
+
+import asyncio
+import io
+import logging
+import wave
+
+try:
+    import numpy as np
+except ImportError:  # The player falls back to one output per clip
+    np = None
+
+try:
+    import simpleaudio as sa
+except ImportError:  # Mixing still works, playback is skipped
+    sa = None
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# The output rate of VOICEVOX, so its clips need no resampling
+MIXER_SAMPLE_RATE = 24000
+PCM16_MIN = -32768
+PCM16_MAX = 32767
+
+#  SECTION:=============================================================
+#            Functions
+#  =====================================================================
+
+
+def decode_wav(data: bytes) -> tuple["np.ndarray", int]:
+    """Return the samples of a 16-bit WAV as float32 mono, and its rate."""
+    with wave.open(io.BytesIO(data), "rb") as wave_read:
+        frames = wave_read.readframes(wave_read.getnframes())
+        channels = wave_read.getnchannels()
+        sample_width = wave_read.getsampwidth()
+        sample_rate = wave_read.getframerate()
+    if sample_width != 2:
+        raise ValueError(f"Unsupported sample width: {sample_width} bytes")
+    samples = np.frombuffer(frames, dtype="<i2").astype(np.float32)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    return samples, sample_rate
+
+
+def resample(samples: "np.ndarray", from_rate: int, to_rate: int) -> "np.ndarray":
+    """Resample by linear interpolation. Enough for speech at similar rates."""
+    if from_rate == to_rate or len(samples) == 0:
+        return samples
+    length = int(round(len(samples) * to_rate / from_rate))
+    positions = np.arange(length, dtype=np.float64) * (from_rate / to_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def mix(streams: list["np.ndarray"]) -> "np.ndarray":
+    """Sum float32 streams, aligned at their start, into a new buffer."""
+    mixed = np.zeros(max((len(s) for s in streams), default=0), dtype=np.float32)
+    for stream in streams:
+        mixed[: len(stream)] += stream
+    return mixed
+
+
+def to_pcm16(samples: "np.ndarray") -> bytes:
+    """Clip to the 16-bit range and return little-endian PCM."""
+    return np.clip(samples, PCM16_MIN, PCM16_MAX).astype("<i2").tobytes()
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class AudioMixer:
+    """One mono output stream that every clip is mixed into."""
+
+    def __init__(self, sample_rate: int = MIXER_SAMPLE_RATE):
+        if np is None:
+            raise ImportError("The audio mixer needs numpy")
+        self.sample_rate = sample_rate
+        # Samples from _started_at on; the head is consumed as time passes
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._started_at = 0.0
+        self._play = None
+        self.playing = 0
+        self.clips = 0
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    def _output(self, samples: "np.ndarray") -> None:
+        if self._play is not None:
+            self._play.stop()
+        self._play = sa.play_buffer(to_pcm16(samples), 1, 2, self.sample_rate)
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    def add(self, samples: "np.ndarray", now: float) -> float:
+        """Mix samples in from time now on. Returns when they end playing."""
+        consumed = int((now - self._started_at) * self.sample_rate)
+        pending = self._pending[max(consumed, 0) :]
+        self._pending = mix([pending, samples]) if len(pending) else samples
+        self._started_at = now
+        self.clips += 1
+        if sa is not None:
+            self._output(self._pending)
+        return now + len(samples) / self.sample_rate
+
+    async def play(self, wav: bytes) -> None:
+        """Mix a WAV clip into the output and wait until it has played."""
+        if sa is None:
+            logger.error("simpleaudio is not installed. Cannot play audio.")
+            return
+        samples, sample_rate = decode_wav(wav)
+        samples = resample(samples, sample_rate, self.sample_rate)
+        loop = asyncio.get_running_loop()
+        end = self.add(samples, loop.time())
+        self.playing += 1
+        try:
+            await asyncio.sleep(end - loop.time())
+        finally:
+            self.playing -= 1
+            if self.playing == 0:
+                self.stop()
+
+    def stop(self) -> None:
+        """Stop the output and drop the pending samples."""
+        if self._play is not None:
+            self._play.stop()
+            self._play = None
+        self._pending = np.zeros(0, dtype=np.float32)
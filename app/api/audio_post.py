@@ -0,0 +1,168 @@
+"""Gain and loudness normalization of synthesized audio, applied locally.
+
+VOICEVOX applies volumeScale while it synthesizes, so a volume change used
+to mean a new synthesis. With an AudioPostProcessor the player asks for
+volume 1.0 and the voice's volume is applied here instead, after a
+normalization that evens out the loudness of speakers and clips:
+
+  peak  scale so the highest sample reaches target_dbfs
+  rms   scale so the RMS level reaches target_dbfs, never past full scale
+
+The samples are a NumPy view over the PCM buffer, converted to float32 once,
+and can be resampled to the rate of the output device.
+
+Since the WAV from VOICEVOX then no longer depends on the volume,
+SynthesisCache keeps recent clips keyed by text and voice without it, and a
+volume change plays them again without a new synthesis.
+
+Examples:
+
+  post = AudioPostProcessor(normalize="rms", target_dbfs=-18.0)
+  wav = post.process(wav, volume=0.8)
+
+  cache = SynthesisCache(64)
+  cache.put(key, wav)
+  cache.get(key)
+"""
+
+import io
+import logging
+import wave
+from collections import OrderedDict
+from typing import Hashable, Literal
+
+from app import metrics
+from app.api.audio_mixer import PCM16_MAX, decode_wav, np, resample, to_pcm16
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# Headroom kept by RMS normalization, in dBFS
+PEAK_CEILING_DBFS = -1.0
+# Quieter clips are silence and are not normalized
+SILENCE_DBFS = -60.0
+
+CACHE_LOOKUPS = metrics.REGISTRY.register(
+    metrics.Counter(
+        "speech_bridge_tts_cache_lookups_total",
+        "Synthesized audio cache lookups.",
+        ["result"],
+    )
+)
+
+#  SECTION:=============================================================
+#            Functions
+#  =====================================================================
+
+
+def db_to_gain(db: float) -> float:
+    return 10 ** (db / 20)
+
+
+def encode_wav(pcm: bytes, sample_rate: int, channels: int = 1) -> bytes:
+    """Wrap 16-bit PCM in a WAV container."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wave_write:
+        wave_write.setnchannels(channels)
+        wave_write.setsampwidth(2)
+        wave_write.setframerate(sample_rate)
+        wave_write.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def normalization_gain(samples: "np.ndarray", mode: str, target_dbfs: float) -> float:
+    """Return the gain that brings samples to target_dbfs by peak or RMS."""
+    if mode == "off" or len(samples) == 0:
+        return 1.0
+    peak = float(np.max(np.abs(samples))) / PCM16_MAX
+    if peak < db_to_gain(SILENCE_DBFS):
+        return 1.0
+    if mode == "peak":
+        return db_to_gain(target_dbfs) / peak
+    rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float32)))) / PCM16_MAX
+    if rms < db_to_gain(SILENCE_DBFS):
+        return 1.0
+    gain = db_to_gain(target_dbfs) / rms
+    # Loud consonants must not clip
+    return min(gain, db_to_gain(PEAK_CEILING_DBFS) / peak)
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class AudioPostProcessor:
+    """Normalizes, applies gain to and resamples synthesized WAV clips."""
+
+    def __init__(
+        self,
+        normalize: Literal["off", "peak", "rms"] = "rms",
+        target_dbfs: float = -18.0,
+        output_sample_rate: int = 0,
+    ):
+        if np is None:
+            raise ImportError("Audio post-processing needs numpy")
+        self.normalize = normalize
+        self.target_dbfs = target_dbfs
+        # 0 keeps the rate of the clip
+        self.output_sample_rate = output_sample_rate
+
+    def process_samples(
+        self, samples: "np.ndarray", sample_rate: int, volume: float = 1.0
+    ) -> tuple["np.ndarray", int]:
+        """Return the processed float32 samples and their rate."""
+        gain = volume * normalization_gain(samples, self.normalize, self.target_dbfs)
+        if gain != 1.0:
+            samples = samples * np.float32(gain)
+        if self.output_sample_rate and self.output_sample_rate != sample_rate:
+            samples = resample(samples, sample_rate, self.output_sample_rate)
+            sample_rate = self.output_sample_rate
+        return samples, sample_rate
+
+    def process(self, wav: bytes, volume: float = 1.0) -> bytes:
+        """Return wav normalized, scaled by volume and resampled, as mono WAV."""
+        samples, sample_rate = decode_wav(wav)
+        samples, sample_rate = self.process_samples(samples, sample_rate, volume)
+        return encode_wav(to_pcm16(samples), sample_rate)
+
+
+class SynthesisCache:
+    """The most recently used synthesized clips, by text and voice."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._clips: OrderedDict[Hashable, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._clips)
+
+    def get(self, key: Hashable) -> bytes | None:
+        wav = self._clips.get(key)
+        if wav is None:
+            CACHE_LOOKUPS.labels("miss").inc()
+            return None
+        self._clips.move_to_end(key)
+        CACHE_LOOKUPS.labels("hit").inc()
+        return wav
+
+    def put(self, key: Hashable, wav: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        self._clips[key] = wav
+        self._clips.move_to_end(key)
+        while len(self._clips) > self.max_entries:
+            self._clips.popitem(last=False)
+
+    def resize(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        while len(self._clips) > max(max_entries, 0):
+            self._clips.popitem(last=False)
@@ -0,0 +1,302 @@
+"""Updates OBS text sources directly through the obs-websocket v5 protocol.
+
+The browser source overlay renders every subtitle with its own page and JS
+loop inside OBS. With [obs_websocket] enabled, ObsWebSocketSink connects to
+the WebSocket server built into OBS 28+ and sets the text of two native text
+sources instead, one for the recognized text and one for the translation.
+The overlay keeps working next to it.
+
+Protocol, JSON over the "obswebsocket.json" subprotocol:
+
+  OBS -> app   op 0 Hello                 rpcVersion, auth challenge and salt
+  app -> OBS   op 1 Identify              auth string, no event subscriptions
+  OBS -> app   op 2 Identified
+  app -> OBS   op 8 RequestBatch          SetInputSettings per changed source
+  OBS -> app   op 9 RequestBatchResponse  status of each request
+
+Interims arrive faster than OBS needs them. Updates are coalesced per
+source: only the latest text of each source is kept, and the changes of
+coalesce_ms are sent as one batch. Finals are sent at once. While OBS is
+unreachable the latest texts wait and are sent after the reconnect.
+
+Examples:
+
+  sink = ObsWebSocketSink("ws://127.0.0.1:4455", password, "Speech", "Translation")
+  sink.start()
+  sink.update_original("こんにちは", is_final=False)
+  await sink.stop()
+"""
+
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from app import metrics
+
+if TYPE_CHECKING:
+    from websockets.asyncio.client import ClientConnection
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+SUBPROTOCOL = "obswebsocket.json"
+RPC_VERSION = 1
+OP_HELLO = 0
+OP_IDENTIFY = 1
+OP_IDENTIFIED = 2
+OP_REQUEST_BATCH = 8
+OP_REQUEST_BATCH_RESPONSE = 9
+# Requests of a batch run one after another, in order
+EXECUTION_SERIAL_REALTIME = 0
+
+CONNECT_TIMEOUT = 5.0
+# Shutdown does not wait longer for OBS to confirm the close
+CLOSE_TIMEOUT = 1.0
+RECONNECT_DELAY_MIN = 1.0
+RECONNECT_DELAY_MAX = 30.0
+
+_OBS_WEBSOCKET_LATENCY = metrics.STAGE_LATENCY.labels("obs_websocket")
+OBS_UPDATES = metrics.REGISTRY.register(
+    metrics.Counter(
+        "speech_bridge_obs_websocket_updates_total",
+        "Text source updates sent to, merged before or rejected by OBS.",
+        ["result"],
+    )
+)
+
+#  SECTION:=============================================================
+#            Exceptions
+#  =====================================================================
+
+
+class ObsWebSocketError(RuntimeError):
+    """The obs-websocket handshake failed."""
+
+
+#  SECTION:=============================================================
+#            Functions
+#  =====================================================================
+
+
+def authentication(password: str, salt: str, challenge: str) -> str:
+    """Return the Identify auth string for the challenge of a Hello."""
+    secret = base64.b64encode(hashlib.sha256((password + salt).encode()).digest())
+    return base64.b64encode(
+        hashlib.sha256(secret + challenge.encode()).digest()
+    ).decode()
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class ObsWebSocketSink:
+    """Keeps a connection to OBS and sets the text of its text sources."""
+
+    def __init__(
+        self,
+        url: str,
+        password: str = "",
+        original_source: str = "",
+        translated_source: str = "",
+        coalesce_ms: float = 50.0,
+    ):
+        self.url = url
+        self.password = password
+        # Empty names are not updated
+        self.original_source = original_source
+        self.translated_source = translated_source
+        self.coalesce = coalesce_ms / 1000
+        self.connected = False
+        self.reconnects = 0
+        # Source name -> latest text not sent yet
+        self._pending: dict[str, str] = {}
+        self._dirty = asyncio.Event()
+        self._urgent = asyncio.Event()
+        # Batch request id -> perf_counter() when sent
+        self._sent_at: dict[str, float] = {}
+        self._ids = itertools.count()
+        self._task: asyncio.Task | None = None
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    def _set(self, source: str, text: str, urgent: bool) -> None:
+        if not source:
+            return
+        if source in self._pending:
+            OBS_UPDATES.labels("coalesced").inc()
+        self._pending[source] = text
+        self._dirty.set()
+        if urgent:
+            self._urgent.set()
+
+    async def _connect(self) -> "ClientConnection":
+        """Open the connection and complete the Hello/Identify handshake."""
+        from websockets.asyncio.client import connect
+
+        websocket = await connect(
+            self.url,
+            subprotocols=[SUBPROTOCOL],
+            open_timeout=CONNECT_TIMEOUT,
+            close_timeout=CLOSE_TIMEOUT,
+        )
+        try:
+            hello = json.loads(
+                await asyncio.wait_for(websocket.recv(), CONNECT_TIMEOUT)
+            )
+            if hello.get("op") != OP_HELLO:
+                raise ObsWebSocketError(f"Expected Hello, got op {hello.get('op')}")
+            identify = {"rpcVersion": RPC_VERSION, "eventSubscriptions": 0}
+            auth = hello["d"].get("authentication")
+            if auth is not None:
+                identify["authentication"] = authentication(
+                    self.password, auth["salt"], auth["challenge"]
+                )
+            await websocket.send(json.dumps({"op": OP_IDENTIFY, "d": identify}))
+            identified = json.loads(
+                await asyncio.wait_for(websocket.recv(), CONNECT_TIMEOUT)
+            )
+            if identified.get("op") != OP_IDENTIFIED:
+                raise ObsWebSocketError(
+                    f"Expected Identified, got op {identified.get('op')}"
+                )
+        except BaseException:
+            await websocket.close()
+            raise
+        return websocket
+
+    async def _send_updates(self, websocket: "ClientConnection") -> None:
+        while True:
+            await self._dirty.wait()
+            # Let more interims arrive, unless a final is waiting
+            if not self._urgent.is_set():
+                try:
+                    await asyncio.wait_for(self._urgent.wait(), self.coalesce)
+                except asyncio.TimeoutError:
+                    pass
+            self._dirty.clear()
+            self._urgent.clear()
+            updates, self._pending = self._pending, {}
+            request_id = str(next(self._ids))
+            batch = {
+                "requestId": request_id,
+                "haltOnFailure": False,
+                "executionType": EXECUTION_SERIAL_REALTIME,
+                "requests": [
+                    {
+                        "requestType": "SetInputSettings",
+                        "requestData": {
+                            "inputName": source,
+                            "inputSettings": {"text": text},
+                            "overlay": True,
+                        },
+                    }
+                    for source, text in updates.items()
+                ],
+            }
+            try:
+                self._sent_at[request_id] = time.perf_counter()
+                await websocket.send(
+                    json.dumps({"op": OP_REQUEST_BATCH, "d": batch}, ensure_ascii=False)
+                )
+            except Exception:
+                # Newer texts win; the rest is sent after the reconnect
+                self._sent_at.pop(request_id, None)
+                for source, text in updates.items():
+                    self._pending.setdefault(source, text)
+                self._dirty.set()
+                raise
+            OBS_UPDATES.labels("sent").inc(len(updates))
+
+    async def _read_responses(self, websocket: "ClientConnection") -> None:
+        async for message in websocket:
+            payload = json.loads(message)
+            if payload.get("op") != OP_REQUEST_BATCH_RESPONSE:
+                continue
+            response = payload["d"]
+            sent_at = self._sent_at.pop(response.get("requestId"), None)
+            if sent_at is not None:
+                _OBS_WEBSOCKET_LATENCY.observe(time.perf_counter() - sent_at)
+            for result in response.get("results", []):
+                status = result.get("requestStatus", {})
+                if not status.get("result"):
+                    OBS_UPDATES.labels("failed").inc()
+                    logger.warning(
+                        f"OBS rejected {result.get('requestType')}: "
+                        f"{status.get('code')} {status.get('comment', '')}"
+                    )
+
+    async def _run(self) -> None:
+        failures = 0
+        while True:
+            try:
+                websocket = await self._connect()
+            except Exception as e:
+                delay = min(RECONNECT_DELAY_MIN * 2**failures, RECONNECT_DELAY_MAX)
+                failures += 1
+                logger.warning(
+                    f"Cannot connect to OBS at {self.url}: {e!r}, "
+                    f"retrying in {delay:.0f} s"
+                )
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+            self.connected = True
+            logger.info(f"Connected to OBS at {self.url}")
+            tasks = [
+                asyncio.create_task(self._send_updates(websocket)),
+                asyncio.create_task(self._read_responses(websocket)),
+            ]
+            try:
+                # Either ends when the connection is lost
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        logger.warning(f"Connection to OBS lost: {task.exception()!r}")
+            finally:
+                self.connected = False
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                self._sent_at.clear()
+                await websocket.close()
+            self.reconnects += 1
+            await asyncio.sleep(RECONNECT_DELAY_MIN)
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    def update_original(self, text: str, is_final: bool) -> None:
+        """Show recognized text; interims may be merged with later ones."""
+        self._set(self.original_source, text, urgent=is_final)
+
+    def update_translation(self, text: str) -> None:
+        self._set(self.translated_source, text, urgent=True)
+
+    def start(self) -> None:
+        """Connect in the background and keep reconnecting until stop()."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="obs-websocket")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -17,6 +17,8 @@ import httpx
 import logging
 import asyncio
 
+from app import tracing
+
 #  SECTION:=============================================================
 #            Logger
 #  =====================================================================
@@ -41,14 +43,22 @@ class Translator:
         api_url: str = "",
         result_type: str = "translated",
         api_key: str | None = None,
+        client: httpx.AsyncClient | None = None,
     ):
-        """Initialize the Translator object with language settings and API type."""
+        """Initialize the Translator object with language settings and API type.
+
+        Args:
+          client (httpx.AsyncClient | None): A shared client whose connection
+            pool is reused across calls. A one-shot client is opened per call
+            when None.
+        """
         self.source_lang = source_lang
         self.target_lang = target_lang
         self.api_type = api_type
         self.api_url = api_url
         self.result_type = result_type
         self.api_key = api_key
+        self.client = client
 
     #  SECTION:=============================================================
     #            Functions, helper
@@ -87,10 +97,14 @@ class Translator:
                 "target": self.target_lang.lower(),
             }
             try:
-                async with httpx.AsyncClient(follow_redirects=True) as client:
-                    response = await client.get(self.api_url, params=params)
-                    response.raise_for_status()
-                    return response.text
+                with tracing.span("Translator.call_api", "translation", api="gas"):
+                    if self.client is not None:
+                        response = await self.client.get(self.api_url, params=params)
+                    else:
+                        async with httpx.AsyncClient(follow_redirects=True) as client:
+                            response = await client.get(self.api_url, params=params)
+                response.raise_for_status()
+                return response.text
             except httpx.HTTPError as e:
                 logger.error(f"HTTP request failed: {e}")
                 return None
@@ -100,6 +114,17 @@ class Translator:
         else:
             raise ValueError("Unsupported API type")
 
+    async def warm_up(self, text: str = "warm up") -> bool:
+        """Translate a short text once so the first real call runs warm.
+
+        Resolves DNS, opens TLS connections (including the redirect target of
+        gas) and lets the API spin up before the first utterance arrives.
+
+        Returns:
+          bool: True if the warm-up translation succeeded.
+        """
+        return await self.call_api(text) is not None
+
     def to_json(self, original_text: str, translated_text: str | None) -> str:
         """
         Serialize the translation result dictionary to a JSON string.
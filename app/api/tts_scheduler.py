@@ -0,0 +1,260 @@
+"""Keeps spoken output within a maximum lag of the live text.
+
+Every final is spoken, and a speaker who talks faster than VOICEVOX reads
+aloud leaves the audio further and further behind. TtsScheduler sits in
+front of the player's say(): each voice has its own queue, spoken one
+utterance at a time, so the co-hosts of a stream are still mixed while one
+voice no longer talks over itself.
+
+The duration of a queued utterance is estimated from its length and the
+speed of its voice. The lag of a queue is the time until everything in it
+has been spoken. When the next utterance starts while the lag is above
+max_lag, the scheduler:
+
+  1. speeds up the next utterance, raising speedScale by up to max_speed
+     times the voice's speed, just enough to fit the backlog in max_lag
+  2. if that is not enough, skips the oldest utterances, keeping the newest,
+     which are closest to what the viewers read on screen
+
+The estimate starts at chars_per_second and follows the measured time of
+every spoken utterance, synthesis included.
+
+Examples:
+
+  scheduler = TtsScheduler(services.get_voicevox, services.get_voice_config)
+  await scheduler.say("こんにちは", "female_voice")
+  scheduler.lag()
+  await scheduler.stop()
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, Callable
+
+from app import metrics
+
+if TYPE_CHECKING:
+    from app.api.tts_worker import TtsWorker
+    from app.api.voicevox_engine_util import VoiceConfig, VoicevoxAudioPlayer
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# Weight of the last spoken utterance in the speaking rate estimate
+RATE_SMOOTHING = 0.2
+# The measured rate stays within this factor of chars_per_second, so a
+# failed synthesis that returns at once does not make every text look short
+RATE_BOUND = 4.0
+
+_QUEUE_LATENCY = metrics.STAGE_LATENCY.labels("tts_queue")
+TTS_LAG = metrics.REGISTRY.register(
+    metrics.Gauge(
+        "speech_bridge_tts_lag_seconds",
+        "Expected seconds until the longest TTS queue has been spoken.",
+    )
+)
+TTS_SCHEDULED = metrics.REGISTRY.register(
+    metrics.Counter(
+        "speech_bridge_tts_scheduled_total",
+        "Utterances spoken at their speed, sped up or skipped to bound the lag.",
+        ["action"],
+    )
+)
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+@dataclass(slots=True)
+class _Utterance:
+    text: str
+    voice: "VoiceConfig"
+    # Seconds to speak at the voice's speed
+    estimate: float
+    queued_at: float
+    done: asyncio.Future
+
+
+@dataclass(slots=True)
+class _Lane:
+    """Queue of one voice."""
+
+    queue: deque[_Utterance] = field(default_factory=deque)
+    # Estimate of the utterance being spoken, as time.monotonic()
+    speaking_until: float = 0.0
+    current: _Utterance | None = None
+    task: asyncio.Task | None = None
+
+
+class TtsScheduler:
+    """Speaks utterances in order per voice, within max_lag of their arrival."""
+
+    def __init__(
+        self,
+        get_player: "Callable[[], VoicevoxAudioPlayer | TtsWorker]",
+        get_voice: "Callable[[str | None], VoiceConfig]",
+        max_lag: float = 10.0,
+        max_speed: float = 1.5,
+        chars_per_second: float = 7.0,
+    ):
+        # Called per utterance, so a player rebuilt by a reload is used
+        self.get_player = get_player
+        self.get_voice = get_voice
+        self.configure(max_lag, max_speed, chars_per_second)
+        # Seconds per character at speed 1.0, measured
+        self.seconds_per_char = 1 / chars_per_second
+        self._lanes: dict["VoiceConfig", _Lane] = {}
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    def _estimate(self, text: str, voice: "VoiceConfig") -> float:
+        return len(text) * self.seconds_per_char / voice.speed
+
+    def _learn(self, text: str, speed: float, elapsed: float) -> None:
+        if not text:
+            return
+        base = 1 / self.chars_per_second
+        measured = min(
+            max(elapsed * speed / len(text), base / RATE_BOUND), base * RATE_BOUND
+        )
+        self.seconds_per_char += (measured - self.seconds_per_char) * RATE_SMOOTHING
+
+    def _lane_lag(self, lane: _Lane, now: float) -> float:
+        queued = sum(utterance.estimate for utterance in lane.queue)
+        return max(lane.speaking_until - now, 0.0) + queued
+
+    def _next(self, lane: _Lane) -> tuple[_Utterance, float] | None:
+        """Pop the utterance to speak next and the factor to speed it up by.
+
+        Skips the oldest utterances when even max_speed cannot fit the
+        backlog in max_lag. Returns None when nothing is left to speak.
+        """
+        queue = lane.queue
+        # Callers cancelled with their connection
+        for utterance in [u for u in queue if u.done.cancelled()]:
+            queue.remove(utterance)
+        if not queue:
+            return None
+        backlog = sum(utterance.estimate for utterance in queue)
+        factor = min(max(backlog / self.max_lag, 1.0), self.max_speed)
+        while len(queue) > 1 and backlog / factor > self.max_lag:
+            skipped = queue.popleft()
+            backlog -= skipped.estimate
+            TTS_SCHEDULED.labels("skipped").inc()
+            logger.info(f"TTS lag over {self.max_lag:.1f} s, skipped: {skipped.text}")
+            if not skipped.done.done():
+                skipped.done.set_result(False)
+        return queue.popleft(), factor
+
+    async def _speak(self, key: "VoiceConfig", lane: _Lane) -> None:
+        """Speak the queue of a lane until it is empty, then drop the lane."""
+        try:
+            while lane.queue:
+                picked = self._next(lane)
+                if picked is None:
+                    break
+                utterance, factor = picked
+                lane.current = utterance
+                voice = utterance.voice
+                if factor > 1.0:
+                    voice = replace(voice, speed=voice.speed * factor)
+                    TTS_SCHEDULED.labels("sped_up").inc()
+                else:
+                    TTS_SCHEDULED.labels("spoken").inc()
+                start = time.monotonic()
+                _QUEUE_LATENCY.observe(start - utterance.queued_at)
+                lane.speaking_until = start + utterance.estimate / factor
+                try:
+                    await self.get_player().say(utterance.text, voice)
+                except Exception as e:
+                    if not utterance.done.done():
+                        utterance.done.set_exception(e)
+                    lane.current = None
+                    continue
+                self._learn(utterance.text, voice.speed, time.monotonic() - start)
+                if not utterance.done.done():
+                    utterance.done.set_result(True)
+                lane.current = None
+        finally:
+            lane.speaking_until = 0.0
+            if self._lanes.get(key) is lane:
+                del self._lanes[key]
+            if lane.current is not None:
+                lane.queue.appendleft(lane.current)
+            for utterance in lane.queue:
+                if not utterance.done.done():
+                    utterance.done.cancel()
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    def configure(
+        self, max_lag: float, max_speed: float, chars_per_second: float
+    ) -> None:
+        """Apply new limits; utterances already queued follow them."""
+        self.max_lag = max_lag
+        self.max_speed = max(max_speed, 1.0)
+        self.chars_per_second = chars_per_second
+
+    def lag(self) -> float:
+        """Expected seconds until the longest queue has been spoken."""
+        now = time.monotonic()
+        return max(
+            (self._lane_lag(lane, now) for lane in self._lanes.values()), default=0.0
+        )
+
+    def pending(self) -> int:
+        return sum(len(lane.queue) for lane in self._lanes.values())
+
+    async def say(self, text: str, voice: str | None = None) -> bool:
+        """Queue text for voice and wait until it has been spoken.
+
+        Returns:
+            bool: False if it was skipped to keep within max_lag.
+        """
+        voice_config = self.get_voice(voice)
+        utterance = _Utterance(
+            text,
+            voice_config,
+            self._estimate(text, voice_config),
+            time.monotonic(),
+            asyncio.get_running_loop().create_future(),
+        )
+        # Recognizers sharing a voice share its queue
+        lane = self._lanes.get(voice_config)
+        if lane is None:
+            lane = self._lanes[voice_config] = _Lane()
+        lane.queue.append(utterance)
+        if lane.task is None:
+            lane.task = asyncio.create_task(
+                self._speak(voice_config, lane),
+                name=f"tts-scheduler-{voice_config.speaker}",
+            )
+        return await utterance.done
+
+    async def stop(self) -> None:
+        """Cancel the queues; waiting say() calls are cancelled with them."""
+        lanes = list(self._lanes.values())
+        self._lanes.clear()
+        for lane in lanes:
+            if lane.task is not None:
+                lane.task.cancel()
+        await asyncio.gather(
+            *(lane.task for lane in lanes if lane.task is not None),
+            return_exceptions=True,
+        )
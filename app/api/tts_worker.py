@@ -0,0 +1,349 @@
+"""VOICEVOX synthesis and playback in a worker process.
+
+WAV decoding, mixing and playback share the event loop and the GIL with the
+WebSocket handlers, so a burst of audio work shows up as overlay jitter.
+With [tts_worker] enabled, TtsWorker starts a separate process that owns the
+Voicevox player, its HTTP pool, the mixer and the clip cache. The app only
+puts jobs on a multiprocessing queue and awaits their completion:
+
+  app -> worker   ("say", job_id, text, voice)   speak text
+                  ("config", AppConfig)          a reloaded config
+                  None                           stop
+  worker -> app   ("ready",)                     speakers are warmed up
+                  ("done", job_id, error)        job finished, error or None
+
+The app supervises the worker: if it dies, its pending jobs fail and it is
+started again after a delay that doubles with each failure in a row. The
+worker exits on its own when the app process is gone. VOICEVOX stage
+latencies are measured in the worker and are not in the app's /metrics.
+
+Examples:
+
+  worker = TtsWorker(config)
+  worker.start()
+  await worker.wait_ready(30)
+  await worker.say("こんにちは", "male_voice")
+  await worker.stop()
+"""
+
+import asyncio
+import copy
+import itertools
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+from typing import TYPE_CHECKING
+
+from app import metrics
+
+if TYPE_CHECKING:
+    from app.api.voicevox_engine_util import VoiceConfig
+    from app.config.app_config import AppConfig
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+RESTART_DELAY_MIN = 1.0
+RESTART_DELAY_MAX = 30.0
+# How often the app checks the worker, and the worker checks the app
+SUPERVISE_INTERVAL = 1.0
+STOP_TIMEOUT = 5.0
+
+WORKER_RESTARTS = metrics.REGISTRY.register(
+    metrics.Counter(
+        "speech_bridge_tts_worker_restarts_total",
+        "TTS worker processes started again after they died.",
+    )
+)
+
+#  SECTION:=============================================================
+#            Exceptions
+#  =====================================================================
+
+
+class TtsWorkerError(RuntimeError):
+    """A job failed in the worker, or the worker was not there to run it."""
+
+
+#  SECTION:=============================================================
+#            Functions, worker process
+#  =====================================================================
+
+
+def run_worker(
+    config: "AppConfig",
+    jobs: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    log_level: int = logging.INFO,
+) -> None:
+    """Entry point of the worker process."""
+    import logging.config
+
+    from app.config.logging_config import LOGGING_CONFIG
+
+    # Ctrl+C reaches the whole process group; the app stops the worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging_config = copy.deepcopy(LOGGING_CONFIG)
+    logging_config["loggers"]["app"]["level"] = log_level
+    logging.config.dictConfig(logging_config)
+    asyncio.run(_serve(config, jobs, results))
+
+
+def _next_job(jobs: multiprocessing.Queue) -> tuple | None:
+    """Block until the next job; None to stop, also when the app is gone."""
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            return jobs.get(timeout=SUPERVISE_INTERVAL)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                logger.warning("The app process is gone, stopping the TTS worker")
+                return None
+
+
+async def _serve(
+    config: "AppConfig", jobs: multiprocessing.Queue, results: multiprocessing.Queue
+) -> None:
+    from app.config.app_config import set_app_config
+    from app.services import SharedServices
+
+    set_app_config(config)
+    services = SharedServices(config)
+    await services.start_tts()
+    results.put(("ready",))
+    logger.info("TTS worker is ready")
+
+    running: set[asyncio.Task] = set()
+    try:
+        while (job := await asyncio.to_thread(_next_job, jobs)) is not None:
+            if job[0] == "config":
+                set_app_config(job[1])
+                await services.start_tts(job[1])
+            elif job[0] == "say":
+                task = asyncio.create_task(_say(services, results, *job[1:]))
+                running.add(task)
+                task.add_done_callback(running.discard)
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        await services.shutdown()
+
+
+async def _say(
+    services,
+    results: multiprocessing.Queue,
+    job_id: int,
+    text: str,
+    voice: "str | VoiceConfig | None",
+) -> None:
+    error = None
+    try:
+        await services.get_voicevox().say(text, voice)
+    except Exception as e:
+        error = repr(e)
+        logger.error(f"TTS job {job_id} failed: {error}", exc_info=True)
+    results.put(("done", job_id, error))
+
+
+#  SECTION:=============================================================
+#            Functions, app process
+#  =====================================================================
+
+
+def _release(
+    jobs: "multiprocessing.Queue | None",
+    results: "multiprocessing.Queue | None",
+    reader: threading.Thread | None,
+) -> None:
+    """Stop the result reader and close the queues of a finished worker."""
+    if results is not None:
+        results.put(None)
+    if reader is not None:
+        reader.join(timeout=STOP_TIMEOUT)
+    if jobs is not None:
+        # Nobody reads the jobs any more; flushing them would block forever
+        jobs.cancel_join_thread()
+    if results is not None and reader is not None and reader.is_alive():
+        results.cancel_join_thread()
+    for q in (jobs, results):
+        if q is not None:
+            q.close()
+            q.join_thread()
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class TtsWorker:
+    """Starts, supervises and hands jobs to the TTS worker process."""
+
+    def __init__(self, config: "AppConfig", job_timeout: float = 60.0):
+        self.config = config
+        self.job_timeout = job_timeout
+        self.restarts = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._process: multiprocessing.Process | None = None
+        self._jobs: multiprocessing.Queue | None = None
+        self._results: multiprocessing.Queue | None = None
+        self._reader: threading.Thread | None = None
+        self._ready: asyncio.Future | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._failures = 0
+        self._supervisor: asyncio.Task | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    def _spawn(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._jobs = self._context.Queue()
+        self._results = self._context.Queue()
+        self._ready = loop.create_future()
+        self._process = self._context.Process(
+            target=run_worker,
+            args=(
+                self.config,
+                self._jobs,
+                self._results,
+                logging.getLogger("app").getEffectiveLevel(),
+            ),
+            name="tts-worker",
+            daemon=True,
+        )
+        self._process.start()
+        self._reader = threading.Thread(
+            target=self._read,
+            args=(self._results, loop),
+            name="tts-worker-results",
+            daemon=True,
+        )
+        self._reader.start()
+        logger.info(f"TTS worker started, pid {self._process.pid}")
+
+    def _read(self, results: multiprocessing.Queue, loop) -> None:
+        # None is put by the app itself when the worker is gone
+        while (message := results.get()) is not None:
+            loop.call_soon_threadsafe(self._on_result, message)
+
+    def _on_result(self, message: tuple) -> None:
+        if message[0] == "ready":
+            self._failures = 0
+            if self._ready is not None and not self._ready.done():
+                self._ready.set_result(True)
+        elif message[0] == "done":
+            _, job_id, error = message
+            future = self._pending.get(job_id)
+            if future is not None and not future.done():
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(TtsWorkerError(error))
+
+    async def _reap(self, reason: str) -> None:
+        """Fail the pending jobs and release the queues of a finished worker."""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(TtsWorkerError(reason))
+        if self._ready is not None and not self._ready.done():
+            self._ready.set_result(False)
+        jobs, results, reader = self._jobs, self._results, self._reader
+        self._process = self._jobs = self._results = self._reader = None
+        # Joining the reader and the feeder threads blocks, so not on the loop
+        await asyncio.to_thread(_release, jobs, results, reader)
+
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            if self._process is None or self._process.is_alive():
+                continue
+            exitcode = self._process.exitcode
+            await self._reap(f"TTS worker exited with code {exitcode}")
+            delay = min(RESTART_DELAY_MIN * 2**self._failures, RESTART_DELAY_MAX)
+            self._failures += 1
+            logger.error(
+                f"TTS worker exited with code {exitcode}, restarting in {delay:.0f} s"
+            )
+            await asyncio.sleep(delay)
+            self.restarts += 1
+            WORKER_RESTARTS.inc()
+            self._spawn()
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    def start(self) -> None:
+        if self._supervisor is not None:
+            return
+        self._spawn()
+        self._supervisor = asyncio.create_task(
+            self._supervise(), name="tts-worker-supervisor"
+        )
+
+    async def wait_ready(self, timeout: float) -> bool:
+        """Wait until the worker has warmed up. Returns False on timeout."""
+        if self._ready is None:
+            return False
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    async def say(self, text: str, voice: "str | VoiceConfig | None" = None) -> None:
+        """Have the worker speak text and wait until it has been played.
+
+        Raises:
+            TtsWorkerError: The job failed or the worker is not running.
+            asyncio.TimeoutError: The job took longer than job_timeout.
+        """
+        if self._jobs is None:
+            raise TtsWorkerError("TTS worker is not running")
+        job_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[job_id] = future
+        try:
+            self._jobs.put(("say", job_id, text, voice))
+            await asyncio.wait_for(future, self.job_timeout)
+        finally:
+            self._pending.pop(job_id, None)
+
+    def apply_config(self, config: "AppConfig") -> None:
+        """Rebuild the player of the worker for a reloaded config."""
+        self.config = config
+        if self._jobs is not None:
+            self._jobs.put(("config", config))
+
+    async def stop(self) -> None:
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+            self._supervisor = None
+        if self._process is None:
+            return
+        process = self._process
+        self._jobs.put(None)
+        await asyncio.to_thread(process.join, STOP_TIMEOUT)
+        if process.is_alive():
+            logger.warning("TTS worker did not stop in time, terminating it")
+            process.terminate()
+            await asyncio.to_thread(process.join, STOP_TIMEOUT)
+        await self._reap("TTS worker stopped")
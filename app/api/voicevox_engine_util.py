@@ -1,13 +1,24 @@
 import asyncio
 import logging
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING
 
 import httpx
-import requests
 
 import io
+import time
 import wave
-import simpleaudio as sa
 
+try:
+    import simpleaudio as sa
+except ImportError:  # Synthesis still works, playback is skipped
+    sa = None
+
+from app import metrics, tracing
+
+if TYPE_CHECKING:
+    from app.api.audio_mixer import AudioMixer
+    from app.api.audio_post import AudioPostProcessor, SynthesisCache
 
 #  SECTION:=============================================================
 #            Logger
@@ -16,13 +27,45 @@ import simpleaudio as sa
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
+_QUERY_LATENCY = metrics.STAGE_LATENCY.labels("voicevox_query")
+_SYNTHESIS_LATENCY = metrics.STAGE_LATENCY.labels("voicevox_synthesis")
+_PLAYBACK_LATENCY = metrics.STAGE_LATENCY.labels("voicevox_playback")
+_ERRORS = metrics.ERRORS.labels("voicevox")
+
+# First bytes of a RIFF/WAV file, what /synthesis returns
+WAV_MAGIC = b"RIFF"
+
 #  SECTION:=============================================================
 #            Class
 #  =====================================================================
 
 
+@dataclass(frozen=True, slots=True)
+class VoiceConfig:
+    """Synthesis parameters of one voice.
+
+    Immutable: a say() keeps the voice it started with, whatever configure()
+    or another caller does meanwhile.
+    """
+
+    speaker: int
+    speed: float = 1.0
+    pitch: float = 0.0
+    intonation: float = 1.0
+    volume: float = 1.0
+
+
 class VoicevoxAudioPlayer:
-    """Class for text to speech by Voicevox"""
+    """Class for text to speech by Voicevox
+
+    The constructor's voice is the default. voices names other voices that
+    say() can use, e.g. one per recognizer. With a mixer, clips that overlap
+    are mixed into one output instead of each playing on its own.
+
+    With a post-processor, VOICEVOX synthesizes at volume 1.0 and the voice's
+    volume is applied locally after normalization, so the clips kept in
+    cache are reused whatever the volume.
+    """
 
     def __init__(
         self,
@@ -33,42 +76,56 @@ class VoicevoxAudioPlayer:
         volume: float,
         host: str,
         port: int,
+        client: httpx.AsyncClient | None = None,
+        voices: dict[str, VoiceConfig] | None = None,
+        mixer: "AudioMixer | None" = None,
+        post: "AudioPostProcessor | None" = None,
+        cache: "SynthesisCache | None" = None,
     ):
-        self.speaker = speaker
-        self.speed = speed
-        self.pitch = pitch
-        self.intonation = intonation
-        self.volume = volume
+        self.voice = VoiceConfig(speaker, speed, pitch, intonation, volume)
+        self.voices = dict(voices or {})
+        self.mixer = mixer
+        self.post = post
+        self.cache = cache
         self.base_url = f"http://{host}:{port}/"
+        # Shared client keeps connections to the engine open between calls.
+        # A one-shot client is opened per request when None.
+        self.client = client
 
     #  SECTION:=============================================================
     #            Functions, helper
     #  =====================================================================
 
-    async def _generate_query(self, text: str) -> dict[str, dict] | None:
+    async def _post(self, path: str, **kwargs) -> httpx.Response:
+        """POST to the engine, through the shared client if there is one."""
+        if self.client is not None:
+            return await self.client.post(f"{self.base_url}{path}", **kwargs)
+        async with httpx.AsyncClient() as client:
+            return await client.post(f"{self.base_url}{path}", **kwargs)
+
+    async def _generate_query(
+        self, text: str, voice: VoiceConfig
+    ) -> dict[str, dict] | None:
         params = {
             "text": text,
-            "speaker": self.speaker,
+            "speaker": voice.speaker,
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                query_response = await client.post(
-                    f"{self.base_url}audio_query",
-                    params=params,
-                )
-                query_response.raise_for_status()
-
-                # Modify query_response by using self. parameters
-                query_data = query_response.json()
-                query_data["speedScale"] = self.speed
-                query_data["witchScale"] = self.pitch
-                query_data["intonationScale"] = self.intonation
-                query_data["volumeScale"] = self.volume
-
-                query = {"params": params, "json": query_data}
-                # query = {"params": params, "json": json.dumps(query_data)}
-                return query
+            query_response = await self._post("audio_query", params=params)
+            query_response.raise_for_status()
+
+            # Modify query_response by using the voice parameters
+            query_data = query_response.json()
+            query_data["speedScale"] = voice.speed
+            query_data["witchScale"] = voice.pitch
+            query_data["intonationScale"] = voice.intonation
+            # Applied locally by the post-processor, see say()
+            query_data["volumeScale"] = 1.0 if self.post else voice.volume
+
+            query = {"params": params, "json": query_data}
+            # query = {"params": params, "json": json.dumps(query_data)}
+            return query
 
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error occurred: {e}")
@@ -81,13 +138,13 @@ class VoicevoxAudioPlayer:
 
     async def _synthesize_audio(self, query: dict[str, dict]) -> bytes | None:
         try:
-            async with httpx.AsyncClient() as client:
-                synthesis = await client.post(
-                    f"{self.base_url}synthesis",
-                    headers={"Content-Type": "application/json"},
-                    params=query["params"],
-                    json=query["json"],
-                )
+            synthesis = await self._post(
+                "synthesis",
+                headers={"Content-Type": "application/json"},
+                params=query["params"],
+                json=query["json"],
+            )
+            synthesis.raise_for_status()
             return synthesis.content
 
         except httpx.HTTPStatusError as exc:
@@ -101,7 +158,28 @@ class VoicevoxAudioPlayer:
 
         return None
 
+    async def _synthesize(self, text: str, voice: VoiceConfig) -> bytes | None:
+        start = time.perf_counter()
+        with tracing.span("audio_query", "voicevox"):
+            query = await self._generate_query(text, voice)
+        if not query:
+            return None
+        synthesis_start = time.perf_counter()
+        _QUERY_LATENCY.observe(synthesis_start - start)
+
+        with tracing.span("synthesis", "voicevox"):
+            audio = await self._synthesize_audio(query)
+        if audio:
+            _SYNTHESIS_LATENCY.observe(time.perf_counter() - synthesis_start)
+        return audio
+
     async def _play_audio(self, audio_binary: bytes) -> None:
+        if self.mixer is not None:
+            await self.mixer.play(audio_binary)
+            return
+        if sa is None:
+            logger.error("simpleaudio is not installed. Cannot play audio.")
+            return
         # Use BytesIO to treat bytes as a file object
         audio_io = io.BytesIO(audio_binary)
 
@@ -127,10 +205,15 @@ class VoicevoxAudioPlayer:
         # # Wait until playback is complete
         # play_obj.wait_done()
 
-    def _generate_query_sync(self, text: str) -> dict[str, dict] | None:
+    def _generate_query_sync(
+        self, text: str, voice: VoiceConfig | None = None
+    ) -> dict[str, dict] | None:
+        import requests  # Only the sync API needs it
+
+        voice = voice or self.voice
         params = {
             "text": text,
-            "speaker": self.speaker,
+            "speaker": voice.speaker,
         }
 
         try:
@@ -140,12 +223,12 @@ class VoicevoxAudioPlayer:
             )
             query_response.raise_for_status()
 
-            # Modify query_response by using self. parameters
+            # Modify query_response by using the voice parameters
             query_data = query_response.json()
-            query_data["speedScale"] = self.speed
-            query_data["witchScale"] = self.pitch
-            query_data["intonationScale"] = self.intonation
-            query_data["volumeScale"] = self.volume
+            query_data["speedScale"] = voice.speed
+            query_data["witchScale"] = voice.pitch
+            query_data["intonationScale"] = voice.intonation
+            query_data["volumeScale"] = voice.volume
 
             query = {"params": params, "json": query_data}
             return query
@@ -161,6 +244,8 @@ class VoicevoxAudioPlayer:
         return None
 
     def _synthesize_audio_sync(self, query: dict[str, dict]) -> bytes | None:
+        import requests  # Only the sync API needs it
+
         try:
             synthesis = requests.post(
                 f"{self.base_url}synthesis",
@@ -168,6 +253,7 @@ class VoicevoxAudioPlayer:
                 params=query["params"],
                 json=query["json"],
             )
+            synthesis.raise_for_status()
             return synthesis.content
 
         except requests.exceptions.HTTPError as e:
@@ -181,6 +267,9 @@ class VoicevoxAudioPlayer:
         return None
 
     def _play_audio_sync(self, audio_binary: bytes) -> None:
+        if sa is None:
+            logger.error("simpleaudio is not installed. Cannot play audio.")
+            return
         # Use BytesIO to treat bytes as a file object
         audio_io = io.BytesIO(audio_binary)
 
@@ -206,11 +295,89 @@ class VoicevoxAudioPlayer:
     #            Functions, Main
     #  =====================================================================
 
-    async def say(self, text: str) -> None:
-        query = await self._generate_query(text)
-        audio = await self._synthesize_audio(query) if query else None
-        if audio:
-            await self._play_audio(audio)
+    async def initialize_speaker(self, speaker: int | None = None) -> bool:
+        """Ask the engine to load a speaker model ahead of the first synthesis.
+
+        Args:
+            speaker (int | None): Speaker to load. Defaults to the default voice.
+
+        Returns:
+            bool: True if the engine initialized the speaker.
+        """
+        params = {
+            "speaker": self.voice.speaker if speaker is None else speaker,
+            "skip_reinit": "true",
+        }
+        try:
+            response = await self._post("initialize_speaker", params=params)
+            response.raise_for_status()
+            return True
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error occurred: {e}")
+        except httpx.RequestError as e:
+            logger.error(f"A request error occurred: {e}")
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+
+        return False
+
+    def get_voice(self, voice: str | VoiceConfig | None = None) -> VoiceConfig:
+        """Return the voice named voice, or the default voice."""
+        if isinstance(voice, VoiceConfig):
+            return voice
+        if voice is None:
+            return self.voice
+        found = self.voices.get(voice)
+        if found is None:
+            logger.warning(f"Unknown voice {voice}, using the default voice")
+            return self.voice
+        return found
+
+    async def synthesize(
+        self, text: str, voice: str | VoiceConfig | None = None
+    ) -> bytes | None:
+        """Return the WAV of text as say() would play it, or None on failure.
+
+        The clip comes from the cache when it holds one, and has the
+        post-processing applied.
+        """
+        voice = self.get_voice(voice)
+        # The volume is not part of the clip when it is applied locally
+        key = (
+            self.base_url,
+            text,
+            voice if self.post is None else replace(voice, volume=1.0),
+        )
+        audio = self.cache.get(key) if self.cache is not None else None
+        if audio is None:
+            audio = await self._synthesize(text, voice)
+            if not audio:
+                _ERRORS.inc()
+                return None
+            if not audio.startswith(WAV_MAGIC):
+                # Not a WAV, e.g. an error body; never cached
+                logger.error(f"VOICEVOX returned {len(audio)} bytes that are not a WAV")
+                _ERRORS.inc()
+                return None
+            if self.cache is not None:
+                self.cache.put(key, audio)
+        if self.post is not None:
+            audio = self.post.process(audio, voice.volume)
+        return audio
+
+    async def say(self, text: str, voice: str | VoiceConfig | None = None) -> None:
+        """Speak text with voice: a name from voices, a VoiceConfig or None
+        for the default voice."""
+        voice = self.get_voice(voice)
+        with tracing.span("VoicevoxAudioPlayer.say", "voicevox", speaker=voice.speaker):
+            audio = await self.synthesize(text, voice)
+            if audio is None:
+                return
+
+            playback_start = time.perf_counter()
+            with tracing.span("playback", "voicevox"):
+                await self._play_audio(audio)
+            _PLAYBACK_LATENCY.observe(time.perf_counter() - playback_start)
 
     def configure(
         self,
@@ -221,16 +388,17 @@ class VoicevoxAudioPlayer:
         intonation: float | None = None,
         volume: float | None = None,
     ) -> None:
-        if speaker is not None:
-            self.speaker = speaker
-        if speed is not None:
-            self.speed = speed
-        if pitch is not None:
-            self.pitch = pitch
-        if intonation is not None:
-            self.intonation = intonation
-        if volume is not None:
-            self.volume = volume
+        """Replace the default voice. Calls in flight keep the old one."""
+        changes = {
+            "speaker": speaker,
+            "speed": speed,
+            "pitch": pitch,
+            "intonation": intonation,
+            "volume": volume,
+        }
+        self.voice = replace(
+            self.voice, **{k: v for k, v in changes.items() if v is not None}
+        )
 
 
 async def main():
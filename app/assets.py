@@ -0,0 +1,219 @@
+"""In-memory static assets and pre-rendered pages with ETags.
+
+StaticAssets reads app/static once at startup. Each file is kept in memory
+with a strong ETag from its content and precompressed with gzip, and with
+brotli when the brotli module is installed. A build hash over all files
+versions the URLs: /static/v/<build_hash>/js/... is served with an immutable
+cache header, and the relative imports between the JS modules stay under the
+same versioned prefix. Plain /static/... URLs keep working and are
+revalidated with the ETag.
+
+PageCache renders the HTML templates once per config version, with the
+versioned static prefix, and compresses them the same way. A reload of an
+OBS browser source is answered with 304 or from memory.
+
+Examples:
+
+  assets = StaticAssets()
+  assets.load()
+  assets.response(request, "js/ws/wsclient.js", assets.build_hash)
+
+  pages = PageCache(assets.url_prefix)
+  pages.response(request, "obs-speech-overlay.html", config_version)
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import Request, Response
+from jinja2 import Environment, FileSystemLoader
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+APP_DIR = Path(__file__).resolve().parent
+STATIC_DIR = APP_DIR / "static"
+TEMPLATE_DIR = APP_DIR / "templates"
+STATIC_URL = "/static"
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Smaller bodies are not worth compressing
+MIN_COMPRESS_SIZE = 256
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json")
+
+#  SECTION:=============================================================
+#            Functions
+#  =====================================================================
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    """Map each coding of an Accept-Encoding header to its q-value.
+
+    Example: "gzip;q=0.5, br" -> {"gzip": 0.5, "br": 1.0}. A malformed
+    q-value counts as 0, so the coding is not used.
+    """
+    qvalues = {}
+    for item in header.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding] = q
+    return qvalues
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether If-None-Match names etag, the one of the selected encoding."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+@dataclass(frozen=True, slots=True)
+class Asset:
+    """One file or page, with its precompressed encodings."""
+
+    media_type: str
+    etag: str
+    body: bytes
+    gzip: bytes | None = None
+    br: bytes | None = None
+
+    @classmethod
+    def build(cls, body: bytes, media_type: str) -> "Asset":
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        compress = len(body) >= MIN_COMPRESS_SIZE and media_type.startswith(
+            COMPRESSIBLE_TYPES
+        )
+        gzipped = gzip.compress(body, compresslevel=9, mtime=0) if compress else None
+        br = brotli.compress(body) if compress and brotli is not None else None
+        return cls(
+            media_type=media_type,
+            etag=digest,
+            body=body,
+            # Keep an encoding only if it is smaller
+            gzip=gzipped if gzipped and len(gzipped) < len(body) else None,
+            br=br if br and len(br) < len(body) else None,
+        )
+
+    def response(self, request: Request, cache_control: str) -> Response:
+        """Answer request with 304, or with the best encoding it accepts."""
+        accepted = parse_accept_encoding(request.headers.get("accept-encoding", ""))
+        encoding, body, best = None, self.body, 0.0
+        # Highest q-value wins; br first, so it is kept on a tie
+        for name, encoded in (("br", self.br), ("gzip", self.gzip)):
+            q = accepted.get(name, accepted.get("*", 0.0))
+            if encoded is not None and q > best:
+                encoding, body, best = name, encoded, q
+        # Each encoding is a different representation, so it gets its own ETag
+        etag = f'"{self.etag}-{encoding}"' if encoding else f'"{self.etag}"'
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if self.gzip is not None or self.br is not None:
+            headers["Vary"] = "Accept-Encoding"
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+class StaticAssets:
+    """The files of the static directory, loaded into memory."""
+
+    def __init__(self, directory: str | Path = STATIC_DIR, url: str = STATIC_URL):
+        self.directory = Path(directory)
+        self.url = url
+        self.build_hash = ""
+        self._assets: dict[str, Asset] = {}
+
+    @property
+    def url_prefix(self) -> str:
+        """Versioned URL prefix for templates, e.g. /static/v/1a2b3c4d5e6f."""
+        return f"{self.url}/v/{self.build_hash}"
+
+    def load(self) -> None:
+        """Read and compress every file. Blocking, run it off the event loop."""
+        assets = {}
+        build = hashlib.sha256()
+        for path in sorted(self.directory.rglob("*")):
+            if not path.is_file():
+                continue
+            relative = path.relative_to(self.directory).as_posix()
+            media_type = mimetypes.guess_type(path.name)[0]
+            asset = Asset.build(
+                path.read_bytes(), media_type or "application/octet-stream"
+            )
+            assets[relative] = asset
+            build.update(f"{relative}\0{asset.etag}\0".encode())
+        self._assets = assets
+        self.build_hash = build.hexdigest()[:12]
+        logger.info(f"Loaded {len(assets)} static files, build {self.build_hash}")
+
+    def response(
+        self, request: Request, path: str, build_hash: str | None = None
+    ) -> Response:
+        """Serve path. Only the current build hash is cached as immutable."""
+        asset = self._assets.get(path)
+        if asset is None:
+            return Response(status_code=404)
+        immutable = build_hash is not None and build_hash == self.build_hash
+        return asset.response(request, IMMUTABLE if immutable else REVALIDATE)
+
+
+class PageCache:
+    """HTML templates rendered once per config version."""
+
+    def __init__(self, static_url: str, directory: str | Path = TEMPLATE_DIR):
+        self.env = Environment(loader=FileSystemLoader(directory), autoescape=True)
+        self.static_url = static_url
+        self._version: int | None = None
+        self._pages: dict[str, Asset] = {}
+
+    def get(self, name: str, version: int) -> Asset:
+        if version != self._version:
+            self._pages = {}
+            self._version = version
+        page = self._pages.get(name)
+        if page is None:
+            html = self.env.get_template(name).render(static=self.static_url)
+            page = self._pages[name] = Asset.build(
+                html.encode(), "text/html; charset=utf-8"
+            )
+        return page
+
+    def response(self, request: Request, name: str, version: int) -> Response:
+        return self.get(name, version).response(request, REVALIDATE)
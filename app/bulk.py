@@ -0,0 +1,651 @@
+"""Translates and synthesizes an archived transcript offline, in bulk.
+
+Streams the finals of a transcript through the translator and VOICEVOX with
+bounded concurrency and writes, to the output directory:
+
+  transcript.jsonl  one JSON object per final, in input order: the text,
+                    its translation and the clip it was synthesized to
+  clips/            one WAV per final, named by its index
+  track.wav         the clips one after another, with --track
+  subtitles.srt     the translations timed on track.wav, with --track
+
+The input is the SQLite transcript store, the text log written by
+[logging], JSON lines with a "text" field, or plain text with one final per
+line. It is read as it is processed, so a long archive is never held in
+memory; at most --window finals are in flight, and they are written in input
+order as soon as each is done.
+
+Translation calls run --translate-concurrency at a time. Synthesis is spread
+over the engines of --engine, one VOICEVOX engine per host:port, each taking
+--synth-concurrency requests at a time, so throughput grows with both.
+Repeated texts, common in streams, are translated and synthesized once.
+
+transcript.jsonl is also the checkpoint: every line is flushed when written,
+and a run that is interrupted resumes after the last complete line, reusing
+the translations and clips already made. Finals that failed are tried again
+by the next run. --restart starts over.
+
+Examples:
+
+  python -m app.bulk /tmp/recog_transcript.sqlite3 --output out/
+  python -m app.bulk stream.log --output out/ --track \\
+      --engine 127.0.0.1:50021 --engine 127.0.0.1:50022 --synth-concurrency 2
+  python -m app.bulk lines.txt --output out/ --no-tts --translate-concurrency 8
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+import wave
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+
+from app.config.app_config import TOML_PATH, VOICE_NAMES, AppConfig, load_config
+
+if TYPE_CHECKING:
+    import httpx
+
+    from app.api.translator import Translator
+    from app.api.voicevox_engine_util import VoiceConfig, VoicevoxAudioPlayer
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+TRANSCRIPT_NAME = "transcript.jsonl"
+MANIFEST_NAME = "bulk.json"
+CLIPS_DIR = "clips"
+TRACK_NAME = "track.wav"
+SUBTITLES_NAME = "subtitles.srt"
+
+# Fields read from the input; the rest is made by the run
+INPUT_FIELDS = ("text", "utterance_id", "started_at", "finalized_at", "language")
+# "[en] Hello" lines of the text log are translations, not finals
+TRANSLATION_LINE = re.compile(r"\[[A-Za-z-]+\] ")
+LOG_SEPARATOR = " | "
+
+RETRY_DELAY = 1.0
+PROGRESS_EVERY = 100
+
+#  SECTION:=============================================================
+#            Class, data
+#  =====================================================================
+
+
+@dataclass(slots=True)
+class BulkUtterance:
+    """One final of the input, and what the run made of it."""
+
+    index: int
+    text: str
+    utterance_id: str | None = None
+    started_at: float | None = None
+    finalized_at: float | None = None
+    language: str | None = None
+    translation: str | None = None
+    translation_language: str | None = None
+    # Relative to the output directory
+    audio: str | None = None
+    duration: float | None = None
+    error: str | None = None
+
+
+#  SECTION:=============================================================
+#            Functions, input
+#  =====================================================================
+
+
+def _parse_timestamp(value: str, timestamp_format: str) -> float | None:
+    try:
+        return time.mktime(time.strptime(value, timestamp_format))
+    except ValueError:
+        return None
+
+
+def _read_store(path: Path) -> Iterator[dict]:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield from (
+            dict(row)
+            for row in conn.execute(
+                "SELECT utterance_id, started_at, finalized_at, language, text"
+                " FROM utterances ORDER BY id"
+            )
+        )
+    finally:
+        conn.close()
+
+
+def _read_lines(path: Path, timestamp_format: str) -> Iterator[dict]:
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            if line.startswith("{"):
+                yield json.loads(line)
+                continue
+            timestamp, separator, text = line.partition(LOG_SEPARATOR)
+            finalized_at = None
+            if separator:
+                finalized_at = _parse_timestamp(timestamp, timestamp_format)
+            if finalized_at is None:
+                # Plain text, one final per line
+                yield {"text": line}
+            elif not TRANSLATION_LINE.match(text):
+                yield {"text": text, "finalized_at": finalized_at}
+
+
+def read_transcript(
+    path: str | Path, timestamp_format: str = "%Y-%m-%d %H:%M:%S", skip: int = 0
+) -> Iterator[BulkUtterance]:
+    """Yield the finals of a transcript store, text log, JSON lines or text file.
+
+    Args:
+        skip (int): Finals already processed by an earlier run.
+    """
+    path = Path(path)
+    if path.suffix in (".sqlite3", ".sqlite", ".db"):
+        records = _read_store(path)
+    else:
+        records = _read_lines(path, timestamp_format)
+    for index, record in enumerate(itertools.islice(records, skip, None), skip):
+        if record.get("text"):
+            yield BulkUtterance(
+                index, **{k: record[k] for k in INPUT_FIELDS if k in record}
+            )
+
+
+#  SECTION:=============================================================
+#            Functions, output
+#  =====================================================================
+
+
+def wav_duration(wav: bytes) -> float:
+    with wave.open(io.BytesIO(wav), "rb") as wave_read:
+        return wave_read.getnframes() / wave_read.getframerate()
+
+
+def load_checkpoint(path: Path) -> list[BulkUtterance]:
+    """Read the complete lines of transcript.jsonl and drop a torn last one."""
+    if not path.exists():
+        return []
+    done = []
+    kept = 0
+    with path.open("rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done.append(BulkUtterance(**json.loads(line)))
+            except (ValueError, TypeError):
+                break
+            kept += len(line)
+    with path.open("r+b") as f:
+        f.truncate(kept)
+    return done
+
+
+def _json_line(utterance: BulkUtterance) -> str:
+    return json.dumps(asdict(utterance), ensure_ascii=False) + "\n"
+
+
+def rewrite_checkpoint(path: Path, done: list[BulkUtterance]) -> None:
+    """Replace transcript.jsonl with done, at once."""
+    temporary = path.with_name(f"{path.name}.tmp")
+    with temporary.open("w", encoding="utf-8") as f:
+        f.writelines(_json_line(utterance) for utterance in done)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def write_track(outdir: Path, done: list[BulkUtterance], gap: float) -> None:
+    """Join the clips into track.wav and time the subtitles on it."""
+    track = None
+    position = 0.0
+    cues = []
+    try:
+        for utterance in done:
+            if utterance.audio is None:
+                continue
+            with wave.open(str(outdir / utterance.audio), "rb") as clip:
+                params = clip.getparams()
+                frames = clip.readframes(clip.getnframes())
+            if track is None:
+                track = wave.open(str(outdir / TRACK_NAME), "wb")
+                track.setparams(params)
+                silence = b"\x00" * (
+                    int(gap * params.framerate) * params.sampwidth * params.nchannels
+                )
+            elif params[:3] != track.getparams()[:3]:
+                raise ValueError(
+                    f"{utterance.audio} has another format than the first clip"
+                )
+            track.writeframes(frames)
+            length = params.nframes / params.framerate
+            cues.append(
+                (position, position + length, utterance.translation or utterance.text)
+            )
+            position += length
+            track.writeframes(silence)
+            position += gap
+    finally:
+        if track is not None:
+            track.close()
+    write_subtitles(outdir / SUBTITLES_NAME, cues)
+
+
+def _srt_time(seconds: float) -> str:
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+
+
+def write_subtitles(path: Path, cues: list[tuple[float, float, str]]) -> None:
+    with path.open("w", encoding="utf-8") as f:
+        for number, (start, end, text) in enumerate(cues, 1):
+            f.write(f"{number}\n{_srt_time(start)} --> {_srt_time(end)}\n{text}\n\n")
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class EnginePool:
+    """Spreads syntheses over VOICEVOX engines, the least busy first."""
+
+    def __init__(self, players: list["VoicevoxAudioPlayer"], concurrency: int):
+        self.players = players
+        self._slots = [asyncio.Semaphore(concurrency) for _ in players]
+        self._busy = [0] * len(players)
+
+    async def synthesize(self, text: str, voice: "VoiceConfig") -> bytes | None:
+        index = min(range(len(self.players)), key=self._busy.__getitem__)
+        self._busy[index] += 1
+        try:
+            async with self._slots[index]:
+                return await self.players[index].synthesize(text, voice)
+        finally:
+            self._busy[index] -= 1
+
+
+class BulkProcessor:
+    """Translates and synthesizes finals, each text once, and writes the clips."""
+
+    def __init__(
+        self,
+        outdir: Path,
+        translator: "Translator | None",
+        engines: EnginePool | None,
+        voice: "VoiceConfig | None",
+        translate_concurrency: int = 4,
+        retries: int = 2,
+    ):
+        self.outdir = outdir
+        self.translator = translator
+        self.engines = engines
+        self.voice = voice
+        self.retries = retries
+        self._translate_slots = asyncio.Semaphore(translate_concurrency)
+        # Text -> translation or clip, done or in flight
+        self._translations: dict[str, asyncio.Future] = {}
+        self._clips: dict[str, asyncio.Future] = {}
+        (outdir / CLIPS_DIR).mkdir(parents=True, exist_ok=True)
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    @staticmethod
+    def _done(value) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        return future
+
+    async def _retry(self, call, *args):
+        for attempt in range(self.retries + 1):
+            result = await call(*args)
+            if result is not None:
+                return result
+            if attempt < self.retries:
+                await asyncio.sleep(RETRY_DELAY * 2**attempt)
+        return None
+
+    async def _translate(self, text: str) -> str | None:
+        async with self._translate_slots:
+            return await self.translator.call_api(text)
+
+    async def _synthesize_clip(self, text: str) -> tuple[bytes, float] | None:
+        """Return a WAV of text and its duration, or None if it is not usable."""
+        try:
+            wav = await self.engines.synthesize(text, self.voice)
+            if wav is None:
+                return None
+            return wav, wav_duration(wav)
+        except Exception as e:
+            # An engine error body or a failed post-processing, retried
+            logger.error(f"Synthesis of {text!r} failed: {e!r}")
+            return None
+
+    async def _synthesize(self, utterance: BulkUtterance) -> tuple[str, float] | None:
+        clip = await self._retry(self._synthesize_clip, utterance.text)
+        if clip is None:
+            return None
+        wav, duration = clip
+        audio = f"{CLIPS_DIR}/{utterance.index:06d}.wav"
+        await asyncio.to_thread((self.outdir / audio).write_bytes, wav)
+        return audio, duration
+
+    def _shared(self, cache: dict, text: str, make) -> asyncio.Future:
+        """Return the future of text in cache, starting make() on a miss."""
+        future = cache.get(text)
+        if future is None:
+            future = cache[text] = asyncio.ensure_future(make())
+        return future
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    def remember(self, utterance: BulkUtterance) -> None:
+        """Reuse what an earlier run made of the text of utterance."""
+        if utterance.translation is not None:
+            self._translations[utterance.text] = self._done(utterance.translation)
+        if utterance.audio is not None and (self.outdir / utterance.audio).exists():
+            self._clips[utterance.text] = self._done(
+                (utterance.audio, utterance.duration)
+            )
+
+    async def process(self, utterance: BulkUtterance) -> BulkUtterance:
+        text = utterance.text
+        steps = []
+        if self.translator is not None:
+            steps.append(
+                self._shared(
+                    self._translations,
+                    text,
+                    lambda: self._retry(self._translate, text),
+                )
+            )
+        if self.engines is not None:
+            steps.append(
+                self._shared(self._clips, text, lambda: self._synthesize(utterance))
+            )
+        results = await asyncio.gather(*(asyncio.shield(s) for s in steps))
+        errors = []
+        if self.translator is not None:
+            utterance.translation = results.pop(0)
+            utterance.translation_language = self.translator.target_lang
+            if utterance.translation is None:
+                self._translations.pop(text, None)
+                errors.append("translation failed")
+        if self.engines is not None:
+            clip = results.pop(0)
+            if clip is None:
+                self._clips.pop(text, None)
+                errors.append("synthesis failed")
+            else:
+                utterance.audio, utterance.duration = clip
+        utterance.error = ", ".join(errors) or None
+        return utterance
+
+    async def run(
+        self,
+        utterances: Iterable[BulkUtterance],
+        write: Callable[[BulkUtterance], None],
+        window: int,
+    ) -> tuple[int, int]:
+        """Process utterances, at most window at once, writing them in order.
+
+        Returns:
+            tuple: (processed, failed)
+        """
+        in_flight: deque[asyncio.Task] = deque()
+        processed = failed = 0
+        started = time.perf_counter()
+
+        async def write_next() -> None:
+            nonlocal processed, failed
+            utterance = await in_flight.popleft()
+            write(utterance)
+            processed += 1
+            failed += utterance.error is not None
+            if processed % PROGRESS_EVERY == 0:
+                rate = processed / (time.perf_counter() - started)
+                logger.info(f"{processed} finals, {rate:.1f} per second")
+
+        try:
+            for utterance in utterances:
+                in_flight.append(asyncio.create_task(self.process(utterance)))
+                while in_flight and (in_flight[0].done() or len(in_flight) >= window):
+                    await write_next()
+            while in_flight:
+                await write_next()
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        return processed, failed
+
+
+#  SECTION:=============================================================
+#            Functions, main
+#  =====================================================================
+
+
+def _build_translator(
+    config: AppConfig, client: "httpx.AsyncClient", target: str | None
+) -> "Translator":
+    from app.api.translator import Translator
+
+    translation = config.translation
+    return Translator(
+        source_lang=translation.source_language,
+        target_lang=target or translation.target_language,
+        api_type=translation.api_type,
+        api_url=translation.api_url,
+        client=client,
+    )
+
+
+def _build_engines(
+    config: AppConfig, client: "httpx.AsyncClient", args: argparse.Namespace
+) -> EnginePool:
+    from app.api.voicevox_engine_util import VoicevoxAudioPlayer
+
+    post = None
+    loudness = config.voicevox.loudness
+    if loudness.enable:
+        from app.api.audio_post import AudioPostProcessor
+
+        try:
+            post = AudioPostProcessor(
+                normalize=loudness.normalize,
+                target_dbfs=loudness.target_dbfs,
+                output_sample_rate=loudness.output_sample_rate,
+            )
+        except ImportError as e:
+            logger.warning(f"{e}, the volume is applied by VOICEVOX")
+    server = config.voicevox.server
+    engines = args.engine or [f"{server.host}:{server.port}"]
+    voice = _voice(config, args.voice)
+    players = []
+    for engine in engines:
+        host, _, port = engine.rpartition(":")
+        players.append(
+            VoicevoxAudioPlayer(
+                speaker=voice.speaker,
+                speed=voice.speed,
+                pitch=voice.pitch,
+                intonation=voice.intonation,
+                volume=voice.volume,
+                host=host,
+                port=int(port),
+                client=client,
+                post=post,
+            )
+        )
+    return EnginePool(players, args.synth_concurrency)
+
+
+def _voice(config: AppConfig, name: str | None) -> "VoiceConfig":
+    from app.api.voicevox_engine_util import VoiceConfig
+
+    voice = getattr(config.voicevox, name or config.voicevox.default_voice)
+    return VoiceConfig(**voice.model_dump())
+
+
+def _check_manifest(outdir: Path, manifest: dict, restart: bool) -> None:
+    """Refuse to resume the output of another input or other options."""
+    path = outdir / MANIFEST_NAME
+    if restart:
+        (outdir / TRANSCRIPT_NAME).unlink(missing_ok=True)
+    elif path.exists():
+        previous = json.loads(path.read_text(encoding="utf-8"))
+        if previous != manifest:
+            raise SystemExit(
+                f"{outdir} holds a run with other input or options, "
+                "add --restart to overwrite it"
+            )
+    path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+
+async def run_bulk(args: argparse.Namespace) -> int:
+    import httpx
+
+    config = load_config(args.config)
+    outdir: Path = args.output
+    outdir.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "input": str(args.input.resolve()),
+        "translate": args.translate,
+        "target_language": args.target_language,
+        "tts": args.tts,
+        "voice": args.voice,
+    }
+    _check_manifest(outdir, manifest, args.restart)
+    done = load_checkpoint(outdir / TRANSCRIPT_NAME)
+    if done:
+        logger.info(f"Resuming after {len(done)} finals")
+
+    # One connection per request that can be in flight
+    connections = args.translate_concurrency
+    if args.tts:
+        connections += len(args.engine or [None]) * args.synth_concurrency
+    limits = httpx.Limits(
+        max_connections=connections, max_keepalive_connections=connections
+    )
+    async with httpx.AsyncClient(
+        limits=limits, timeout=args.timeout, follow_redirects=True
+    ) as client:
+        translator = None
+        if args.translate:
+            translator = _build_translator(config, client, args.target_language)
+        processor = BulkProcessor(
+            outdir,
+            translator,
+            _build_engines(config, client, args) if args.tts else None,
+            _voice(config, args.voice) if args.tts else None,
+            translate_concurrency=args.translate_concurrency,
+            retries=args.retries,
+        )
+        for utterance in done:
+            processor.remember(utterance)
+        window = args.window or 4 * connections
+        started = time.perf_counter()
+        # Finals that failed in an earlier run are tried again, in place
+        retry = [utterance for utterance in done if utterance.error is not None]
+        processed = failed = 0
+        if retry:
+            logger.info(f"Retrying {len(retry)} finals that failed before")
+            processed, failed = await processor.run(retry, lambda _: None, window)
+            await asyncio.to_thread(rewrite_checkpoint, outdir / TRANSCRIPT_NAME, done)
+        utterances = read_transcript(
+            args.input, config.logging.timestamp_format, skip=_input_count(done)
+        )
+        with (outdir / TRANSCRIPT_NAME).open("a", encoding="utf-8") as transcript:
+
+            def write(utterance: BulkUtterance) -> None:
+                transcript.write(_json_line(utterance))
+                transcript.flush()
+
+            new, new_failed = await processor.run(utterances, write, window)
+        processed += new
+        failed += new_failed
+        elapsed = time.perf_counter() - started
+
+    if args.tts and args.track:
+        # The clips stay: they are what a later run resumes from
+        done = load_checkpoint(outdir / TRANSCRIPT_NAME)
+        await asyncio.to_thread(write_track, outdir, done, args.gap)
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(
+        f"{processed} finals in {elapsed:.1f} s ({rate:.1f} per second), "
+        f"{failed} failed, written to {outdir}"
+    )
+    return 1 if failed else 0
+
+
+def _input_count(done: list[BulkUtterance]) -> int:
+    """Return the input records already read: the index after the last one."""
+    return done[-1].index + 1 if done else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", type=Path, help="transcript store, log or text")
+    parser.add_argument("--output", type=Path, required=True, help="directory")
+    parser.add_argument("--config", type=Path, default=TOML_PATH)
+    parser.add_argument("--no-translate", dest="translate", action="store_false")
+    parser.add_argument("--target-language", help="defaults to [translation]")
+    parser.add_argument("--no-tts", dest="tts", action="store_false")
+    parser.add_argument("--voice", choices=VOICE_NAMES)
+    parser.add_argument(
+        "--engine",
+        action="append",
+        help="VOICEVOX host:port, repeat for a pool; defaults to [voicevox.server]",
+    )
+    parser.add_argument(
+        "--track", action="store_true", help="also join the clips into track.wav"
+    )
+    parser.add_argument("--gap", type=float, default=0.3, help="seconds in track.wav")
+    parser.add_argument("--translate-concurrency", type=int, default=4)
+    parser.add_argument("--synth-concurrency", type=int, default=2, help="per engine")
+    parser.add_argument("--window", type=int, help="finals in flight")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=60.0, help="per request")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    try:
+        return asyncio.run(run_bulk(args))
+    except KeyboardInterrupt:
+        print(f"Interrupted, run again without --restart to resume {args.output}")
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
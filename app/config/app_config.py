@@ -1,15 +1,24 @@
+import os
 from datetime import datetime
 from pathlib import Path
+from typing import Literal
 
 import tomllib
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel, Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 #  SECTION:=============================================================
 #            Constants
 #  =====================================================================
 
-TOML_PATH = "app/config/app_config.toml"
+# Resolved from this file, so the app starts from any working directory.
+# APP_CONFIG_PATH points the app at another config file, e.g. for benchmarks
+TOML_PATH = Path(
+    os.environ.get("APP_CONFIG_PATH") or Path(__file__).with_name("app_config.toml")
+)
+SECRETS_DIR = Path(__file__).resolve().parents[2] / "secrets"
+# Voices of [voicevox] a recognizer can choose
+VOICE_NAMES = ("male_voice", "female_voice")
 
 #  SECTION:=============================================================
 #            Basic configs
@@ -21,6 +30,9 @@ class EndpointConfig(BaseModel):
     speech_recognition_ws: str
     obs_speech_overlay: str
     obs_speech_overlay_ws: str
+    transcript: str
+    metrics: str
+    admin: str
 
 
 class HtmlConfig(BaseModel):
@@ -34,17 +46,88 @@ class HeartbeatConfig(BaseModel):
     timeout: int
 
 
+class RecentLinesConfig(BaseModel):
+    size: int
+
+
 #  SECTION:=============================================================
 #            Additinal features
 #  =====================================================================
 
 
+class NgFilterConfig(BaseModel):
+    enable: bool
+    filepath: str
+    mask: str
+
+    @model_validator(mode="after")
+    def resolve_filepath(cls, model):
+        # Relative to this directory, wherever the app and config are
+        model.filepath = str(Path(__file__).parent / model.filepath)
+        return model
+
+
 class LoggingConfig(BaseModel):
     enable: bool
     filepath: str
     timestamp_format: str
     final_text_enable: bool
     translation_enable: bool
+    queue_size: int
+    batch_size: int
+    max_bytes: int
+    backup_count: int
+
+    @model_validator(mode="after")
+    def expand_filepath(cls, model):
+        # Expand date format if present in filepath
+        model.filepath = datetime.now().strftime(model.filepath)
+        return model
+
+
+class DiagnosticsConfig(BaseModel):
+    enable: bool
+    lag_interval: float
+    slow_threshold: float
+    max_profile_seconds: float
+
+
+class TranscriptStoreConfig(BaseModel):
+    enable: bool
+    filepath: str
+
+
+class TtsWorkerConfig(BaseModel):
+    enable: bool
+    job_timeout: float
+    ready_timeout: float
+
+
+class TtsSchedulerConfig(BaseModel):
+    enable: bool
+    max_lag: float = Field(gt=0)
+    max_speed: float
+    chars_per_second: float = Field(gt=0)
+
+
+class ObsWebSocketConfig(BaseModel):
+    enable: bool
+    host: str
+    port: int
+    original_source: str
+    translated_source: str
+    coalesce_ms: float
+
+
+class HotReloadConfig(BaseModel):
+    enable: bool
+    debounce_ms: int
+
+
+class TracingConfig(BaseModel):
+    enable: bool
+    filepath: str
+    sample_rate: float
 
     @model_validator(mode="after")
     def expand_filepath(cls, model):
@@ -83,25 +166,48 @@ class VoicevoxServerConfig(BaseModel):
     port: int
 
 
+class VoicevoxLoudnessConfig(BaseModel):
+    enable: bool
+    normalize: Literal["off", "peak", "rms"]
+    target_dbfs: float
+    output_sample_rate: int
+
+
 class VoicevoxConfig(BaseModel):
     enable: bool
+    default_voice: Literal["male_voice", "female_voice"]
+    mixer: bool
+    mixer_sample_rate: int
+    cache_size: int
     server: VoicevoxServerConfig
     male_voice: VoicevoxMaleVoiceConfig
     female_voice: VoicevoxFemaleVoiceConfig
+    loudness: VoicevoxLoudnessConfig
 
 
 class AppConfig(BaseSettings):
     # secret values
     gas_id: str
+    # Empty when the OBS WebSocket server has authentication off
+    obs_websocket_password: str = ""
 
     endpoints: EndpointConfig
     htmls: HtmlConfig
     heartbeat: HeartbeatConfig
+    recent_lines: RecentLinesConfig
     logging: LoggingConfig
+    transcript_store: TranscriptStoreConfig
     translation: TranslationConfig
     voicevox: VoicevoxConfig
+    diagnostics: DiagnosticsConfig
+    tracing: TracingConfig
+    hot_reload: HotReloadConfig
+    tts_worker: TtsWorkerConfig
+    tts_scheduler: TtsSchedulerConfig
+    ng_filter: NgFilterConfig
+    obs_websocket: ObsWebSocketConfig
 
-    model_config = SettingsConfigDict(secrets_dir="secrets")
+    model_config = SettingsConfigDict(secrets_dir=SECRETS_DIR)
 
     @model_validator(mode="after")
     def substitute_placeholders(self):
@@ -124,11 +230,38 @@ def load_config(path: str | Path = TOML_PATH) -> AppConfig:
     return AppConfig(**toml_dict)
 
 
-# Global config instance
-app_config = load_config()
+_app_config: AppConfig | None = None
+
+
+def get_app_config() -> AppConfig:
+    """Return the current app config, loading it on the first call.
+
+    Read it where the value is used rather than keeping it, so a config
+    reloaded by app.config.reloader takes effect.
+    """
+    global _app_config
+    if _app_config is None:
+        _app_config = load_config()
+    return _app_config
+
+
+def set_app_config(config: AppConfig) -> None:
+    """Replace the current app config with an already validated one."""
+    global _app_config
+    _app_config = config
+
+
+def __getattr__(name: str):
+    # Global config instance, loaded on first access instead of at import.
+    # Importing it binds the config of that moment; use get_app_config()
+    # for values that follow reloads.
+    if name == "app_config":
+        return get_app_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def main():
+    app_config = get_app_config()
     print(app_config.heartbeat.interval)
     print(app_config.voicevox.female_voice)
     print(app_config.translation.api_url)
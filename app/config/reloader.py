@@ -0,0 +1,191 @@
+"""Reload app_config.toml while the app is running.
+
+ConfigReloader watches the config file with watchfiles. On a change the file
+is parsed and validated into a new AppConfig off the event loop; an invalid
+file is logged and the running config is kept. Changes are detected on the
+parsed TOML, so date patterns expanded at load time do not count as changes.
+A valid config replaces the current one in one assignment and is handed to
+SharedServices.apply_config, which rebuilds only the components whose
+section changed. The NG word list of [ng_filter] is watched as well, and
+the filter is compiled again when it is saved. WebSocket connections stay
+open throughout.
+
+Endpoints and the sections read once at startup (logging, transcript store,
+diagnostics, tracing, tts_worker, obs_websocket) take effect on the next
+restart; a change to them is logged and the running values are kept until then.
+
+Examples:
+
+  reloader = ConfigReloader(services)
+  await reloader.start()
+  ...
+  await reloader.stop()
+"""
+
+import asyncio
+import logging
+import tomllib
+from contextlib import aclosing
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from pydantic import ValidationError
+
+from app.config.app_config import TOML_PATH, AppConfig, get_app_config, set_app_config
+
+if TYPE_CHECKING:
+    from app.services import SharedServices
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# Sections that are only read at startup
+RESTART_SECTIONS = (
+    "endpoints",
+    "logging",
+    "transcript_store",
+    "diagnostics",
+    "tracing",
+    "hot_reload",
+    "tts_worker",
+    "obs_websocket",
+)
+
+#  SECTION:=============================================================
+#            Functions
+#  =====================================================================
+
+
+def read_toml(path: Path) -> dict:
+    with path.open("rb") as f:
+        return tomllib.load(f)
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class ConfigReloader:
+    """Watches the config file and applies valid changes to the services."""
+
+    def __init__(
+        self,
+        services: "SharedServices",
+        path: str | Path = TOML_PATH,
+        debounce_ms: int = 300,
+    ):
+        self.services = services
+        self.path = Path(path).resolve()
+        self.debounce_ms = debounce_ms
+        self.reloads = 0
+        self.failures = 0
+        self._toml: dict = {}
+        self._task: asyncio.Task | None = None
+        self._stop_event = asyncio.Event()
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    @staticmethod
+    def _word_list() -> Path | None:
+        """The NG word list in use, None when the filter is off."""
+        ng_filter = get_app_config().ng_filter
+        return Path(ng_filter.filepath).resolve() if ng_filter.enable else None
+
+    async def _watch(self) -> None:
+        from watchfiles import awatch
+
+        while not self._stop_event.is_set():
+            word_list = self._word_list()
+            watched = {self.path, word_list} - {None}
+            # Watch the directories: editors often replace the file on save
+            changes = awatch(
+                *{path.parent for path in watched if path.parent.is_dir()},
+                watch_filter=lambda _, changed: Path(changed) in watched,
+                debounce=self.debounce_ms,
+                stop_event=self._stop_event,
+            )
+            async with aclosing(changes):
+                async for batch in changes:
+                    await self._apply({Path(path) for _, path in batch}, word_list)
+                    # A reload turned the filter on or off or pointed it to
+                    # another file: watch that one instead
+                    if self._word_list() != word_list:
+                        break
+
+    async def _apply(self, changed: set[Path], word_list: Path | None) -> None:
+        try:
+            if self.path in changed:
+                await self.reload()
+            if word_list in changed:
+                await self.services.reload_ng_words()
+                logger.info(f"NG word list {word_list} reloaded")
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Applying the reloaded config failed: {e}", exc_info=True)
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    async def reload(self) -> bool:
+        """Load, validate and apply the config file. Returns True if applied."""
+        try:
+            toml_dict = await asyncio.to_thread(read_toml, self.path)
+            new = AppConfig(**toml_dict)
+        except (OSError, tomllib.TOMLDecodeError, ValidationError, ValueError) as e:
+            self.failures += 1
+            logger.error(f"Config {self.path} is invalid, keeping the current: {e}")
+            return False
+
+        keys = toml_dict.keys() | self._toml.keys()
+        changed = sorted(
+            key for key in keys if toml_dict.get(key) != self._toml.get(key)
+        )
+        self._toml = toml_dict
+        if not changed:
+            return False
+        restart = [name for name in changed if name in RESTART_SECTIONS]
+        if restart:
+            logger.warning(f"Config sections need a restart to apply: {restart}")
+
+        # Keep what is running for the sections that apply on restart
+        old = get_app_config()
+        new = new.model_copy(
+            update={name: getattr(old, name) for name in RESTART_SECTIONS}
+        )
+        set_app_config(new)
+        await self.services.apply_config(new)
+        self.reloads += 1
+        logger.info(f"Config reloaded, changed sections: {changed}")
+        return True
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._toml = await asyncio.to_thread(read_toml, self.path)
+        self._stop_event.clear()
+        self._task = asyncio.create_task(self._watch(), name="config-reloader")
+        logger.info(f"Watching {self.path} for changes")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        # Let awatch return on its own: cancelling it leaves the watcher
+        # thread blocked, which can crash the interpreter at exit
+        self._stop_event.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=5.0)
+        except asyncio.TimeoutError:
+            logger.warning("Config watcher did not stop in time")
+        self._task = None
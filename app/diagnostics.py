@@ -0,0 +1,392 @@
+"""Event loop lag monitor, slow callback detector and on-demand profiler.
+
+LoopMonitor runs a sampler task that sleeps for a fixed interval and records
+how late it woke up as the loop lag. A watchdog thread checks that the sampler
+keeps beating; when the loop has been stuck for longer than the threshold it
+captures the stack of the loop thread and the task that was running, while
+the blocking code is still on the stack. Idle cost is one wakeup per interval
+on each side.
+
+Profiler runs cProfile on the loop thread for a bounded time and keeps the
+result in memory for download, in pstats format or as text.
+
+RuntimeInspector counts the live asyncio tasks by coroutine, the gc objects
+and the resident memory, and, when the app runs with PYTHONTRACEMALLOC set,
+the traced memory and the allocation sites that grew since a baseline. Long
+runs compare it over time to find leaked tasks and memory.
+
+Examples:
+
+  monitor = LoopMonitor(interval=0.25, slow_threshold=0.1)
+  await monitor.start()
+  monitor.snapshot()
+  await monitor.stop()
+
+  profiler = Profiler()
+  profiler.start(seconds=10)
+  ...
+  profiler.result_text()
+
+  inspector = RuntimeInspector()
+  inspector.set_baseline()
+  inspector.tasks(), inspector.memory(top=10)
+"""
+
+import asyncio
+import cProfile
+import gc
+import io
+import os
+import logging
+import marshal
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter, deque
+from dataclasses import asdict, dataclass
+
+from app import metrics
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# Frames of the blocked stack kept per slow callback
+STACK_LIMIT = 15
+# Allocations of the tracer itself and of imports are not leaks
+TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+LOOP_LAG = metrics.REGISTRY.register(
+    metrics.Histogram(
+        "speech_bridge_event_loop_lag_seconds",
+        "How late the event loop sampler woke up.",
+    )
+)
+SLOW_CALLBACKS = metrics.REGISTRY.register(
+    metrics.Counter(
+        "speech_bridge_slow_callbacks_total",
+        "Times the event loop was blocked longer than the threshold.",
+    )
+)
+
+#  SECTION:=============================================================
+#            Functions
+#  =====================================================================
+
+
+def resident_bytes() -> int | None:
+    """Return the resident set size of this process, None where unknown."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+#  SECTION:=============================================================
+#            Class, loop monitor
+#  =====================================================================
+
+
+@dataclass
+class SlowCallback:
+    """The loop was blocked; where it was when the watchdog looked."""
+
+    detected_at: float
+    blocked_for: float
+    task: str | None
+    coroutine: str | None
+    stack: list[str]
+
+
+class LoopMonitor:
+    """Samples event loop lag and records what blocked the loop."""
+
+    def __init__(
+        self, interval: float = 0.25, slow_threshold: float = 0.1, history: int = 50
+    ):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.slow_callbacks: deque[SlowCallback] = deque(maxlen=history)
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._sampler: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopping = threading.Event()
+        self._beat = time.monotonic()
+        self._reported_beat = 0.0
+        self._current: SlowCallback | None = None
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    async def _sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self._beat = time.monotonic()
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG.observe(lag)
+            if self._current is not None:
+                # The blocking call has returned; now its duration is known
+                self._current.blocked_for = lag
+                logger.warning(
+                    f"Event loop was blocked for {lag * 1000:.0f} ms in "
+                    f"{self._current.coroutine or self._current.task}"
+                )
+                self._current = None
+
+    def _watch(self) -> None:
+        while not self._stopping.wait(self.interval):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.slow_threshold or beat == self._reported_beat:
+                continue
+            self._reported_beat = beat
+            self._current = self._capture(stalled)
+            self.slow_callbacks.append(self._current)
+            SLOW_CALLBACKS.inc()
+
+    def _capture(self, stalled: float) -> SlowCallback:
+        """Capture the loop thread's stack and current task from this thread."""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame, limit=STACK_LIMIT) if frame else []
+        task = asyncio.current_task(self._loop)
+        coroutine = None
+        if task is not None:
+            coro = task.get_coro()
+            coroutine = getattr(coro, "__qualname__", repr(coro))
+        return SlowCallback(
+            detected_at=time.time(),
+            blocked_for=stalled,
+            task=task.get_name() if task is not None else None,
+            coroutine=coroutine,
+            stack=[line.rstrip() for line in stack],
+        )
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    async def start(self) -> None:
+        """Start sampling the running loop."""
+        if self._sampler is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopping.clear()
+        self._sampler = asyncio.create_task(self._sample(), name="loop-monitor")
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._sampler is None:
+            return
+        self._stopping.set()
+        self._sampler.cancel()
+        await asyncio.gather(self._sampler, return_exceptions=True)
+        await asyncio.to_thread(self._watchdog.join)
+        self._sampler = None
+        self._watchdog = None
+
+    def snapshot(self) -> dict:
+        """Return lag statistics and the recent slow callbacks."""
+        return {
+            "interval_s": self.interval,
+            "slow_threshold_s": self.slow_threshold,
+            "last_lag_s": self.last_lag,
+            "max_lag_s": self.max_lag,
+            "slow_callbacks": [asdict(event) for event in self.slow_callbacks],
+        }
+
+
+#  SECTION:=============================================================
+#            Class, profiler
+#  =====================================================================
+
+
+class Profiler:
+    """Time-bounded cProfile run of the event loop thread.
+
+    start() and stop() must be called on the loop thread, which is the
+    thread cProfile records.
+    """
+
+    def __init__(self, max_seconds: float = 300.0):
+        self.max_seconds = max_seconds
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self._profile: cProfile.Profile | None = None
+        self._timer: asyncio.TimerHandle | None = None
+        self._stats: dict | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def start(self, seconds: float) -> float:
+        """Start profiling for at most seconds. Returns the granted duration."""
+        if self.running:
+            raise RuntimeError("Profiler is already running")
+        seconds = min(max(seconds, 0.1), self.max_seconds)
+        self._stats = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        self._timer = asyncio.get_running_loop().call_later(seconds, self.stop)
+        logger.info(f"Profiler started for {seconds} s")
+        return seconds
+
+    def stop(self) -> bool:
+        """Stop profiling and keep the result. Returns False if not running."""
+        if self._profile is None:
+            return False
+        self._profile.disable()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._profile.create_stats()
+        self._stats = self._profile.stats
+        self._profile = None
+        self.finished_at = time.time()
+        logger.info("Profiler stopped")
+        return True
+
+    def has_result(self) -> bool:
+        return self._stats is not None
+
+    def result_pstats(self) -> bytes:
+        """Return the result in the format written by Profile.dump_stats()."""
+        return marshal.dumps(self._stats)
+
+    def result_text(self, limit: int = 60) -> str:
+        """Return the top functions by cumulative time."""
+        stream = io.StringIO()
+        stats = pstats.Stats(_LoadedStats(self._stats), stream=stream)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "has_result": self.has_result(),
+        }
+
+
+class _LoadedStats:
+    """Adapter so pstats.Stats can read stats kept in memory."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+#  SECTION:=============================================================
+#            Class, runtime inspector
+#  =====================================================================
+
+
+class RuntimeInspector:
+    """Task counts and memory of the app, compared against a baseline.
+
+    tasks() must be called on the loop thread. memory() takes a tracemalloc
+    snapshot, which can take a while on a large heap, and is meant to run in
+    a worker thread. tracemalloc is not started here: started late, it would
+    miss what was allocated before.
+    """
+
+    def __init__(self):
+        self.baseline_at: float | None = None
+        self._baseline: tracemalloc.Snapshot | None = None
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_FILTERS)
+
+    def set_baseline(self) -> bool:
+        """Keep the current traced memory to compare against. False if off."""
+        if not tracemalloc.is_tracing():
+            return False
+        gc.collect()
+        self._baseline = self._take_snapshot()
+        self.baseline_at = time.time()
+        return True
+
+    def tasks(self, top: int = 10) -> dict:
+        by_coroutine = Counter(
+            getattr(task.get_coro(), "__qualname__", "?")
+            for task in asyncio.all_tasks()
+        )
+        return {
+            "count": sum(by_coroutine.values()),
+            "top": [
+                {"coroutine": name, "count": count}
+                for name, count in by_coroutine.most_common(top)
+            ],
+        }
+
+    def memory(self, top: int = 10, collect: bool = False) -> dict:
+        """Return process memory and the sites that grew since the baseline.
+
+        Args:
+            collect (bool): Run a full garbage collection first, so objects
+                only kept by reference cycles are not counted.
+        """
+        result = {
+            "gc_collected": gc.collect() if collect else None,
+            "rss_bytes": resident_bytes(),
+            "gc_objects": len(gc.get_objects()),
+            "tracing": tracemalloc.is_tracing(),
+        }
+        if not result["tracing"]:
+            return result
+        current, peak = tracemalloc.get_traced_memory()
+        result.update(traced_bytes=current, traced_peak_bytes=peak)
+        if top <= 0:
+            return result
+        snapshot = self._take_snapshot()
+        if self._baseline is None:
+            stats = snapshot.statistics("lineno")
+        else:
+            stats = snapshot.compare_to(self._baseline, "lineno")
+            result["baseline_at"] = self.baseline_at
+        result["top"] = [
+            {
+                "site": str(stat.traceback),
+                "size_bytes": stat.size,
+                "size_diff_bytes": getattr(stat, "size_diff", None),
+                "count": stat.count,
+                "count_diff": getattr(stat, "count_diff", None),
+            }
+            for stat in stats[:top]
+        ]
+        return result
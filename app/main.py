@@ -4,26 +4,32 @@ Examples:
     python main.py
 """
 
-from pathlib import Path
-
-import uvicorn
+from contextlib import asynccontextmanager
 
 # from bot import Bot
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 
-from app.config.logging_config import LOGGING_CONFIG
 from app.routers import routers as fastapi_routers
+from app.services import SharedServices
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build and warm the shared services before serving, close them after."""
+    services = SharedServices()
+    await services.startup()
+    app.state.services = services
+    try:
+        yield
+    finally:
+        await services.shutdown()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 # bot = Bot()
 # set_bot(bot)
 app.include_router(fastapi_routers)
 
-# set static directory
-STATIC_DIR = Path(__file__).resolve().parent / "static"
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
-
 # Bot code
 # async def start_fastapi():
 #     config = uvicorn.Config(app, host="0.0.0.0", port=8000)
@@ -36,6 +42,11 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 
 if __name__ == "__main__":
+    # Only needed when run as a script; uvicorn imports this module itself
+    import uvicorn
+
+    from app.config.logging_config import LOGGING_CONFIG
+
     # asyncio.run(main())
     uvicorn.run(
         "main:app", port=8000, reload=True, log_config=LOGGING_CONFIG, log_level="info"
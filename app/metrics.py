@@ -0,0 +1,347 @@
+"""Prometheus metrics for the app, rendered in the text exposition format.
+
+Metrics are plain Python objects updated from the event loop: a counter is an
+int increment and a histogram observation is one bisect over preallocated
+bucket bounds plus two additions. There are no locks; the few updates made
+from other threads are single increments, which the GIL keeps whole. Gauges
+can read their value from a function at scrape time, so queue depths and
+connection counts cost nothing between scrapes.
+
+The metrics of the app are defined at the bottom of this module and served
+by the /metrics endpoint in routers.py.
+
+Examples:
+
+  from app import metrics
+
+  start = time.perf_counter()
+  ...
+  metrics.STAGE_LATENCY.labels("unpack").observe(time.perf_counter() - start)
+  metrics.MESSAGES_IN.labels("speech_recognition").inc()
+"""
+
+import bisect
+import math
+from typing import Callable, Iterable
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# Seconds, from sub-millisecond JSON work up to slow synthesis and playback
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#  SECTION:=============================================================
+#            Functions, helper
+#  =====================================================================
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+#  SECTION:=============================================================
+#            Class, metric values
+#  =====================================================================
+
+
+class CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int | float = 1) -> None:
+        self.value += amount
+
+
+class GaugeValue:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function: Callable[[], float] | None = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float] | None) -> None:
+        """Read the value from function at scrape time instead."""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception:
+                return math.nan
+        return self.value
+
+
+class HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bound plus +Inf, allocated once
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+#  SECTION:=============================================================
+#            Class, metric families
+#  =====================================================================
+
+
+class _Metric:
+    """A named metric with fixed label names and one value per label set."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._unlabelled = self._new_value()
+            self._values[()] = self._unlabelled
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Return the value for a label set, creating it on first use."""
+        value = self._values.get(values)
+        if value is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            value = self._values[values] = self._new_value()
+        return value
+
+    def _header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_value(self) -> CounterValue:
+        return CounterValue()
+
+    def inc(self, amount: int | float = 1) -> None:
+        self._unlabelled.inc(amount)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for values, value in list(self._values.items()):
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}{labels} {_format_value(value.value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_value(self) -> GaugeValue:
+        return GaugeValue()
+
+    def set(self, value: float) -> None:
+        self._unlabelled.set(value)
+
+    def inc(self, amount: float = 1) -> None:
+        self._unlabelled.inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._unlabelled.dec(amount)
+
+    def set_function(self, function: Callable[[], float] | None) -> None:
+        self._unlabelled.set_function(function)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for values, value in list(self._values.items()):
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}{labels} {_format_value(value.get())}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_value(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._unlabelled.observe(value)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for values, value in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), value.counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.labelnames + ("le",), values + (_format_value(bound),)
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(value.sum)}")
+            lines.append(f"{self.name}_count{labels} {value.count}")
+        return lines
+
+
+class Registry:
+    """Collects metrics and renders them for a scrape."""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+#  SECTION:=============================================================
+#            Metrics of the app
+#  =====================================================================
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.register(
+    Histogram(
+        "speech_bridge_stage_latency_seconds",
+        "Latency of each processing stage.",
+        ["stage"],
+    )
+)
+MESSAGES_IN = REGISTRY.register(
+    Counter(
+        "speech_bridge_messages_received_total",
+        "WebSocket messages received.",
+        ["endpoint"],
+    )
+)
+MESSAGES_OUT = REGISTRY.register(
+    Counter(
+        "speech_bridge_messages_sent_total",
+        "Messages sent to the overlay.",
+        ["type"],
+    )
+)
+DROPS = REGISTRY.register(
+    Counter(
+        "speech_bridge_dropped_total",
+        "Messages or records dropped.",
+        ["reason"],
+    )
+)
+ERRORS = REGISTRY.register(
+    Counter(
+        "speech_bridge_errors_total",
+        "Errors by component.",
+        ["component"],
+    )
+)
+ACTIVE_CONNECTIONS = REGISTRY.register(
+    Gauge(
+        "speech_bridge_active_connections",
+        "Open WebSocket connections.",
+        ["client"],
+    )
+)
+INFLIGHT_TASKS = REGISTRY.register(
+    Gauge(
+        "speech_bridge_inflight_tasks",
+        "Running asyncio tasks started for messages.",
+        ["scope"],
+    )
+)
+QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "speech_bridge_queue_depth",
+        "Items waiting in internal queues.",
+        ["queue"],
+    )
+)
+
+# Create every stage up front so all of them are exported from the first
+# scrape. Hot paths bind their label set once at import.
+for _stage in (
+    "unpack",
+    "obs_send",
+    "translation",
+    "voicevox_query",
+    "voicevox_synthesis",
+    "voicevox_playback",
+):
+    STAGE_LATENCY.labels(_stage)
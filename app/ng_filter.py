@@ -0,0 +1,219 @@
+"""Masks NG words in recognition text with an Aho-Corasick automaton.
+
+The word list is compiled once into an automaton, so a text is scanned in
+one pass whatever the number of terms, instead of one str.replace per term.
+Terms match anywhere in the text, which suits Japanese without spaces, and
+ASCII letters match in any case. Each term has its own replacement, by
+default the mask character repeated to the term's length. Overlapping
+matches are resolved leftmost-longest.
+
+Interims of an utterance mostly repeat the previous text and add to its
+end. A ScanCache keeps the automaton state after every character and the
+matches found so far, so the next interim only rescans from the first
+character that changed.
+
+Word list format, one term per line, an optional replacement after a tab:
+
+  # comment
+  ばか
+  darn<TAB>d**n
+
+Examples:
+
+  ng_filter = NgWordFilter.from_file("app/config/ng_words.txt")
+  cache = ng_filter.new_cache()
+  ng_filter.apply("ばかみたい", cache)  # "**みたい"
+"""
+
+import logging
+from array import array
+from pathlib import Path
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# Length-preserving case folding, so match positions are text positions
+ASCII_FOLD = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+#  SECTION:=============================================================
+#            Functions
+#  =====================================================================
+
+
+def load_terms(path: str | Path, mask: str = "*") -> dict[str, str]:
+    """Read a word list into {term: replacement}."""
+    terms = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            term, _, replacement = line.partition("\t")
+            term = term.strip()
+            if term:
+                terms[term] = replacement or mask * len(term)
+    return terms
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class ScanCache:
+    """Scan results of the previous text of one utterance."""
+
+    __slots__ = ("owner", "text", "states", "matches")
+
+    def __init__(self, owner: "NgWordFilter | None" = None):
+        self.reset(owner)
+
+    def reset(self, owner: "NgWordFilter | None") -> None:
+        # States are nodes of the owner's automaton
+        self.owner = owner
+        self.text = ""
+        # Automaton state after each character, states[0] before the first
+        self.states = array("i", [0])
+        # (start, end, term index), in the order of end
+        self.matches: list[tuple[int, int, int]] = []
+
+
+class NgWordFilter:
+    """Aho-Corasick automaton over the NG terms and their replacements."""
+
+    def __init__(self, terms: dict[str, str]):
+        self.terms: list[str] = []
+        self.replacements: list[str] = []
+        # Trie: child nodes by character, failure link, term ending here
+        # (-1 if none) and the nearest node on the failure chain with a term
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._term: list[int] = [-1]
+        self._output: list[int] = [0]
+        for term, replacement in terms.items():
+            self._add(term.translate(ASCII_FOLD), replacement)
+        self._link()
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @classmethod
+    def from_file(cls, path: str | Path, mask: str = "*") -> "NgWordFilter":
+        return cls(load_terms(path, mask))
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    def _add(self, term: str, replacement: str) -> None:
+        node = 0
+        for char in term:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][char] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._term.append(-1)
+                self._output.append(0)
+            node = child
+        if self._term[node] == -1:
+            self._term[node] = len(self.terms)
+            self.terms.append(term)
+            self.replacements.append(replacement)
+
+    def _link(self) -> None:
+        """Set the failure and output links, breadth first."""
+        goto, fail, term, output = self._goto, self._fail, self._term, self._output
+        queue = list(goto[0].values())
+        for node in queue:
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                target = goto[state].get(char, 0)
+                fail[child] = target if target != child else 0
+                target = fail[child]
+                output[child] = target if term[target] != -1 else output[target]
+                queue.append(child)
+
+    def _scan(self, text: str, start: int, cache: ScanCache) -> None:
+        """Scan text from start on, appending states and matches to cache."""
+        goto, fail, term, output = self._goto, self._fail, self._term, self._output
+        terms, states, matches = self.terms, cache.states, cache.matches
+        state = states[start]
+        folded = text.translate(ASCII_FOLD)
+        for end in range(start + 1, len(text) + 1):
+            char = folded[end - 1]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            states.append(state)
+            node = state if term[state] != -1 else output[state]
+            while node:
+                index = term[node]
+                matches.append((end - len(terms[index]), end, index))
+                node = output[node]
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    def new_cache(self) -> ScanCache:
+        return ScanCache(self)
+
+    def find(
+        self, text: str, cache: ScanCache | None = None
+    ) -> list[tuple[int, int, int]]:
+        """Return the (start, end, term index) of the matches to replace."""
+        if cache is None:
+            cache = self.new_cache()
+        elif cache.owner is not self:
+            # The filter was rebuilt by a reload since the last interim
+            cache.reset(self)
+        # Keep what was scanned of the unchanged prefix
+        previous = cache.text
+        kept = 0
+        limit = min(len(previous), len(text))
+        if text.startswith(previous):
+            kept = len(previous)
+        else:
+            while kept < limit and previous[kept] == text[kept]:
+                kept += 1
+        del cache.states[kept + 1 :]
+        matches = cache.matches
+        while matches and matches[-1][1] > kept:
+            matches.pop()
+        self._scan(text, kept, cache)
+        cache.text = text
+
+        # Leftmost-longest, without overlaps
+        selected = []
+        covered = 0
+        for start, end, index in sorted(matches, key=lambda m: (m[0], -m[1])):
+            if start >= covered:
+                selected.append((start, end, index))
+                covered = end
+        return selected
+
+    def apply(self, text: str, cache: ScanCache | None = None) -> str:
+        """Return text with every NG term replaced."""
+        matches = self.find(text, cache)
+        if not matches:
+            return text
+        parts = []
+        position = 0
+        for start, end, index in matches:
+            parts.append(text[position:start])
+            parts.append(self.replacements[index])
+            position = end
+        parts.append(text[position:])
+        return "".join(parts)
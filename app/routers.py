@@ -12,17 +12,23 @@ Usage example:
   app.include_router(router)
 """
 
-from pathlib import Path
-
-from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
 import asyncio
 import logging
+import time
+from typing import TYPE_CHECKING
 
+from app import metrics
+from app.assets import STATIC_URL
 from app.ws_connection.message_processor import WsMessageProcessor
 from app.ws_connection.connection_manager import WsConnectionManager
-from app.config.app_config import app_config
+from app.ws_connection.heartbeat import PONG_TEXT
+from app.config.app_config import VOICE_NAMES, app_config, get_app_config
+
+if TYPE_CHECKING:
+    from app.diagnostics import LoopMonitor, Profiler, RuntimeInspector
+    from app.transcript.store import TranscriptStore
 
 #  SECTION:=============================================================
 #            Logger
@@ -38,37 +44,19 @@ logger.addHandler(logging.NullHandler())
 # Main module imports this router
 routers = APIRouter()
 
-# set template directory
-TEMPLATE_DIR = Path(__file__).resolve().parent / "templates"
-templates = Jinja2Templates(directory=TEMPLATE_DIR)
-
 
 # Manage WebSocket connections with connection_manager
 connection_manager = WsConnectionManager()
 
-
-# SECTION:=============================================================
-#           Functions, websocket
-# =====================================================================
-
-
-async def heartbeat(
-    ws: WebSocket,
-    heartbeat_text=app_config.heartbeat.text,
-    interval: int = app_config.heartbeat.interval,
-):
-    """Send heartbeat"""
-    try:
-        while True:
-            await asyncio.sleep(interval)
-            await ws.send_text(heartbeat_text)
-            logger.debug("Sent a heartbeat")
-    except asyncio.CancelledError:
-        logger.info("Heartbeat task was cancelled")
-    except WebSocketDisconnect as e:
-        logger.error(f"WebSocket disconnected. Code:{e.code} Heartbeat failed.")
-    except Exception as e:
-        logger.error(f"Heartbeat failed: {e}")
+metrics.ACTIVE_CONNECTIONS.labels("speech_recognition").set_function(
+    lambda: connection_manager.count("ws_speech_recognition")
+)
+metrics.ACTIVE_CONNECTIONS.labels("obs_speech_overlay").set_function(
+    lambda: connection_manager.count("ws_obs_speech_overlay")
+)
+_INFLIGHT_TASKS = metrics.INFLIGHT_TASKS.labels("connection")
+_RECOGNITION_MESSAGES_IN = metrics.MESSAGES_IN.labels("speech_recognition")
+_OVERLAY_MESSAGES_IN = metrics.MESSAGES_IN.labels("obs_speech_overlay")
 
 
 #  SECTION:=============================================================
@@ -78,6 +66,9 @@ async def heartbeat(
 
 def task_done_callback(task: asyncio.Task):
     """Handle task completion, log exceptions if any."""
+    # Cancelled with its connection, not a failure
+    if task.cancelled():
+        return
     try:
         task.result()  # This will raise exception if task failed
     except Exception as e:
@@ -92,32 +83,187 @@ def schedule_task(task: asyncio.Task, tasks_set: set):
     task.add_done_callback(task_done_callback)
     tasks_set.add(task)
     task.add_done_callback(tasks_set.discard)
+    _INFLIGHT_TASKS.inc()
+    task.add_done_callback(lambda _: _INFLIGHT_TASKS.dec())
+
+
+def get_transcript_store(request: Request) -> "TranscriptStore":
+    """Return the shared transcript store or raise 404 if it is disabled."""
+    store = request.app.state.services.transcript_store
+    if store is None:
+        raise HTTPException(status_code=404, detail="Transcript store is disabled")
+    return store
+
+
+def get_loop_monitor(request: Request) -> "LoopMonitor":
+    """Return the shared loop monitor or raise 404 if diagnostics are disabled."""
+    monitor = request.app.state.services.loop_monitor
+    if monitor is None:
+        raise HTTPException(status_code=404, detail="Diagnostics are disabled")
+    return monitor
+
+
+def get_profiler(request: Request) -> "Profiler":
+    """Return the shared profiler or raise 404 if diagnostics are disabled."""
+    profiler = request.app.state.services.profiler
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Diagnostics are disabled")
+    return profiler
+
+
+def get_runtime_inspector(request: Request) -> "RuntimeInspector":
+    """Return the runtime inspector or raise 404 if diagnostics are disabled."""
+    inspector = request.app.state.services.runtime
+    if inspector is None:
+        raise HTTPException(status_code=404, detail="Diagnostics are disabled")
+    return inspector
 
 
 # SECTION:=============================================================
 #           Endpoints
 # =====================================================================
 
+# Routes are registered once, so endpoint changes need a restart
 endpoints = app_config.endpoints
-htmls = app_config.htmls
 
 
 # For Chrome browser to do speech recognition
+# Pages are rendered once per config version and revalidated with their ETag
 @routers.get(endpoints.speech_recognition, response_class=HTMLResponse)
 async def speech_recognition(request: Request):
-    return templates.TemplateResponse(
-        f"{htmls.speech_recognition}", {"request": request}
+    services = request.app.state.services
+    return services.pages.response(
+        request, get_app_config().htmls.speech_recognition, services.config_version
     )
 
 
 # For OBS browser source to show data
 @routers.get(endpoints.obs_speech_overlay, response_class=HTMLResponse)
 async def root(request: Request):
-    return templates.TemplateResponse(
-        f"{htmls.obs_speech_overlay}", {"request": request}
+    services = request.app.state.services
+    return services.pages.response(
+        request, get_app_config().htmls.obs_speech_overlay, services.config_version
     )
 
 
+# Static files from memory. Versioned URLs of the current build never change.
+@routers.api_route(
+    f"{STATIC_URL}/v/{{build_hash}}/{{path:path}}",
+    methods=["GET", "HEAD"],
+    include_in_schema=False,
+)
+async def static_versioned(request: Request, build_hash: str, path: str):
+    return request.app.state.services.assets.response(request, path, build_hash)
+
+
+@routers.api_route(
+    f"{STATIC_URL}/{{path:path}}", methods=["GET", "HEAD"], include_in_schema=False
+)
+async def static_file(request: Request, path: str):
+    return request.app.state.services.assets.response(request, path)
+
+
+# Prometheus scrape endpoint
+@routers.get(endpoints.metrics)
+async def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# Heartbeat round-trip times of every overlay connection
+@routers.get(f"{endpoints.admin}/heartbeat")
+async def admin_heartbeat(request: Request):
+    scheduler = request.app.state.services.heartbeat
+    heartbeat_config = get_app_config().heartbeat
+    return {
+        "interval_s": heartbeat_config.interval,
+        "timeout_s": heartbeat_config.timeout,
+        "evictions": scheduler.evictions,
+        "connections": scheduler.snapshot(),
+    }
+
+
+# Event loop lag and the recent slow callbacks with their stacks
+@routers.get(f"{endpoints.admin}/loop")
+async def admin_loop(request: Request):
+    return get_loop_monitor(request).snapshot()
+
+
+@routers.get(f"{endpoints.admin}/profile")
+async def admin_profile_status(request: Request):
+    return get_profiler(request).status()
+
+
+# Profile the event loop thread for the given seconds, or until stopped
+@routers.post(f"{endpoints.admin}/profile/start")
+async def admin_profile_start(request: Request, seconds: float = 10.0):
+    profiler = get_profiler(request)
+    try:
+        granted = profiler.start(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"seconds": granted}
+
+
+@routers.post(f"{endpoints.admin}/profile/stop")
+async def admin_profile_stop(request: Request):
+    return {"stopped": get_profiler(request).stop()}
+
+
+# format=text for a cumulative-time summary, pstats for snakeviz or pstats
+@routers.get(f"{endpoints.admin}/profile/result")
+async def admin_profile_result(request: Request, format: str = "text"):
+    profiler = get_profiler(request)
+    if not profiler.has_result():
+        raise HTTPException(status_code=404, detail="No profile result yet")
+    if format == "pstats":
+        return Response(
+            profiler.result_pstats(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="profile.prof"'},
+        )
+    return PlainTextResponse(profiler.result_text())
+
+
+# Live tasks by coroutine, gc objects, resident and traced memory, and the
+# allocation sites grown since the baseline. Tracing needs PYTHONTRACEMALLOC=1,
+# gc=true collects reference cycles first
+@routers.get(f"{endpoints.admin}/runtime")
+async def admin_runtime(request: Request, top: int = 10, gc: bool = False):
+    inspector = get_runtime_inspector(request)
+    return {
+        "tasks": inspector.tasks(top),
+        "memory": await asyncio.to_thread(inspector.memory, top, gc),
+    }
+
+
+@routers.post(f"{endpoints.admin}/runtime/baseline")
+async def admin_runtime_baseline(request: Request):
+    inspector = get_runtime_inspector(request)
+    return {"tracing": await asyncio.to_thread(inspector.set_baseline)}
+
+
+# Transcript queries. SQLite runs in a worker thread, off the event loop.
+@routers.get(f"{endpoints.transcript}/last")
+async def transcript_last(request: Request, n: int = 20):
+    store = get_transcript_store(request)
+    return await asyncio.to_thread(store.last, n)
+
+
+# start and end are epoch seconds
+@routers.get(f"{endpoints.transcript}/range")
+async def transcript_range(
+    request: Request, start: float, end: float, limit: int = 100
+):
+    store = get_transcript_store(request)
+    return await asyncio.to_thread(store.range, start, end, limit)
+
+
+@routers.get(f"{endpoints.transcript}/search")
+async def transcript_search(request: Request, q: str, limit: int = 50):
+    store = get_transcript_store(request)
+    return await asyncio.to_thread(store.search, q, limit)
+
+
 # WebSocket endpoint where speech-recogniton script connects
 # When receiving data from speech-recogniton script,
 # process_ws_message starts.
@@ -130,22 +276,35 @@ async def websocket_speech_recognition(websocket: WebSocket):
     await websocket.accept()
     connection_manager.add("ws_speech_recognition", websocket=websocket)
 
-    # Create an instance of MessagePrpocessor
-    processor = WsMessageProcessor()
+    # ?voice=male_voice: speak the final texts of this recognizer in that voice
+    voice = websocket.query_params.get("voice")
+    if voice is not None and voice not in VOICE_NAMES:
+        logger.warning(f"Unknown voice {voice}, using the default voice")
+        voice = None
+
+    # Create an instance of MessagePrpocessor, sharing the app-wide services
+    processor = WsMessageProcessor(websocket.app.state.services, voice=voice)
     # A per-connection set of running tasks
     running_tasks = set()
 
     try:
         while True:
             message = await websocket.receive_text()
+            received_at = time.perf_counter_ns()
+            _RECOGNITION_MESSAGES_IN.inc()
             logger.debug("/speech-recognition recieved message.")
 
-            target_ws = connection_manager.get("ws_obs_speech_overlay")
-            if target_ws is None:
+            # Every connected overlay receives the result, and OBS itself
+            # when the obs-websocket sink is enabled
+            target_ws = connection_manager.get_group("ws_obs_speech_overlay")
+            if target_ws is None and processor.services.obs_sink is None:
+                metrics.DROPS.labels("no_overlay").inc()
                 logger.error("websocket: obs-speech-overlay is not connected")
             else:
                 task = asyncio.create_task(
-                    processor.process_ws_message(websocket, target_ws, message)
+                    processor.process_ws_message(
+                        websocket, target_ws, message, received_at=received_at
+                    )
                 )
                 schedule_task(task, running_tasks)
     except WebSocketDisconnect as e:
@@ -163,7 +322,7 @@ async def websocket_speech_recognition(websocket: WebSocket):
             await asyncio.gather(*running_tasks, return_exceptions=True)
             running_tasks.clear()  # Optional: Cancel remaining tasks related to this connection
         # Remove WebSocket connection in this endpoint.
-        connection_manager.remove("ws_speech_recognition")
+        connection_manager.remove("ws_speech_recognition", websocket)
 
 
 # WebSocket endpoint where obs-speech-overlay script connects
@@ -175,19 +334,49 @@ async def websocket_obs_speech_overlay(websocket: WebSocket):
     # When OBS browser source starts, websocket between fast api and OBS establishes.
     await websocket.accept()
     # websocket has established, then store the websocket
-    connection_manager.add("ws_obs_speech_overlay", websocket=websocket)
-    logger.debug("webSocket:obs-speech-overlay is set.")
+    # ?delta=1: the overlay applies patches to interims, see ws_connection.delta
+    delta = websocket.query_params.get("delta") == "1"
 
-    # Send heartbeat to websocket: obs-speech-overlay
-    task_heartbeat = asyncio.create_task(heartbeat(websocket), name="heartbeat")
+    # Send heartbeats to websocket: obs-speech-overlay. A connection that
+    # stops answering is removed and this handler is cancelled.
+    scheduler = websocket.app.state.services.heartbeat
+    handler = asyncio.current_task()
+
+    def on_evict(_):
+        connection_manager.remove("ws_obs_speech_overlay", websocket)
+        handler.cancel()
+
+    heartbeat_state = scheduler.register(websocket, "ws_obs_speech_overlay", on_evict)
     try:
-        while not task_heartbeat.done():
+        # Show the recent lines at once, e.g. after the browser source reloaded.
+        # The overlay joins the broadcasts only after the snapshot, so no line
+        # is sent before it; lines added while it was sent get a new snapshot.
+        recent_lines = websocket.app.state.services.recent_lines
+        snapshot = None
+        while len(recent_lines) and recent_lines.snapshot() is not snapshot:
+            snapshot = recent_lines.snapshot()
+            await websocket.send_text(snapshot)
+        connection_manager.add(
+            "ws_obs_speech_overlay", websocket=websocket, delta=delta
+        )
+        logger.debug("webSocket:obs-speech-overlay is set.")
+        while True:
             # Receive text from websocket: obs-speech-overlay, only pong.
-            await websocket.receive_text()  # discard or use
+            message = await websocket.receive_text()
+            _OVERLAY_MESSAGES_IN.inc()
+            if message == PONG_TEXT:
+                scheduler.pong(websocket)
     except WebSocketDisconnect as e:
         logger.error(f"WebSocket:obs-speech-overlay is disconnected. Code: {e.code}")
+    except asyncio.CancelledError:
+        # Swallow only the cancel of on_evict; any other one, e.g. at shutdown,
+        # is still pending after uncancel() and goes on
+        if not heartbeat_state.evicted or handler.uncancel():
+            raise
+        logger.error("WebSocket:obs-speech-overlay missed its heartbeat, evicted")
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
-        connection_manager.remove("ws_obs_speech_overlay")
+        scheduler.unregister(websocket)
+        connection_manager.remove("ws_obs_speech_overlay", websocket)
         logger.debug("webSocket:obs-speech-overlay is removed")
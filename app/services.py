@@ -0,0 +1,515 @@
+"""Process-wide services shared by every WebSocket connection.
+
+The services are built once by the FastAPI lifespan in main.py, warmed up
+before the first request is served and closed on shutdown. Connections reach
+them through app.state.services, so a reconnecting Chrome keeps the same
+clients, connection pools and loaded speaker models.
+
+Examples:
+
+  services = SharedServices()
+  await services.startup()
+  translator = services.get_translator()
+  ...
+  await services.shutdown()
+
+Feature modules are imported when the feature is enabled, so a disabled
+feature costs no import time and its dependencies (httpx, simpleaudio,
+requests, sqlite3, cProfile) are not loaded.
+"""
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+from app import metrics
+from app.assets import PageCache, StaticAssets
+from app.config.app_config import VOICE_NAMES, AppConfig, get_app_config
+from app.tracing import Tracer
+from app.transcript.writer import TranscriptWriter
+from app.ws_connection.heartbeat import HeartbeatScheduler
+from app.ws_connection.recent_lines import RecentLines
+
+if TYPE_CHECKING:
+    import httpx
+
+    from app.api.audio_mixer import AudioMixer
+    from app.api.audio_post import AudioPostProcessor, SynthesisCache
+    from app.api.obs_websocket import ObsWebSocketSink
+    from app.api.translator import Translator
+    from app.api.tts_scheduler import TtsScheduler
+    from app.api.tts_worker import TtsWorker
+    from app.api.voicevox_engine_util import VoiceConfig, VoicevoxAudioPlayer
+    from app.config.reloader import ConfigReloader
+    from app.diagnostics import LoopMonitor, Profiler, RuntimeInspector
+    from app.ng_filter import NgWordFilter
+    from app.transcript.store import TranscriptStore
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# Keep idle connections long enough to survive the pause between utterances.
+# httpx closes them after 5 seconds by default.
+HTTP_KEEPALIVE_EXPIRY = 120.0
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+
+#  SECTION:=============================================================
+#            Functions
+#  =====================================================================
+
+
+def _http_client(**kwargs) -> "httpx.AsyncClient":
+    """Return a pooled client. httpx is imported by the first feature using it."""
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(limits=limits, **kwargs)
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class SharedServices:
+    """Holds the translator, the Voicevox player, HTTP pools and the other
+    process-wide components: transcript, tracer and heartbeat scheduler."""
+
+    def __init__(self, config: AppConfig | None = None):
+        self.config = config if config is not None else get_app_config()
+        # Incremented by every applied reload
+        self.config_version = 0
+        self.translation_client: httpx.AsyncClient | None = None
+        self.voicevox_client: httpx.AsyncClient | None = None
+        self.translator: Translator | None = None
+        self.voicevox: VoicevoxAudioPlayer | None = None
+        self.mixer: AudioMixer | None = None
+        self.synthesis_cache: SynthesisCache | None = None
+        # Speaks instead of self.voicevox when [tts_worker] is enabled
+        self.tts_worker: TtsWorker | None = None
+        # Bounds the lag of spoken finals when [tts_scheduler] is enabled
+        self.tts_scheduler: TtsScheduler | None = None
+        # Sets OBS text sources when [obs_websocket] is enabled
+        self.obs_sink: ObsWebSocketSink | None = None
+        # Masks NG words in recognition text when [ng_filter] is enabled
+        self.ng_filter: NgWordFilter | None = None
+        self.transcript: TranscriptWriter | None = None
+        self.transcript_store: TranscriptStore | None = None
+        self.loop_monitor: LoopMonitor | None = None
+        self.profiler: Profiler | None = None
+        self.runtime: RuntimeInspector | None = None
+        self.tracer: Tracer | None = None
+        self.reloader: ConfigReloader | None = None
+        self.heartbeat = HeartbeatScheduler()
+        self.recent_lines = RecentLines(self.config.recent_lines.size)
+        self.assets = StaticAssets()
+        self.pages: PageCache | None = None
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    def _build_translator(self) -> "Translator":
+        from app.api.translator import Translator
+
+        translation = self.config.translation
+        return Translator(
+            source_lang=translation.source_language,
+            target_lang=translation.target_language,
+            api_type=translation.api_type,
+            api_url=translation.api_url,
+            client=self.translation_client,
+        )
+
+    def _build_transcript(self) -> TranscriptWriter:
+        logging_config = self.config.logging
+        return TranscriptWriter(
+            filepath=logging_config.filepath if logging_config.enable else None,
+            timestamp_format=logging_config.timestamp_format,
+            queue_size=logging_config.queue_size,
+            batch_size=logging_config.batch_size,
+            max_bytes=logging_config.max_bytes,
+            backup_count=logging_config.backup_count,
+            final_text_enable=logging_config.final_text_enable,
+            translation_enable=logging_config.translation_enable,
+            store=self.transcript_store,
+        )
+
+    def _voice_configs(self) -> dict[str, "VoiceConfig"]:
+        from app.api.voicevox_engine_util import VoiceConfig
+
+        voice = self.config.voicevox
+        return {
+            name: VoiceConfig(**getattr(voice, name).model_dump())
+            for name in VOICE_NAMES
+        }
+
+    def _build_voicevox(self) -> "VoicevoxAudioPlayer":
+        from app.api.voicevox_engine_util import VoicevoxAudioPlayer
+
+        voice = self.config.voicevox
+        voices = self._voice_configs()
+        default = voices[voice.default_voice]
+        server = voice.server
+        return VoicevoxAudioPlayer(
+            speaker=default.speaker,
+            speed=default.speed,
+            intonation=default.intonation,
+            pitch=default.pitch,
+            volume=default.volume,
+            host=server.host,
+            port=server.port,
+            client=self.voicevox_client,
+            voices=voices,
+            mixer=self._get_mixer(),
+            post=self._build_post_processor(),
+            cache=self._get_synthesis_cache(),
+        )
+
+    def _get_mixer(self) -> "AudioMixer | None":
+        """Return the audio mixer, building it when the config asks for one."""
+        voice = self.config.voicevox
+        if not voice.mixer:
+            return None
+        if self.mixer is None or self.mixer.sample_rate != voice.mixer_sample_rate:
+            from app.api.audio_mixer import AudioMixer
+
+            try:
+                self.mixer = AudioMixer(voice.mixer_sample_rate)
+            except ImportError as e:
+                logger.warning(f"{e}, overlapping voices are not mixed")
+                return None
+        return self.mixer
+
+    def _build_post_processor(self) -> "AudioPostProcessor | None":
+        loudness = self.config.voicevox.loudness
+        if not loudness.enable:
+            return None
+        from app.api.audio_post import AudioPostProcessor
+
+        try:
+            return AudioPostProcessor(
+                normalize=loudness.normalize,
+                target_dbfs=loudness.target_dbfs,
+                output_sample_rate=loudness.output_sample_rate,
+            )
+        except ImportError as e:
+            logger.warning(f"{e}, the volume is applied by VOICEVOX")
+            return None
+
+    def _get_synthesis_cache(self) -> "SynthesisCache":
+        """Return the clip cache, kept across rebuilds of the player."""
+        size = self.config.voicevox.cache_size
+        if self.synthesis_cache is None:
+            from app.api.audio_post import SynthesisCache
+
+            self.synthesis_cache = SynthesisCache(size)
+        else:
+            self.synthesis_cache.resize(size)
+        return self.synthesis_cache
+
+    def _build_tts_scheduler(self) -> "TtsScheduler":
+        from app.api.tts_scheduler import TTS_LAG, TtsScheduler
+
+        TTS_LAG.set_function(
+            lambda: self.tts_scheduler.lag() if self.tts_scheduler else 0.0
+        )
+        scheduler = self.config.tts_scheduler
+        return TtsScheduler(
+            self.get_voicevox,
+            self.get_voice_config,
+            max_lag=scheduler.max_lag,
+            max_speed=scheduler.max_speed,
+            chars_per_second=scheduler.chars_per_second,
+        )
+
+    def _build_ng_filter(self) -> "NgWordFilter":
+        from app.ng_filter import NgWordFilter
+
+        ng_filter_config = self.config.ng_filter
+        return NgWordFilter.from_file(
+            ng_filter_config.filepath, mask=ng_filter_config.mask
+        )
+
+    async def _warm_up_translator(self, translator: "Translator | None") -> None:
+        if translator is None:
+            return
+        if await translator.warm_up():
+            logger.info("Translator warmed up")
+        else:
+            logger.warning("Translator warm-up failed")
+
+    async def _warm_up_voicevox(self, voicevox: "VoicevoxAudioPlayer | None") -> None:
+        if voicevox is None:
+            return
+        voice = self.config.voicevox
+        speakers = {voice.female_voice.speaker, voice.male_voice.speaker}
+        results = await asyncio.gather(
+            *(voicevox.initialize_speaker(speaker) for speaker in speakers)
+        )
+        if all(results):
+            logger.info(f"Voicevox speakers initialized: {sorted(speakers)}")
+        else:
+            logger.warning("Voicevox speaker initialization failed")
+
+    async def _rebuild_translator(self) -> None:
+        if self.translation_client is None:
+            self.translation_client = _http_client(follow_redirects=True)
+        translator = self._build_translator()
+        await self._warm_up_translator(translator)
+        self.translator = translator
+        logger.info(f"Translator rebuilt for {translator.target_lang}")
+
+    async def _wait_tts_worker(self) -> None:
+        if self.tts_worker is None:
+            return
+        if await self.tts_worker.wait_ready(self.config.tts_worker.ready_timeout):
+            logger.info("TTS worker warmed up")
+        else:
+            logger.warning("TTS worker is not ready yet, it keeps starting up")
+
+    async def _rebuild_voicevox(self) -> None:
+        if self.tts_worker is not None:
+            self.tts_worker.apply_config(self.config)
+            return
+        if self.voicevox_client is None:
+            self.voicevox_client = _http_client()
+        voicevox = self._build_voicevox()
+        await self._warm_up_voicevox(voicevox)
+        self.voicevox = voicevox
+        logger.info(f"Voicevox player rebuilt for speaker {voicevox.voice.speaker}")
+
+    async def _rebuild_ng_filter(self) -> None:
+        """Compile the word list off the event loop, then swap the filter in."""
+        ng_filter = await asyncio.to_thread(self._build_ng_filter)
+        self.ng_filter = ng_filter
+        logger.info(f"NG word filter built with {len(ng_filter)} terms")
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    async def reload_ng_words(self) -> None:
+        """Compile the NG word list again after the file was edited."""
+        if self.config.ng_filter.enable:
+            await self._rebuild_ng_filter()
+
+    def get_translator(self) -> "Translator":
+        """Return the shared Translator, building it if startup did not."""
+        if self.translator is None:
+            self.translator = self._build_translator()
+        return self.translator
+
+    def get_voicevox(self) -> "VoicevoxAudioPlayer | TtsWorker":
+        """Return the shared VoicevoxAudioPlayer, building it if startup did not.
+
+        With the TTS worker enabled, return the worker, which speaks through
+        the same say() in its own process.
+        """
+        if self.tts_worker is not None:
+            return self.tts_worker
+        if self.voicevox is None:
+            self.voicevox = self._build_voicevox()
+        return self.voicevox
+
+    def get_voice_config(self, voice: str | None = None) -> "VoiceConfig":
+        """Return the voice named voice in the current config, or the default.
+
+        Resolved here rather than by the player, which may be in the TTS
+        worker's process.
+        """
+        voices = self._voice_configs()
+        if voice is None:
+            return voices[self.config.voicevox.default_voice]
+        found = voices.get(voice)
+        if found is None:
+            logger.warning(f"Unknown voice {voice}, using the default voice")
+            return voices[self.config.voicevox.default_voice]
+        return found
+
+    async def start_tts(self, config: AppConfig | None = None) -> None:
+        """Build and warm up only the Voicevox player, for the TTS worker.
+
+        Called again with a reloaded config to rebuild the player.
+        """
+        if config is not None:
+            self.config = config
+        await self._rebuild_voicevox()
+
+    async def startup(self) -> None:
+        """Open HTTP pools and files, build the enabled services and warm them up.
+
+        Warm-up failures are logged and do not stop the app; the services
+        are still used and retry on the first utterance.
+        """
+        if self.config.translation.enable:
+            self.translation_client = _http_client(follow_redirects=True)
+            self.translator = self._build_translator()
+        if self.config.voicevox.enable and self.config.tts_worker.enable:
+            from app.api.tts_worker import TtsWorker
+
+            self.tts_worker = TtsWorker(
+                self.config, job_timeout=self.config.tts_worker.job_timeout
+            )
+            self.tts_worker.start()
+        elif self.config.voicevox.enable:
+            self.voicevox_client = _http_client()
+            self.voicevox = self._build_voicevox()
+        if self.config.voicevox.enable and self.config.tts_scheduler.enable:
+            self.tts_scheduler = self._build_tts_scheduler()
+        if self.config.ng_filter.enable:
+            await self._rebuild_ng_filter()
+        if self.config.obs_websocket.enable:
+            from app.api.obs_websocket import ObsWebSocketSink
+
+            obs = self.config.obs_websocket
+            self.obs_sink = ObsWebSocketSink(
+                f"ws://{obs.host}:{obs.port}",
+                password=self.config.obs_websocket_password,
+                original_source=obs.original_source,
+                translated_source=obs.translated_source,
+                coalesce_ms=obs.coalesce_ms,
+            )
+            self.obs_sink.start()
+        if self.config.diagnostics.enable:
+            from app.diagnostics import LoopMonitor, Profiler, RuntimeInspector
+
+            diagnostics = self.config.diagnostics
+            self.loop_monitor = LoopMonitor(
+                interval=diagnostics.lag_interval,
+                slow_threshold=diagnostics.slow_threshold,
+            )
+            await self.loop_monitor.start()
+            self.profiler = Profiler(max_seconds=diagnostics.max_profile_seconds)
+            self.runtime = RuntimeInspector()
+        if self.config.tracing.enable:
+            tracing = self.config.tracing
+            self.tracer = Tracer(tracing.filepath, sample_rate=tracing.sample_rate)
+            self.tracer.start()
+            logger.info(f"Tracing {tracing.sample_rate:.0%} of utterances")
+        if self.config.transcript_store.enable:
+            from app.transcript.store import TranscriptStore
+
+            self.transcript_store = TranscriptStore(
+                self.config.transcript_store.filepath
+            )
+            await asyncio.to_thread(self.transcript_store.open)
+        if self.config.logging.enable or self.transcript_store is not None:
+            self.transcript = self._build_transcript()
+            self.transcript.start()
+
+        self.heartbeat.start()
+        await asyncio.to_thread(self.assets.load)
+        self.pages = PageCache(self.assets.url_prefix)
+        metrics.QUEUE_DEPTH.labels("transcript").set_function(
+            lambda: self.transcript.queue_depth if self.transcript else 0
+        )
+        metrics.QUEUE_DEPTH.labels("tts_worker").set_function(
+            lambda: self.tts_worker.pending if self.tts_worker else 0
+        )
+        metrics.QUEUE_DEPTH.labels("tts_scheduler").set_function(
+            lambda: self.tts_scheduler.pending() if self.tts_scheduler else 0
+        )
+
+        await asyncio.gather(
+            self._warm_up_translator(self.translator),
+            self._warm_up_voicevox(self.voicevox),
+            self._wait_tts_worker(),
+        )
+
+        if self.config.hot_reload.enable:
+            from app.config.reloader import ConfigReloader
+
+            self.reloader = ConfigReloader(
+                self, debounce_ms=self.config.hot_reload.debounce_ms
+            )
+            await self.reloader.start()
+
+    async def apply_config(self, config: AppConfig) -> None:
+        """Switch to a reloaded config and rebuild the services it changes.
+
+        A changed translator or Voicevox player is built and warmed up before
+        it replaces the current one; calls in flight finish on the old one.
+        HTTP pools, the transcript and WebSocket connections are kept.
+        """
+        old, self.config = self.config, config
+        self.config_version += 1
+        self.recent_lines.resize(config.recent_lines.size)
+        rebuilds = []
+        if config.translation != old.translation and config.translation.enable:
+            rebuilds.append(self._rebuild_translator())
+        if config.voicevox != old.voicevox and config.voicevox.enable:
+            rebuilds.append(self._rebuild_voicevox())
+        if config.tts_scheduler != old.tts_scheduler and config.voicevox.enable:
+            scheduler = config.tts_scheduler
+            if not scheduler.enable:
+                if self.tts_scheduler is not None:
+                    await self.tts_scheduler.stop()
+                    self.tts_scheduler = None
+            elif self.tts_scheduler is None:
+                self.tts_scheduler = self._build_tts_scheduler()
+            else:
+                self.tts_scheduler.configure(
+                    scheduler.max_lag, scheduler.max_speed, scheduler.chars_per_second
+                )
+        if config.ng_filter != old.ng_filter:
+            if config.ng_filter.enable:
+                rebuilds.append(self._rebuild_ng_filter())
+            else:
+                self.ng_filter = None
+        await asyncio.gather(*rebuilds)
+
+    async def shutdown(self) -> None:
+        """Close the HTTP pools and flush the transcript opened by startup."""
+        if self.reloader is not None:
+            await self.reloader.stop()
+            self.reloader = None
+        if self.tts_scheduler is not None:
+            await self.tts_scheduler.stop()
+            self.tts_scheduler = None
+        if self.tts_worker is not None:
+            await self.tts_worker.stop()
+            self.tts_worker = None
+        if self.obs_sink is not None:
+            await self.obs_sink.stop()
+            self.obs_sink = None
+        await self.heartbeat.stop()
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+        self.runtime = None
+        if self.loop_monitor is not None:
+            await self.loop_monitor.stop()
+            self.loop_monitor = None
+        if self.tracer is not None:
+            await asyncio.to_thread(self.tracer.close)
+            self.tracer = None
+        if self.transcript is not None:
+            await asyncio.to_thread(self.transcript.close)
+            self.transcript = None
+        if self.transcript_store is not None:
+            self.transcript_store.close()
+            self.transcript_store = None
+        for client in (self.translation_client, self.voicevox_client):
+            if client is not None:
+                await client.aclose()
+        self.translation_client = None
+        self.voicevox_client = None
+        self.translator = None
+        self.voicevox = None
+        if self.mixer is not None:
+            self.mixer.stop()
+            self.mixer = None
@@ -12,6 +12,8 @@ const defaultConfig = {
   idLatestTranslated: 'latest-translated-text',
   idHistoryTranslated: 'history-translated',
   heartbeat: 'heartbeat',
+  // Receive interims as patches to the previous text, see delta-decoder.js
+  delta: false,
 };
 
 export default defaultConfig;
@@ -0,0 +1,56 @@
+// Rebuilds recognition messages from delta-encoded interims.
+// Used when the overlay connects with ?delta=1, see app/ws_connection/delta.py
+//
+// keyframe: { type: "original", recogText, isFinal, languageCode, u }
+// delta:    { type: "delta", u, p, s }
+//   p: length of the kept prefix in UTF-16 code units, s: the new suffix.
+
+//  SECTION:=============================================================
+//            Constants
+//  =====================================================================
+
+// Utterances kept; the server tracks the same number
+const MAX_UTTERANCES = 8;
+
+//  SECTION:=============================================================
+//            Class: DeltaDecoder
+//  =====================================================================
+
+export class DeltaDecoder {
+  constructor() {
+    // utterance key -> last full message
+    this.bases = new Map();
+  }
+
+  // Remember a full message as the base of later patches.
+  applyKeyframe(obj) {
+    if (obj.u === undefined) {
+      return obj;
+    }
+    this.bases.delete(obj.u);
+    if (obj.isFinal) {
+      return obj;
+    }
+    this.bases.set(obj.u, obj);
+    if (this.bases.size > MAX_UTTERANCES) {
+      this.bases.delete(this.bases.keys().next().value);
+    }
+    return obj;
+  }
+
+  // Return the full message a patch stands for, or null without a base.
+  applyDelta(obj) {
+    const base = this.bases.get(obj.u);
+    if (base === undefined || obj.p > base.recogText.length) {
+      console.debug("Dropped a delta without its base, waiting for a keyframe");
+      return null;
+    }
+    const message = {
+      ...base,
+      recogText: base.recogText.slice(0, obj.p) + obj.s,
+    };
+    this.bases.delete(obj.u);
+    this.bases.set(obj.u, message);
+    return message;
+  }
+}
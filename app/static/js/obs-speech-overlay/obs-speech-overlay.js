@@ -1,12 +1,16 @@
 import { WSClient } from '../ws/wsclient.js';
 import { TextSlider, RecogTextDisplay } from './line-slide-container.js';
 import config from './config.js';
+import { DeltaDecoder } from './delta-decoder.js';
 import { testShowMesasgeOriginals } from '../tests/obs-speech-overlay.test.js';
 
 //  SECTION:=============================================================
 //            Constants
 //  =====================================================================
 
+// Delta-encoded interims: set in config.js, or add ?delta=1 to the page URL
+const pageParams = new URLSearchParams(window.location.search);
+const useDelta = pageParams.has('delta') ? pageParams.get('delta') === '1' : config.delta;
 
 //  SECTION:============================================================= 
 //            Functions, websocket client     
@@ -42,17 +46,34 @@ class SpeechOverlay {
     this.wsClinent = null;
     this.RecogTextDisplay = new RecogTextDisplay("#recog-display", { isUpward: true, isAlignRight: true, });
     this.transTextDisplay = new TextSlider("#trans-display", { isUpward: true, isAlignRight: true, });
+    this.deltaDecoder = new DeltaDecoder();
   }
   showMessage(message) {
     const obj = JSON.parse(message);
     // console.log("type: '" + obj.type + "'");
     switch (obj.type) {
       case 'original':
-        this.RecogTextDisplay.displayMessage(obj);
+        this.RecogTextDisplay.displayMessage(this.deltaDecoder.applyKeyframe(obj));
         break;
+      case 'delta': {
+        const message = this.deltaDecoder.applyDelta(obj);
+        if (message !== null) {
+          this.RecogTextDisplay.displayMessage(message);
+        }
+        break;
+      }
       case 'translated':
         this.transTextDisplay.pushText(obj.translated_text);
         break;
+      case 'snapshot':
+        // Recent lines, oldest first, sent when this overlay connects
+        for (const line of obj.original) {
+          this.RecogTextDisplay.displayMessage({ ...line, isFinal: true });
+        }
+        for (const line of obj.translated) {
+          this.transTextDisplay.pushText(line.translated_text);
+        }
+        break;
       default:
         console.error("Received bad json.");
         break;
@@ -61,7 +82,8 @@ class SpeechOverlay {
 
   start() {
     this.wsClinent = new WSClient({
-      url: config.urlObsSpeechOverlayWs, onMessage, onClose, onError
+      url: useDelta ? `${config.urlObsSpeechOverlayWs}?delta=1` : config.urlObsSpeechOverlayWs,
+      onMessage, onClose, onError
     });
   }
 }
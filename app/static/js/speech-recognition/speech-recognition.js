@@ -162,7 +162,12 @@ if (!config) {
   console.error("No config.");
 }
 
-let wsclient = new WSClient({ url: config.urlSpeechRecognitionWs });
+// ?voice=male_voice on this page picks the VOICEVOX voice of this recognizer
+const voice = new URLSearchParams(window.location.search).get('voice');
+const wsUrl = voice
+  ? `${config.urlSpeechRecognitionWs}?voice=${encodeURIComponent(voice)}`
+  : config.urlSpeechRecognitionWs;
+let wsclient = new WSClient({ url: wsUrl });
 let recogLangCode = config.deafultLanguageCode;
 let recogLangLabel = getRecogLangLabel(recogLangCode);
 
@@ -3,6 +3,7 @@
 // Maybe, Test by using showMessage imported seems good. But I do not know 
 // what to do.
 // import { showMessage } from "../obs-speech-overlay/obs-speech-overlay.js";
+import { DeltaDecoder } from "../obs-speech-overlay/delta-decoder.js";
 
 // Tests showMessage() when receiving original text
 export function testShowMesasgeOriginals() {
@@ -41,3 +42,16 @@ async function repeatFuncInterval(func, argsIntervals) {
   }
 }
 
+
+// Tests DeltaDecoder: patches rebuild the interims, a patch without its base is dropped
+export function testDeltaDecoder() {
+  const decoder = new DeltaDecoder();
+  const keyframe = { type: 'original', recogText: '😀 Hello', isFinal: false, languageCode: 'en-US', u: 'a1' };
+  console.assert(decoder.applyKeyframe(keyframe).recogText === '😀 Hello');
+  // The emoji is two UTF-16 code units
+  console.assert(decoder.applyDelta({ type: 'delta', u: 'a1', p: 8, s: ' world' }).recogText === '😀 Hello world');
+  console.assert(decoder.applyDelta({ type: 'delta', u: 'a1', p: 3, s: 'Help' }).recogText === '😀 Help');
+  console.assert(decoder.applyDelta({ type: 'delta', u: 'b2', p: 0, s: 'x' }) === null);
+  decoder.applyKeyframe({ ...keyframe, recogText: '😀 Help!', isFinal: true });
+  console.assert(decoder.applyDelta({ type: 'delta', u: 'a1', p: 1, s: 'x' }) === null);
+}
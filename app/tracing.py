@@ -0,0 +1,202 @@
+"""Per-utterance tracing, written as Chrome trace-event JSON.
+
+Each sampled utterance gets a Trace. The processor makes it current with
+set_current() before any work for a message starts; asyncio copies the
+context into every task created afterwards, so the translator and the
+Voicevox player find the trace without it being passed around. Code records
+spans with span(), which is a no-op when there is no current trace.
+
+Spans are drawn on one row per stage of an utterance ("main", "translation",
+"voicevox"), so concurrent stages do not overlap on a row. Events are
+appended to the file by a background thread as they finish. The file is a
+JSON array that Perfetto (https://ui.perfetto.dev) and chrome://tracing
+open directly, also while the app is still writing it.
+
+Examples:
+
+  tracer = Tracer("/tmp/speech_trace.json", sample_rate=0.1)
+  tracer.start()
+  trace = tracer.start_trace(utterance_id)
+  set_current(trace)
+  with span("translator.call_api", "translation"):
+      ...
+  tracer.close()
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+from pathlib import Path
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# Rows of an utterance in the trace viewer
+LANES = ("main", "translation", "voicevox")
+
+_STOP = object()
+
+_current_trace: ContextVar["Trace | None"] = ContextVar("trace", default=None)
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class Trace:
+    """Spans of one utterance, forwarded to the tracer as they finish."""
+
+    __slots__ = ("trace_id", "tracer", "tid_base")
+
+    def __init__(self, trace_id: str, tracer: "Tracer", tid_base: int):
+        self.trace_id = trace_id
+        self.tracer = tracer
+        self.tid_base = tid_base
+
+    def add_span(
+        self,
+        name: str,
+        lane: str,
+        start_ns: int,
+        end_ns: int,
+        args: dict | None = None,
+    ) -> None:
+        """Record a finished span. Times are time.perf_counter_ns() values."""
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": start_ns / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": self.tracer.pid,
+            "tid": self.tid_base + LANES.index(lane),
+        }
+        if args:
+            event["args"] = args
+        self.tracer.emit(event)
+
+
+class Tracer:
+    """Samples utterances and writes their spans to a trace file."""
+
+    def __init__(
+        self, filepath: str | Path, sample_rate: float = 1.0, queue_size: int = 10000
+    ):
+        self.filepath = Path(filepath)
+        self.sample_rate = sample_rate
+        self.pid = os.getpid()
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: threading.Thread | None = None
+        self._rows = count(1)
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    def _run(self) -> None:
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        with self.filepath.open("w", encoding="utf-8") as f:
+            f.write("[\n")
+            f.write(json.dumps(self._metadata("process_name", 0, "speech-bridge")))
+            while True:
+                item = self._queue.get()
+                lines = []
+                while True:
+                    if item is _STOP:
+                        break
+                    lines.append(",\n" + json.dumps(item, ensure_ascii=False))
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                f.write("".join(lines))
+                f.flush()
+                if item is _STOP:
+                    break
+            f.write("\n]\n")
+
+    def _metadata(self, kind: str, tid: int, name: str) -> dict:
+        return {
+            "name": kind,
+            "ph": "M",
+            "pid": self.pid,
+            "tid": tid,
+            "args": {"name": name},
+        }
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="tracer", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write queued events and close the JSON array."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def emit(self, event: dict) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def start_trace(self, trace_id: str) -> Trace | None:
+        """Return a Trace for a new utterance, or None if it is not sampled."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        tid_base = next(self._rows) * len(LANES)
+        for i, lane in enumerate(LANES):
+            name = f"utterance {trace_id[:8]} {lane}"
+            self.emit(self._metadata("thread_name", tid_base + i, name))
+        return Trace(trace_id, self, tid_base)
+
+
+#  SECTION:=============================================================
+#            Functions, context
+#  =====================================================================
+
+
+def set_current(trace: Trace | None) -> None:
+    """Make trace current for this task and the tasks it creates."""
+    _current_trace.set(trace)
+
+
+def get_current() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, lane: str = "main", **args):
+    """Record the block as a span of the current trace, if there is one."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        trace.add_span(name, lane, start, time.perf_counter_ns(), args)
@@ -0,0 +1,224 @@
+"""Append-only transcript store in SQLite with time and full-text indexes.
+
+Every final utterance becomes one row with its ID, start and final
+timestamps, language, original text and, once it arrives, its translation.
+A B-tree index on the final timestamp serves time-range queries and an FTS5
+table with the trigram tokenizer serves text search, which also works for
+Japanese text without word boundaries. Queries read only the matching rows,
+so they stay fast over multi-hour streams.
+
+Rows are written by the TranscriptWriter thread in one transaction per batch.
+Queries open their own connection per thread; with WAL they never wait for
+the writer.
+
+Examples:
+
+  store = TranscriptStore("/tmp/transcript.sqlite3")
+  store.open()
+  store.write_batch(records)
+  store.last(20)
+  store.search("こんにちは")
+  store.close()
+"""
+
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS utterances (
+    id INTEGER PRIMARY KEY,
+    utterance_id TEXT NOT NULL UNIQUE,
+    started_at REAL NOT NULL,
+    finalized_at REAL NOT NULL,
+    language TEXT,
+    text TEXT NOT NULL,
+    translation TEXT,
+    translation_language TEXT
+);
+CREATE INDEX IF NOT EXISTS utterances_finalized_at ON utterances (finalized_at);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS utterances_fts USING fts5 (
+    text, translation, content='utterances', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS utterances_ai AFTER INSERT ON utterances BEGIN
+    INSERT INTO utterances_fts (rowid, text, translation)
+    VALUES (new.id, new.text, new.translation);
+END;
+CREATE TRIGGER IF NOT EXISTS utterances_au
+AFTER UPDATE OF translation ON utterances BEGIN
+    INSERT INTO utterances_fts (utterances_fts, rowid, text, translation)
+    VALUES ('delete', old.id, old.text, old.translation);
+    INSERT INTO utterances_fts (rowid, text, translation)
+    VALUES (new.id, new.text, new.translation);
+END;
+"""
+
+COLUMNS = (
+    "utterance_id, started_at, finalized_at, language, text,"
+    " translation, translation_language"
+)
+
+# The trigram tokenizer cannot match queries shorter than this.
+FTS_MIN_QUERY_LENGTH = 3
+
+# Upper bound for the rows a single query returns.
+MAX_QUERY_LIMIT = 1000
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class TranscriptStore:
+    """SQLite-backed transcript with last-N, time-range and text queries."""
+
+    def __init__(self, filepath: str | Path):
+        self.filepath = Path(filepath)
+        self._write_conn: sqlite3.Connection | None = None
+        self._local = threading.local()
+        self._read_conns: list[sqlite3.Connection] = []
+        self._read_conns_lock = threading.Lock()
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.filepath, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """Return the read connection of the calling thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+            with self._read_conns_lock:
+                self._read_conns.append(conn)
+        return conn
+
+    def _query(self, sql: str, params: tuple) -> list[dict]:
+        rows = self._reader().execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _clamp_limit(limit: int) -> int:
+        return max(1, min(limit, MAX_QUERY_LIMIT))
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    def open(self) -> None:
+        """Create the database file and schema if they do not exist."""
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self._write_conn = self._connect()
+        self._write_conn.execute("PRAGMA journal_mode = WAL")
+        self._write_conn.execute("PRAGMA synchronous = NORMAL")
+        self._write_conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Close the write connection and every per-thread read connection."""
+        if self._write_conn is not None:
+            self._write_conn.close()
+            self._write_conn = None
+        with self._read_conns_lock:
+            for conn in self._read_conns:
+                conn.close()
+            self._read_conns.clear()
+
+    def write_batch(self, records: list) -> None:
+        """Append final utterances and attach translations in one transaction.
+
+        Called from the TranscriptWriter thread only.
+
+        Args:
+            records (list[TranscriptRecord]): Records in arrival order.
+        """
+        if self._write_conn is None:
+            raise RuntimeError("TranscriptStore is not open")
+        with self._write_conn:
+            for record in records:
+                if record.utterance_id is None:
+                    continue
+                if record.kind == "final":
+                    self._write_conn.execute(
+                        "INSERT OR IGNORE INTO utterances"
+                        " (utterance_id, started_at, finalized_at, language, text)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (
+                            record.utterance_id,
+                            record.started_at or record.created,
+                            record.created,
+                            record.language,
+                            record.text,
+                        ),
+                    )
+                elif record.kind == "translation":
+                    self._write_conn.execute(
+                        "UPDATE utterances"
+                        " SET translation = ?, translation_language = ?"
+                        " WHERE utterance_id = ?",
+                        (record.text, record.language, record.utterance_id),
+                    )
+
+    def last(self, n: int = 20) -> list[dict]:
+        """Return the last n utterances, oldest first."""
+        rows = self._query(
+            f"SELECT {COLUMNS} FROM utterances ORDER BY id DESC LIMIT ?",
+            (self._clamp_limit(n),),
+        )
+        rows.reverse()
+        return rows
+
+    def range(self, start: float, end: float, limit: int = 100) -> list[dict]:
+        """Return utterances finalized between start and end (epoch seconds)."""
+        return self._query(
+            f"SELECT {COLUMNS} FROM utterances"
+            " WHERE finalized_at >= ? AND finalized_at < ?"
+            " ORDER BY finalized_at LIMIT ?",
+            (start, end, self._clamp_limit(limit)),
+        )
+
+    def search(self, text: str, limit: int = 50) -> list[dict]:
+        """Return the newest utterances whose text or translation contain text.
+
+        Queries shorter than the trigram length fall back to a LIKE scan that
+        walks back from the newest row and stops once limit rows match.
+        """
+        limit = self._clamp_limit(limit)
+        if len(text) >= FTS_MIN_QUERY_LENGTH:
+            # Quote the query so it is matched as a phrase, not FTS syntax
+            phrase = '"' + text.replace('"', '""') + '"'
+            return self._query(
+                f"SELECT {COLUMNS} FROM utterances WHERE id IN"
+                " (SELECT rowid FROM utterances_fts WHERE utterances_fts MATCH ?)"
+                " ORDER BY id DESC LIMIT ?",
+                (phrase, limit),
+            )
+        pattern = (
+            "%"
+            + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            + "%"
+        )
+        return self._query(
+            f"SELECT {COLUMNS} FROM utterances"
+            " WHERE text LIKE ? ESCAPE '\\' OR translation LIKE ? ESCAPE '\\'"
+            " ORDER BY id DESC LIMIT ?",
+            (pattern, pattern, limit),
+        )
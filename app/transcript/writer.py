@@ -0,0 +1,303 @@
+"""Queue-backed transcript writer that keeps disk I/O off the event loop.
+
+The event loop only enqueues: log_final() and log_translation() put a record
+on a bounded queue and return at once. A background thread drains the queue
+in batches, writes the lines, fsyncs once per batch and rotates the file the
+way RotatingFileHandler did. When a TranscriptStore is given, the same batch
+is also appended to it in one transaction. When the disk stalls long enough
+to fill the queue, new records are dropped and counted instead of blocking
+the overlay.
+
+Examples:
+
+  writer = TranscriptWriter("/tmp/recog_text.log", "%Y-%m-%d %H:%M:%S")
+  writer.start()
+  writer.log_final("こんにちは", utterance_id="a1", language="ja")
+  writer.log_translation("Hello", "en", utterance_id="a1")
+  writer.close()
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+
+from app import metrics
+
+if TYPE_CHECKING:
+    from app.transcript.store import TranscriptStore
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# Sentinel that tells the writer thread to flush and exit.
+_STOP = object()
+
+# Log a dropped record once every this many drops.
+DROP_LOG_EVERY = 100
+
+_DROPS = metrics.DROPS.labels("transcript_queue_full")
+_ERRORS = metrics.ERRORS.labels("transcript")
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class TranscriptRecord(NamedTuple):
+    """One queued transcript entry."""
+
+    kind: str  # "final" or "translation"
+    created: float
+    text: str
+    language: str | None
+    utterance_id: str | None
+    started_at: float | None
+
+
+class TranscriptWriter:
+    """Writes final texts and translations to a rotating file on a thread."""
+
+    def __init__(
+        self,
+        filepath: str | Path | None,
+        timestamp_format: str,
+        queue_size: int = 1000,
+        batch_size: int = 64,
+        max_bytes: int = 10485760,
+        backup_count: int = 5,
+        final_text_enable: bool = True,
+        translation_enable: bool = True,
+        store: "TranscriptStore | None" = None,
+    ):
+        """Initialize the writer. Nothing is opened until start().
+
+        Args:
+          filepath (str | Path | None): Text transcript file. None writes
+            only to the store.
+          final_text_enable (bool): Write final texts to the text file.
+          translation_enable (bool): Write translations to the text file.
+          store (TranscriptStore | None): Opened store to append batches to.
+        """
+        self.filepath = Path(filepath) if filepath is not None else None
+        self.timestamp_format = timestamp_format
+        self.final_text_enable = final_text_enable
+        self.translation_enable = translation_enable
+        self.store = store
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: threading.Thread | None = None
+        self._file = None
+
+        # Counters, only incremented by a single thread each
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    def _enqueue(self, record: TranscriptRecord) -> bool:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            _DROPS.inc()
+            if self.dropped % DROP_LOG_EVERY == 1:
+                logger.warning(
+                    f"Transcript queue is full, dropped {self.dropped} records"
+                )
+            return False
+        self.enqueued += 1
+        return True
+
+    def _format(self, record: TranscriptRecord) -> str:
+        """Format a record as a text line, or "" if its kind is disabled."""
+        if record.kind == "translation":
+            if not self.translation_enable:
+                return ""
+            prefix = f"[{record.language}] "
+        else:
+            if not self.final_text_enable:
+                return ""
+            prefix = ""
+        created = time.localtime(record.created)
+        timestamp = time.strftime(self.timestamp_format, created)
+        return f"{timestamp} | {prefix}{record.text}\n"
+
+    def _open(self) -> None:
+        if self.filepath is None:
+            return
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.filepath.open("a", encoding="utf-8")
+
+    def _rotate(self) -> None:
+        """Shift filepath.1 .. filepath.N and start a new file."""
+        self._file.close()
+        if self.backup_count > 0:
+            name = self.filepath.name
+            for i in range(self.backup_count - 1, 0, -1):
+                src = self.filepath.with_name(f"{name}.{i}")
+                if src.exists():
+                    src.replace(self.filepath.with_name(f"{name}.{i + 1}"))
+            self.filepath.replace(self.filepath.with_name(f"{name}.1"))
+        else:
+            self.filepath.unlink(missing_ok=True)
+        self._file = None
+        self._open()
+
+    def _write_file(self, batch: list[TranscriptRecord]) -> None:
+        data = "".join(self._format(record) for record in batch)
+        if not data:
+            return
+        size = self._file.tell() + len(data.encode("utf-8"))
+        if self.max_bytes > 0 and size > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write_batch(self, batch: list[TranscriptRecord]) -> None:
+        if self._file is not None:
+            # A failing text file must not cost the store its rows
+            try:
+                self._write_file(batch)
+            except Exception as e:
+                self.errors += 1
+                _ERRORS.inc()
+                logger.error(f"Failed to write transcript file: {e}")
+        if self.store is not None:
+            self.store.write_batch(batch)
+        self.written += len(batch)
+        self.batches += 1
+
+    def _run(self) -> None:
+        """Writer thread: block for one record, then drain up to a batch."""
+        stopping = False
+        try:
+            while not stopping:
+                item = self._queue.get()
+                batch = []
+                while True:
+                    if item is _STOP:
+                        stopping = True
+                    else:
+                        batch.append(item)
+                    if stopping or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if not batch:
+                    continue
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    self.errors += 1
+                    _ERRORS.inc()
+                    logger.error(f"Failed to write transcript: {e}")
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of records waiting to be written."""
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        """Open the text file and start the writer thread.
+
+        Raises:
+            OSError: The text file cannot be opened and there is no store
+                to write to instead.
+        """
+        if self._thread is not None:
+            return
+        try:
+            self._open()
+        except OSError as e:
+            if self.store is None:
+                raise
+            self.errors += 1
+            _ERRORS.inc()
+            logger.error(f"Cannot open transcript {self.filepath}, store only: {e}")
+        self._thread = threading.Thread(
+            target=self._run, name="transcript-writer", daemon=True
+        )
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write what is queued, then stop the writer thread.
+
+        Blocks for up to timeout seconds; call it from a worker thread when
+        the event loop must stay responsive.
+        """
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.warning("Transcript queue is still full, not waiting for it")
+            else:
+                self._thread.join(max(deadline - time.monotonic(), 0.0))
+        self._thread = None
+        logger.info(
+            f"Transcript writer closed. written={self.written} dropped={self.dropped}"
+        )
+
+    def log_final(
+        self,
+        text: str,
+        utterance_id: str | None = None,
+        language: str | None = None,
+        started_at: float | None = None,
+    ) -> bool:
+        """Queue a final recognition text. Returns False if it was dropped."""
+        return self._enqueue(
+            TranscriptRecord(
+                "final", time.time(), text, language, utterance_id, started_at
+            )
+        )
+
+    def log_translation(
+        self,
+        translated_text: str,
+        target_language: str,
+        utterance_id: str | None = None,
+    ) -> bool:
+        """Queue a translation. Returns False if it was dropped."""
+        return self._enqueue(
+            TranscriptRecord(
+                "translation",
+                time.time(),
+                translated_text,
+                target_language,
+                utterance_id,
+                None,
+            )
+        )
@@ -1,19 +1,120 @@
+import asyncio
+import logging
+from typing import Dict, List
+
 from fastapi import WebSocket
-from typing import Dict
+
+from app.ws_connection.delta import OVERLAY_BYTES, DeltaEncoder
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class WsConnectionGroup:
+    """Every WebSocket registered under one client_id, used as one send target.
+
+    The group holds the manager's live list, so connections that join after
+    the group was handed out still receive later messages.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        websockets: List[WebSocket],
+        encoders: Dict[WebSocket, DeltaEncoder] | None = None,
+    ):
+        self.client_id = client_id
+        self.websockets = websockets
+        # Connections that opted in to delta-encoded interims
+        self.encoders = encoders if encoders is not None else {}
+
+    def __len__(self) -> int:
+        return len(self.websockets)
+
+    async def _send_each(self, payloads: List[tuple[WebSocket, str]]) -> None:
+        if len(payloads) == 1:
+            ws, data = payloads[0]
+            await ws.send_text(data)
+            return
+        results = await asyncio.gather(
+            *(ws.send_text(data) for ws, data in payloads), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Failed to send to {self.client_id}: {result}")
+
+    async def send_text(self, data: str) -> None:
+        """Send data to every connection. A failing connection is logged and
+        does not stop the others."""
+        await self._send_each([(ws, data) for ws in list(self.websockets)])
+
+    async def send_recognition(
+        self,
+        data: str,
+        text: str,
+        is_final: bool,
+        language_code: str,
+        utterance_id: str,
+    ) -> None:
+        """Send a recognition result built as data by build_message_to_obs.
+
+        Connections with a DeltaEncoder get a patch against the text they
+        received last instead. Call it in the order the results arrive.
+        """
+        payloads = []
+        for ws in list(self.websockets):
+            encoder = self.encoders.get(ws)
+            if encoder is None:
+                OVERLAY_BYTES.labels("full").inc(len(data.encode()))
+                payloads.append((ws, data))
+            else:
+                payloads.append(
+                    (ws, encoder.encode(text, is_final, language_code, utterance_id))
+                )
+        await self._send_each(payloads)
 
 
 class WsConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+        self.active_connections: Dict[str, List[WebSocket]] = {}
+        self.delta_encoders: Dict[WebSocket, DeltaEncoder] = {}
 
-    def add(self, client_id: str, websocket: WebSocket):
-        self.active_connections[client_id] = websocket
+    def add(self, client_id: str, websocket: WebSocket, delta: bool = False):
+        """Add websocket to client_id. delta: send it delta-encoded interims."""
+        self.active_connections.setdefault(client_id, []).append(websocket)
+        if delta:
+            self.delta_encoders[websocket] = DeltaEncoder()
 
-    def remove(self, client_id: str):
-        self.active_connections.pop(client_id, None)
+    def remove(self, client_id: str, websocket: WebSocket | None = None):
+        """Remove one connection of client_id, or all of them if None.
+
+        The list itself is kept so groups handed out earlier stay live.
+        """
+        websockets = self.active_connections.get(client_id)
+        if websockets is None:
+            return
+        if websocket is None:
+            for ws in websockets:
+                self.delta_encoders.pop(ws, None)
+            websockets.clear()
+        elif websocket in websockets:
+            websockets.remove(websocket)
+            self.delta_encoders.pop(websocket, None)
 
     def get(self, client_id: str) -> WebSocket | None:
-        return self.active_connections.get(client_id)
+        """Return the most recently added connection of client_id."""
+        websockets = self.active_connections.get(client_id)
+        return websockets[-1] if websockets else None
+
+    def get_group(self, client_id: str) -> WsConnectionGroup | None:
+        """Return all connections of client_id as one send target."""
+        websockets = self.active_connections.get(client_id)
+        if not websockets:
+            return None
+        return WsConnectionGroup(client_id, websockets, self.delta_encoders)
+
+    def count(self, client_id: str) -> int:
+        return len(self.active_connections.get(client_id, ()))
 
     def is_connected(self, client_id: str) -> bool:
         ws = self.get(client_id)
@@ -0,0 +1,138 @@
+"""Delta encoding of interim recognition results for overlays that opt in.
+
+Interims of one utterance mostly grow at the end, so resending the whole
+text for every one of them repeats the same prefix over and over. An overlay
+that connects with ?delta=1 instead gets, per interim, the length of the
+prefix it already has and the suffix that replaces the rest:
+
+  {"type": "delta", "u": "<utterance>", "p": 12, "s": "world"}
+
+p counts UTF-16 code units, the unit of JavaScript string indices, so the
+overlay applies the patch with text.slice(0, p) + s.
+
+Full messages, the "original" messages of the plain protocol with the
+utterance key "u" added, are sent as keyframes: for the first interim of an
+utterance, for every KEYFRAME_INTERVAL-th interim, when nothing is shared
+with the previous text, and for the final. An overlay that lost its base,
+e.g. after a reload, ignores patches until the next keyframe.
+
+Examples:
+
+  encoder = DeltaEncoder()
+  encoder.encode("Hello", False, "en-US", utterance_id)        # keyframe
+  encoder.encode("Hello world", False, "en-US", utterance_id)  # delta
+"""
+
+import json
+import logging
+
+from app import metrics
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# A full message after this many patches, so a missed patch heals quickly
+KEYFRAME_INTERVAL = 20
+# Utterances tracked per overlay; older ones lost their final somewhere
+MAX_UTTERANCES = 8
+# Length of the utterance key sent to the overlay
+UTTERANCE_KEY_LENGTH = 8
+
+OVERLAY_BYTES = metrics.REGISTRY.register(
+    metrics.Counter(
+        "speech_bridge_overlay_bytes_total",
+        "Bytes of recognition messages sent to overlays, by encoding.",
+        ["encoding"],
+    )
+)
+
+#  SECTION:=============================================================
+#            Functions
+#  =====================================================================
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    """Return the number of leading code points a and b share."""
+    if b.startswith(a):
+        return len(a)  # The usual interim: the previous text grew
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def utf16_length(text: str) -> int:
+    """Return the length of text in UTF-16 code units, as JavaScript counts."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class DeltaEncoder:
+    """The texts one overlay has received, per utterance."""
+
+    __slots__ = ("keyframe_interval", "_utterances")
+
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        # utterance key -> [last text sent, patches since the keyframe]
+        self._utterances: dict[str, list] = {}
+
+    def encode(
+        self, text: str, is_final: bool, language_code: str, utterance_id: str
+    ) -> str:
+        """Return the message that brings this overlay to text."""
+        key = utterance_id[:UTTERANCE_KEY_LENGTH]
+        state = self._utterances.pop(key, None)
+        if is_final:
+            return self._keyframe(key, text, is_final, language_code)
+
+        prefix = common_prefix_length(state[0], text) if state else 0
+        if state is None or prefix == 0 or state[1] >= self.keyframe_interval:
+            message = self._keyframe(key, text, is_final, language_code)
+            state = [text, 0]
+        else:
+            message = json.dumps(
+                {
+                    "type": "delta",
+                    "u": key,
+                    "p": utf16_length(text[:prefix]),
+                    "s": text[prefix:],
+                },
+                ensure_ascii=False,
+            )
+            OVERLAY_BYTES.labels("delta").inc(len(message.encode()))
+            state[0] = text
+            state[1] += 1
+
+        # Reinserted last, so the first key is the least recently updated
+        self._utterances[key] = state
+        if len(self._utterances) > MAX_UTTERANCES:
+            del self._utterances[next(iter(self._utterances))]
+        return message
+
+    def _keyframe(self, key: str, text: str, is_final: bool, language_code: str) -> str:
+        message = json.dumps(
+            {
+                "recogText": text,
+                "isFinal": is_final,
+                "languageCode": language_code,
+                "type": "original",
+                "u": key,
+            },
+            ensure_ascii=False,
+        )
+        OVERLAY_BYTES.labels("keyframe").inc(len(message.encode()))
+        return message
@@ -0,0 +1,289 @@
+"""One scheduler that sends heartbeats to every overlay connection.
+
+The overlay answers each heartbeat with "pong". HeartbeatScheduler keeps one
+heap of deadlines for all connections and a single task that sleeps until
+the earliest one: the next heartbeat of a connection, or the moment its pong
+is overdue. A connection whose pong does not arrive within the timeout, or
+whose heartbeat cannot be sent, is evicted: it is closed, its handler is
+cancelled and it is removed from the connection manager, so later messages
+are not sent to a half-open socket. Idle cost is one wakeup per deadline,
+and each heartbeat is a heap push and pop, so thousands of sockets cost no
+more than one task.
+
+Sends run as their own tasks, bounded by the timeout, so one stalled socket
+does not delay the heartbeats of the others. Pong round-trip times are kept
+per connection and in the heartbeat RTT histogram.
+
+Examples:
+
+  scheduler = HeartbeatScheduler()
+  scheduler.start()
+  scheduler.register(websocket, "ws_obs_speech_overlay", on_evict=remove)
+  scheduler.pong(websocket)
+  scheduler.snapshot()
+  await scheduler.stop()
+"""
+
+import asyncio
+import heapq
+import logging
+import random
+import time
+from itertools import count
+from typing import Callable
+
+from fastapi import WebSocket
+
+from app import metrics
+from app.config.app_config import get_app_config
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# The overlay's answer to a heartbeat
+PONG_TEXT = "pong"
+# Close code for evicted connections: going away
+EVICT_CLOSE_CODE = 1001
+
+HEARTBEAT_RTT = metrics.REGISTRY.register(
+    metrics.Histogram(
+        "speech_bridge_heartbeat_rtt_seconds",
+        "Round-trip time from heartbeat to pong.",
+    )
+)
+EVICTIONS = metrics.REGISTRY.register(
+    metrics.Counter(
+        "speech_bridge_heartbeat_evictions_total",
+        "Connections closed by the heartbeat scheduler.",
+        ["reason"],
+    )
+)
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class HeartbeatState:
+    """Heartbeat bookkeeping and RTT statistics of one connection."""
+
+    __slots__ = (
+        "websocket",
+        "client_id",
+        "on_evict",
+        "connected_at",
+        "due",
+        "sent_at",
+        "pongs",
+        "last_rtt",
+        "min_rtt",
+        "max_rtt",
+        "total_rtt",
+        "removed",
+        "evicted",
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        on_evict: Callable[["HeartbeatState"], None] | None,
+    ):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.on_evict = on_evict
+        self.connected_at = time.time()
+        # loop.time() of the pending heap entry; older entries are stale
+        self.due = 0.0
+        # loop.time() of the heartbeat waiting for its pong
+        self.sent_at: float | None = None
+        self.pongs = 0
+        self.last_rtt: float | None = None
+        self.min_rtt: float | None = None
+        self.max_rtt: float | None = None
+        self.total_rtt = 0.0
+        # Unregistered, and whether the scheduler did it
+        self.removed = False
+        self.evicted = False
+
+    def record_rtt(self, rtt: float) -> None:
+        self.pongs += 1
+        self.last_rtt = rtt
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        self.max_rtt = rtt if self.max_rtt is None else max(self.max_rtt, rtt)
+        self.total_rtt += rtt
+
+    def snapshot(self) -> dict:
+        client = self.websocket.client
+        return {
+            "client_id": self.client_id,
+            "peer": f"{client.host}:{client.port}" if client else None,
+            "connected_at": self.connected_at,
+            "awaiting_pong": self.sent_at is not None,
+            "pongs": self.pongs,
+            "last_rtt_ms": _ms(self.last_rtt),
+            "min_rtt_ms": _ms(self.min_rtt),
+            "mean_rtt_ms": _ms(self.total_rtt / self.pongs if self.pongs else None),
+            "max_rtt_ms": _ms(self.max_rtt),
+        }
+
+
+def _ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+class HeartbeatScheduler:
+    """Drives the heartbeats of all registered connections from one task.
+
+    Text, interval and timeout are read from the current config at each
+    heartbeat, so a reloaded config applies from the next one.
+    """
+
+    def __init__(self):
+        self._states: dict[WebSocket, HeartbeatState] = {}
+        self._heap: list[tuple[float, int, HeartbeatState]] = []
+        self._seq = count()
+        self._next_due = float("inf")
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._sends: set[asyncio.Task] = set()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    #  SECTION:=============================================================
+    #            Functions, helper
+    #  =====================================================================
+
+    def _push(self, state: HeartbeatState, due: float) -> None:
+        state.due = due
+        heapq.heappush(self._heap, (due, next(self._seq), state))
+        if due < self._next_due:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, state = heapq.heappop(self._heap)
+                if state.removed or due != state.due:
+                    continue  # Unregistered, or rescheduled by a pong
+                self._on_due(state, now)
+
+            self._next_due = self._heap[0][0] if self._heap else float("inf")
+            self._wakeup.clear()
+            timeout = None if not self._heap else max(self._next_due - now, 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_due(self, state: HeartbeatState, now: float) -> None:
+        config = get_app_config().heartbeat
+        if state.sent_at is not None:
+            self.evict(state, "timeout")
+            return
+        state.sent_at = now
+        self._push(state, now + config.timeout)
+        task = asyncio.create_task(self._send(state, config.text, config.timeout))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _send(self, state: HeartbeatState, text: str, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(state.websocket.send_text(text), timeout)
+            logger.debug("Sent a heartbeat")
+        except Exception as e:
+            logger.warning(f"Heartbeat to {state.client_id} failed: {e!r}")
+            self.evict(state, "send_failed")
+
+    async def _close(self, websocket: WebSocket) -> None:
+        # A half-open socket may never complete the closing handshake
+        try:
+            await asyncio.wait_for(websocket.close(code=EVICT_CLOSE_CODE), 1.0)
+        except Exception:
+            pass
+
+    #  SECTION:=============================================================
+    #            Functions, Main
+    #  =====================================================================
+
+    def register(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        on_evict: Callable[[HeartbeatState], None] | None = None,
+    ) -> HeartbeatState:
+        """Start sending heartbeats to websocket.
+
+        The first one is sent after half to one interval, so connections
+        opened together, e.g. after a restart, do not beat in lockstep.
+
+        on_evict is called when the connection misses a pong or a heartbeat
+        cannot be sent, after the socket has been asked to close.
+        """
+        state = HeartbeatState(websocket, client_id, on_evict)
+        self._states[websocket] = state
+        interval = get_app_config().heartbeat.interval
+        first = interval * random.uniform(0.5, 1.0)
+        self._push(state, asyncio.get_running_loop().time() + first)
+        return state
+
+    def unregister(self, websocket: WebSocket) -> None:
+        state = self._states.pop(websocket, None)
+        if state is not None:
+            state.removed = True
+
+    def pong(self, websocket: WebSocket) -> float | None:
+        """Record a pong from websocket. Returns the RTT in seconds."""
+        state = self._states.get(websocket)
+        if state is None or state.sent_at is None:
+            return None
+        now = asyncio.get_running_loop().time()
+        rtt = now - state.sent_at
+        state.record_rtt(rtt)
+        HEARTBEAT_RTT.observe(rtt)
+        interval = get_app_config().heartbeat.interval
+        self._push(state, state.sent_at + interval)
+        state.sent_at = None
+        return rtt
+
+    def evict(self, state: HeartbeatState, reason: str) -> None:
+        if state.removed:
+            return
+        self.unregister(state.websocket)
+        state.evicted = True
+        self.evictions += 1
+        EVICTIONS.labels(reason).inc()
+        logger.warning(f"Evicting {state.client_id} connection: {reason}")
+        task = asyncio.create_task(self._close(state.websocket))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+        if state.on_evict is not None:
+            state.on_evict(state)
+
+    def snapshot(self) -> list[dict]:
+        """Return the heartbeat and RTT statistics of every connection."""
+        return [state.snapshot() for state in self._states.values()]
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="heartbeat")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        tasks = [self._task, *self._sends]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
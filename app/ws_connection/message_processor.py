@@ -12,12 +12,18 @@ Examples:
 import asyncio
 import json
 import logging
+import time
+import uuid
+from typing import TYPE_CHECKING
 
 from fastapi import WebSocket
 
-from app.api.translator import Translator
-from app.api.voicevox_engine_util import VoicevoxAudioPlayer
-from app.config.app_config import app_config
+from app import metrics, tracing
+from app.services import SharedServices
+from app.ws_connection.connection_manager import WsConnectionGroup
+
+if TYPE_CHECKING:
+    from app.ng_filter import ScanCache
 
 #  SECTION:=============================================================
 #            Logger
@@ -26,12 +32,16 @@ from app.config.app_config import app_config
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
-recog_text_logger = logging.getLogger("recog_text_logger")
-
 #  SECTION:=============================================================
 #            Constatnts
 #  =====================================================================
 
+_UNPACK_LATENCY = metrics.STAGE_LATENCY.labels("unpack")
+_NG_FILTER_LATENCY = metrics.STAGE_LATENCY.labels("ng_filter")
+_OBS_SEND_LATENCY = metrics.STAGE_LATENCY.labels("obs_send")
+_TRANSLATION_LATENCY = metrics.STAGE_LATENCY.labels("translation")
+_INFLIGHT_TASKS = metrics.INFLIGHT_TASKS.labels("processor")
+
 
 #  SECTION:=============================================================
 #            Functions, utility
@@ -65,6 +75,9 @@ def shorten_language_code(language_code: str) -> str:
 
 def task_done_callback(task: asyncio.Task):
     """Handle task completion, log exceptions if any."""
+    # Cancelled with its connection, not a failure
+    if task.cancelled():
+        return
     try:
         task.result()  # This will raise exception if task failed
     except Exception as e:
@@ -79,6 +92,8 @@ def schedule_task(task: asyncio.Task, tasks_set: set):
     task.add_done_callback(task_done_callback)
     tasks_set.add(task)
     task.add_done_callback(tasks_set.discard)
+    _INFLIGHT_TASKS.inc()
+    task.add_done_callback(lambda _: _INFLIGHT_TASKS.dec())
 
 
 #  SECTION:=============================================================
@@ -89,11 +104,22 @@ def schedule_task(task: asyncio.Task, tasks_set: set):
 class WsMessageProcessor:
     """class for handling WebSocket messages and translating text."""
 
-    def __init__(self):
-        self.translator = None
-        self.voicevox = None
+    def __init__(
+        self, services: SharedServices | None = None, voice: str | None = None
+    ):
+        # Translator and Voicevox player are owned by the shared services,
+        # so they outlive this connection.
+        self.services = services if services is not None else SharedServices()
+        # Voice of this recognizer, a name in VOICE_NAMES; None for the default
+        self.voice = voice
         self._send_lock = asyncio.Lock()
         self._running_tasks = set()
+        # Current utterance: interims up to and including their final
+        self._utterance_id: str | None = None
+        self._utterance_started_at: float = 0.0
+        self._utterance_trace: tracing.Trace | None = None
+        # NG filter scan of the current utterance's previous interim
+        self._ng_cache: ScanCache | None = None
 
     #  SECTION:=============================================================
     #            Functions, helper
@@ -106,6 +132,48 @@ class WsMessageProcessor:
         is_final_text = "[Final  ]" if is_final else "[Interim]"
         logger.info(f"{is_final_text} {language_code}: {recognition_text}")
 
+    def _track_utterance(
+        self, is_final: bool
+    ) -> tuple[str, float, tracing.Trace | None]:
+        """Return (utterance_id, started_at, trace) of the message being processed.
+
+        A new utterance starts with the first message after a final. Must be
+        called before the first await so messages are counted in order. The
+        trace is None when tracing is off or the utterance is not sampled.
+        """
+        if self._utterance_id is None:
+            self._utterance_id = uuid.uuid4().hex
+            self._utterance_started_at = time.time()
+            tracer = self.services.tracer
+            self._utterance_trace = (
+                tracer.start_trace(self._utterance_id) if tracer else None
+            )
+        current = (
+            self._utterance_id,
+            self._utterance_started_at,
+            self._utterance_trace,
+        )
+        if is_final:
+            self._utterance_id = None
+        return current
+
+    def _filter_ng_words(self, recog_text: str, is_final: bool) -> str:
+        """Mask NG words, rescanning only what changed since the last interim.
+
+        Must be called in message order, like _track_utterance.
+        """
+        ng_filter = self.services.ng_filter
+        if ng_filter is None:
+            return recog_text
+        start = time.perf_counter()
+        if self._ng_cache is None:
+            self._ng_cache = ng_filter.new_cache()
+        filtered = ng_filter.apply(recog_text, self._ng_cache)
+        if is_final:
+            self._ng_cache = None
+        _NG_FILTER_LATENCY.observe(time.perf_counter() - start)
+        return filtered
+
     def _unpack_message(
         self, message: str
     ) -> tuple[str, bool, str | None, str | None] | None:
@@ -131,16 +199,40 @@ class WsMessageProcessor:
             return None
 
     async def _send_to_obs(
-        self, ws_target: WebSocket | None, message_json: str
+        self,
+        ws_target: WebSocket | WsConnectionGroup | None,
+        message_json: str,
+        message_type: str = "original",
+        recognition: tuple[str, bool, str, str] | None = None,
     ) -> None:
-        """Send the message json_encoded to the target WebSocket."""
+        """Send the message json_encoded to the target WebSocket.
+
+        Args:
+            recognition (tuple | None): (text, is_final, language_code,
+                utterance_id) of an original message, for the overlays that
+                receive delta-encoded interims.
+        """
         if not ws_target:
-            logger.error("No target WebSocket available")
+            # Not an error when the text goes to OBS through obs-websocket
+            if self.services.obs_sink is None:
+                logger.error("No target WebSocket available")
+                metrics.DROPS.labels("no_overlay").inc()
             return
+        lane = "translation" if message_type == "translated" else "main"
         try:
-            async with self._send_lock:
-                await ws_target.send_text(message_json)
+            start = time.perf_counter()
+            with tracing.span("obs_send", lane, type=message_type):
+                async with self._send_lock:
+                    if recognition is not None and isinstance(
+                        ws_target, WsConnectionGroup
+                    ):
+                        await ws_target.send_recognition(message_json, *recognition)
+                    else:
+                        await ws_target.send_text(message_json)
+            _OBS_SEND_LATENCY.observe(time.perf_counter() - start)
+            metrics.MESSAGES_OUT.labels(message_type).inc()
         except Exception as e:
+            metrics.ERRORS.labels("obs_send").inc()
             logger.error(f"Error sending message to OBS: {e}", exc_info=True)
 
     async def _translate_text(
@@ -149,60 +241,83 @@ class WsMessageProcessor:
         """
         Translate the text using Translator and return dict result.
 
-        Initializes Translator if not already initialized.
-        The initialization uses Translation in config.py
+        Uses the shared Translator, which is built at app startup.
         """
         # Check if source language of config.py matches the language of text to translate
-        if app_config.translation.source_language != shorten_language_code(
+        translation = self.services.config.translation
+        if translation.source_language != shorten_language_code(
             text_language_code or ""
         ):
             raise ValueError(
-                f"language code mismatch: {app_config.translation.source_language} != {text_language_code}"
+                f"language code mismatch: {translation.source_language} != {text_language_code}"
             )
         else:
-            if self.translator is None:
-                translation = app_config.translation
-                self.translator = Translator(
-                    source_lang=translation.source_language,
-                    target_lang=translation.target_language,
-                    api_type=translation.api_type,
-                    api_url=translation.api_url,
-                )
-            result = await self.translator.translate_as_dict(text_to_translate)
+            translator = self.services.get_translator()
+            start = time.perf_counter()
+            result = await translator.translate_as_dict(text_to_translate)
+            _TRANSLATION_LATENCY.observe(time.perf_counter() - start)
+            if result["translated_text"] is None:
+                metrics.ERRORS.labels("translation").inc()
             return result
 
     async def _translate_and_send_to_obs(
         self,
-        ws_target: WebSocket | None,
+        ws_target: WebSocket | WsConnectionGroup | None,
         text_to_translate: str,
         text_language_code: str,
+        utterance_id: str,
     ) -> None:
         try:
             translation_result = await self._translate_text(
                 text_to_translate, text_language_code
             )
             translation_json = json.dumps(translation_result)
-            await self._send_to_obs(ws_target, translation_json)
+            if translation_result["translated_text"] is not None:
+                self.services.recent_lines.add_translation(
+                    translation_result["translated_text"],
+                    translation_result["target_language"],
+                )
+                if self.services.obs_sink is not None:
+                    self.services.obs_sink.update_translation(
+                        translation_result["translated_text"]
+                    )
+            await self._send_to_obs(ws_target, translation_json, "translated")
+            self._log_translation(translation_result, utterance_id)
         except Exception as e:
+            metrics.ERRORS.labels("translation").inc()
             logger.error(f"Error translating text: {e}", exc_info=True)
 
-    async def _voicevox_say(self, text: str) -> None:
-        if self.voicevox is None:
-            voice = app_config.voicevox
-            female = voice.female_voice
-            server = voice.server
-
-            self.voicevox = VoicevoxAudioPlayer(
-                speaker=female.speaker,
-                speed=female.speed,
-                intonation=female.intonation,
-                pitch=female.pitch,
-                volume=female.volume,
-                host=server.host,
-                port=server.port,
+    def _log_final_text(
+        self, text: str, utterance_id: str, language_code: str, started_at: float
+    ) -> None:
+        """Queue the final text for the transcript file and store."""
+        transcript = self.services.transcript
+        if transcript is not None:
+            transcript.log_final(
+                text,
+                utterance_id=utterance_id,
+                language=language_code,
+                started_at=started_at,
             )
 
-        await self.voicevox.say(text)
+    def _log_translation(self, translation_result: dict, utterance_id: str) -> None:
+        """Queue the translated text for the transcript file and store."""
+        transcript = self.services.transcript
+        translated_text = translation_result.get("translated_text")
+        if transcript is not None and translated_text is not None:
+            transcript.log_translation(
+                translated_text,
+                translation_result["target_language"],
+                utterance_id=utterance_id,
+            )
+
+    async def _voicevox_say(self, text: str) -> None:
+        scheduler = self.services.tts_scheduler
+        if scheduler is not None:
+            # Queued behind the earlier finals of this voice
+            await scheduler.say(text, self.voice)
+        else:
+            await self.services.get_voicevox().say(text, self.voice)
 
     #  SECTION:=============================================================
     #            Functions, main
@@ -211,23 +326,74 @@ class WsMessageProcessor:
     async def process_ws_message(
         self,
         ws_message_source: WebSocket,
-        ws_message_target: WebSocket | None,
+        ws_message_target: WebSocket | WsConnectionGroup | None,
         message: str,
+        received_at: int | None = None,
     ) -> None:
-        """Main entry point to process a WebSocket message."""
+        """Main entry point to process a WebSocket message.
+
+        Args:
+            received_at (int | None): time.perf_counter_ns() when the message
+                was received, recorded in the trace of the utterance.
+        """
 
         # Unpack received message
+        start = time.perf_counter_ns()
         unpacked = self._unpack_message(message)
+        unpacked_at = time.perf_counter_ns()
+        _UNPACK_LATENCY.observe((unpacked_at - start) / 1e9)
         if unpacked is None:
+            metrics.DROPS.labels("bad_message").inc()
             return
         recog_text, is_final, language_code, language_label = unpacked
+        utterance_id, started_at, trace = self._track_utterance(is_final)
+        # Masked before the text reaches OBS, the transcript, VOICEVOX and
+        # the translator
+        recog_text = self._filter_ng_words(recog_text, is_final)
+
+        # Tasks created from here on, translation and Voicevox included,
+        # record their spans in the trace of this utterance
+        tracing.set_current(trace)
+        if trace is not None:
+            if received_at is not None:
+                trace.add_span("receive", "main", received_at, start)
+            trace.add_span("unpack", "main", start, unpacked_at)
+        with tracing.span("process_ws_message", is_final=is_final):
+            await self._process_unpacked(
+                ws_message_target,
+                recog_text,
+                is_final,
+                language_code,
+                utterance_id,
+                started_at,
+            )
+
+    async def _process_unpacked(
+        self,
+        ws_message_target: WebSocket | WsConnectionGroup | None,
+        recog_text: str,
+        is_final: bool,
+        language_code: str | None,
+        utterance_id: str,
+        started_at: float,
+    ) -> None:
 
         # Send message to OBS, regardless of weather the recognition text is final or not
         # Build and send message for OBS
         message_for_obs = build_message_to_obs(
             recog_text, is_final, language_code or ""
         )
-        await self._send_to_obs(ws_message_target, message_for_obs)
+        # Recorded before the send, so an overlay that connects meanwhile
+        # does not miss the line
+        if is_final:
+            self.services.recent_lines.add_original(recog_text, language_code or "")
+        if self.services.obs_sink is not None:
+            self.services.obs_sink.update_original(recog_text, is_final)
+        await self._send_to_obs(
+            ws_message_target,
+            message_for_obs,
+            recognition=(recog_text, is_final, language_code or "", utterance_id),
+        )
 
         #  SECTION:=============================================================
         #           Do if recognition text is final
@@ -236,21 +402,24 @@ class WsMessageProcessor:
         # Pass recognition text to other modules
         # Toggle the modules by config.py
         if is_final:
-            # Log final text to console
-            if app_config.logging.enable:
-                recog_text_logger.info(recog_text)
+            # Queue final text for the transcript, written off the event loop
+            self._log_final_text(
+                recog_text, utterance_id, language_code or "", started_at
+            )
             # Voicevox
-            if app_config.voicevox.enable:
+            config = self.services.config
+            if config.voicevox.enable:
                 task = asyncio.create_task(self._voicevox_say(recog_text))
                 schedule_task(task, self._running_tasks)
 
             # Translate final text
-            if app_config.translation.enable:
+            if config.translation.enable:
                 task = asyncio.create_task(
                     self._translate_and_send_to_obs(
                         ws_message_target,
                         recog_text,
                         language_code or "",
+                        utterance_id,
                     )
                 )
                 schedule_task(task, self._running_tasks)
@@ -0,0 +1,98 @@
+"""The last final lines and translations, for overlays that (re)connect.
+
+A reloaded OBS browser source would stay blank until the next utterance.
+RecentLines keeps the last N final texts and the last N translations in
+memory, one bounded deque per channel, and a newly connected overlay gets
+them as one snapshot frame:
+
+  {"type": "snapshot",
+   "original": [{"recogText": "...", "languageCode": "ja-JP"}, ...],
+   "translated": [{"translated_text": "...", "target_language": "en"}, ...]}
+
+Oldest first. The frame is built in O(N) from memory, never from the
+transcript on disk, and reused until the next line is added, so a burst of
+reconnects encodes it once.
+
+Examples:
+
+  recent = RecentLines(10)
+  recent.add_original("こんにちは", "ja-JP")
+  recent.add_translation("Hello", "en")
+  await websocket.send_text(recent.snapshot())
+"""
+
+import json
+import logging
+import time
+from collections import deque
+
+#  SECTION:=============================================================
+#            Logger
+#  =====================================================================
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class RecentLine:
+    """One displayed line: its text, language and time.time() when added."""
+
+    __slots__ = ("text", "language", "at")
+
+    def __init__(self, text: str, language: str):
+        self.text = text
+        self.language = language
+        self.at = time.time()
+
+
+class RecentLines:
+    """Bounded ring buffers of the recent lines of each overlay channel."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._original: deque[RecentLine] = deque(maxlen=size)
+        self._translated: deque[RecentLine] = deque(maxlen=size)
+        self._snapshot: str | None = None
+
+    def __len__(self) -> int:
+        return len(self._original) + len(self._translated)
+
+    def add_original(self, text: str, language_code: str) -> None:
+        self._original.append(RecentLine(text, language_code))
+        self._snapshot = None
+
+    def add_translation(self, text: str, target_language: str) -> None:
+        self._translated.append(RecentLine(text, target_language))
+        self._snapshot = None
+
+    def resize(self, size: int) -> None:
+        """Change N, keeping the newest lines."""
+        if size == self.size:
+            return
+        self.size = size
+        self._original = deque(self._original, maxlen=size)
+        self._translated = deque(self._translated, maxlen=size)
+        self._snapshot = None
+
+    def snapshot(self) -> str:
+        """Return the snapshot frame of the current lines."""
+        if self._snapshot is None:
+            self._snapshot = json.dumps(
+                {
+                    "type": "snapshot",
+                    "original": [
+                        {"recogText": line.text, "languageCode": line.language}
+                        for line in self._original
+                    ],
+                    "translated": [
+                        {"translated_text": line.text, "target_language": line.language}
+                        for line in self._translated
+                    ],
+                },
+                ensure_ascii=False,
+            )
+        return self._snapshot
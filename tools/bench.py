@@ -0,0 +1,344 @@
+"""End-to-end latency benchmark with local VOICEVOX and gas stand-ins.
+
+Starts the VOICEVOX and gas stubs from tools/stubs.py, starts the app in a
+subprocess configured to use them, replays a transcript through
+tools/replay.py and measures:
+
+  recognizer_to_overlay   recognizer frame sent -> original frame on overlay
+  final_to_translation    final sent -> translated frame on overlay
+  final_to_first_audio    final sent -> synthesized WAV delivered to the app,
+                          the moment playback can start
+  recognizer_to_obs       recognizer frame sent -> text set on the OBS stub,
+                          with --obs-websocket; coalesced interims never land
+
+Results are written as JSON together with the commit they were measured on,
+so runs can be compared across commits with --compare. Everything runs on
+127.0.0.1, no network or audio device is needed.
+
+Examples:
+
+  python -m tools.bench --output bench_results.json
+  python -m tools.bench --speed 20 --recognizers 4 --compare bench_results.json
+  python -m tools.bench --obs-websocket --overlays 0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tomllib
+from contextlib import AsyncExitStack
+from pathlib import Path
+
+import httpx
+
+from tools.replay import (
+    SentLog,
+    Utterance,
+    load_events,
+    parse_tag,
+    replay,
+    summarize,
+    synthesize_messages,
+)
+from tools.stubs import GasStub, ObsWebSocketStub, VoicevoxStub, serve_stub
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+APP_TOML = REPO_ROOT / "app" / "config" / "app_config.toml"
+BENCH_GAS_ID = "bench"
+BENCH_OBS_PASSWORD = "bench"
+
+# Built-in corpus, used when no transcript is given
+CORPUS = [
+    "こんにちは、今日も配信を見に来てくれてありがとうございます",
+    "それでは早速始めていきましょう",
+    "今日はゲームの新しいステージに挑戦します",
+    "ちょっと難しそうですね",
+    "コメントありがとうございます",
+    "ここは右に進んだほうがいいかな",
+    "あっ、やられてしまいました",
+    "もう一回やってみます",
+    "次はもっとうまくできると思います",
+    "今日はこのあたりで終わりにしようと思います",
+]
+
+#  SECTION:=============================================================
+#            Functions, helper
+#  =====================================================================
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def dump_toml(data: dict, prefix: str = "") -> str:
+    """Serialize nested tables of str/int/float/bool values as TOML."""
+    lines = []
+    tables = []
+    for key, value in data.items():
+        if isinstance(value, dict):
+            tables.append((key, value))
+        else:
+            lines.append(f"{key} = {json.dumps(value)}")
+    for key, value in tables:
+        name = f"{prefix}{key}"
+        lines.append(f"\n[{name}]")
+        lines.append(dump_toml(value, f"{name}."))
+    return "\n".join(lines)
+
+
+def write_bench_config(
+    workdir: Path,
+    voicevox_port: int,
+    gas_port: int,
+    voicevox: bool,
+    obs_port: int | None = None,
+) -> Path:
+    """Write an app config that points every external service at the stubs."""
+    with APP_TOML.open("rb") as f:
+        config = tomllib.load(f)
+    config["logging"]["filepath"] = str(workdir / "recog_text.log")
+    config["transcript_store"]["filepath"] = str(workdir / "transcript.sqlite3")
+    config["translation"]["enable"] = True
+    config["translation"][
+        "api_base_url"
+    ] = f"http://127.0.0.1:{gas_port}/macros/s/{{gas_id}}/exec"
+    config["voicevox"]["enable"] = voicevox
+    config["voicevox"]["server"] = {"host": "127.0.0.1", "port": voicevox_port}
+    config["obs_websocket"]["enable"] = obs_port is not None
+    if obs_port is not None:
+        config["obs_websocket"].update(host="127.0.0.1", port=obs_port)
+    path = workdir / "app_config.toml"
+    path.write_text(dump_toml(config), encoding="utf-8")
+    return path
+
+
+def git_commit() -> str | None:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+async def wait_for_app(url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"App exited with code {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"App did not start within {timeout} seconds")
+
+
+def start_app(
+    config_path: Path, port: int, log_path: Path, extra_env: dict | None = None
+) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        APP_CONFIG_PATH=str(config_path),
+        GAS_ID=BENCH_GAS_ID,
+        OBS_WEBSOCKET_PASSWORD=BENCH_OBS_PASSWORD,
+        **(extra_env or {}),
+    )
+    with log_path.open("wb") as log:
+        return subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app.main:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+            ],
+            cwd=REPO_ROOT,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+
+
+#  SECTION:=============================================================
+#            Functions, main
+#  =====================================================================
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    voicevox = VoicevoxStub(args.voicevox_latency, args.voicevox_jitter)
+    gas = GasStub(args.gas_latency, args.gas_jitter)
+    obs = ObsWebSocketStub(BENCH_OBS_PASSWORD)
+    voicevox_port, gas_port, app_port = free_port(), free_port(), free_port()
+    obs_port = free_port() if args.obs_websocket else None
+
+    if args.source:
+        events = load_events(args.source, args.language, "%Y-%m-%d %H:%M:%S")
+    else:
+        utterances = [
+            Utterance(text, i * 4.0, len(text) / 8.0)
+            for i, text in enumerate(CORPUS * args.repeat)
+        ]
+        events = synthesize_messages(utterances, args.language)
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        workdir = Path(tmp)
+        config_path = write_bench_config(
+            workdir, voicevox_port, gas_port, not args.no_voicevox, obs_port
+        )
+        async with AsyncExitStack() as stack:
+            await stack.enter_async_context(serve_stub(voicevox.app, voicevox_port))
+            await stack.enter_async_context(serve_stub(gas.app, gas_port))
+            if obs_port is not None:
+                await stack.enter_async_context(serve_stub(obs.app, obs_port))
+            process = start_app(config_path, app_port, workdir / "app.log")
+            try:
+                await wait_for_app(
+                    f"http://127.0.0.1:{app_port}/speech-recognition", process, 30
+                )
+                sent = SentLog()
+                report = await replay(
+                    events,
+                    host=f"ws://127.0.0.1:{app_port}",
+                    recognizers=args.recognizers,
+                    overlays=args.overlays,
+                    speed=args.speed,
+                    drain=args.drain,
+                    sent=sent,
+                )
+            finally:
+                process.terminate()
+                # The stubs keep serving while the app shuts down
+                await asyncio.to_thread(process.wait, 10)
+
+    # The stub received the tagged final text, which maps back to its send time
+    audio_latencies = []
+    for text, synthesized_at in voicevox.synthesized_at.items():
+        key = parse_tag(text)
+        if key in sent.sent_at:
+            audio_latencies.append(synthesized_at - sent.sent_at[key])
+    obs_latencies = []
+    for text, updated_at in obs.updated_at.items():
+        key = parse_tag(text)
+        if key in sent.sent_at:
+            obs_latencies.append(updated_at - sent.sent_at[key])
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "recognizers": args.recognizers,
+            "overlays": args.overlays,
+            "speed": args.speed,
+            "messages": len(events),
+            "voicevox_latency_s": args.voicevox_latency,
+            "voicevox_jitter_s": args.voicevox_jitter,
+            "gas_latency_s": args.gas_latency,
+            "gas_jitter_s": args.gas_jitter,
+            "obs_websocket": args.obs_websocket,
+        },
+        "throughput": {
+            "frames_sent": report["frames_sent"],
+            "frames_received": report["frames_received"],
+            "dropped_frames": report["dropped_frames"],
+            "send_rate_per_s": report["send_rate_per_s"],
+            "receive_rate_per_s": report["receive_rate_per_s"],
+            "obs_updates": obs.requests,
+            "obs_batches": obs.batches,
+        },
+        "latency": {
+            "recognizer_to_overlay": report["display_latency"],
+            "final_to_translation": report["translation_latency"],
+            "final_to_first_audio": summarize(audio_latencies),
+            "recognizer_to_obs": summarize(obs_latencies),
+        },
+    }
+
+
+def compare(current: dict, baseline: dict) -> None:
+    """Print p50/p95/p99 of each latency next to the baseline run."""
+    print(f"baseline {baseline.get('commit')} -> current {current.get('commit')}")
+    for name, stats in current["latency"].items():
+        base = baseline.get("latency", {}).get(name, {})
+        for q in ("p50_ms", "p95_ms", "p99_ms"):
+            new, old = stats.get(q), base.get(q)
+            if new is None or old is None:
+                delta = ""
+            else:
+                delta = (
+                    f"{new - old:+.3f} ms ({(new - old) / old * 100:+.1f}%)"
+                    if old
+                    else ""
+                )
+            print(f"  {name:>22} {q}: {old} -> {new} {delta}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", type=Path, help="transcript to replay")
+    parser.add_argument("--repeat", type=int, default=3, help="built-in corpus repeats")
+    parser.add_argument("--language", default="ja-JP")
+    parser.add_argument("--speed", type=float, default=10.0)
+    parser.add_argument("--recognizers", type=int, default=1)
+    parser.add_argument("--overlays", type=int, default=1)
+    parser.add_argument("--drain", type=float, default=3.0)
+    parser.add_argument("--voicevox-latency", type=float, default=0.05)
+    parser.add_argument("--voicevox-jitter", type=float, default=0.01)
+    parser.add_argument("--gas-latency", type=float, default=0.3)
+    parser.add_argument("--gas-jitter", type=float, default=0.05)
+    parser.add_argument("--no-voicevox", action="store_true")
+    parser.add_argument(
+        "--obs-websocket", action="store_true", help="also update the OBS stub"
+    )
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    parser.add_argument("--compare", type=Path, help="earlier results to compare")
+    return parser
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    results = asyncio.run(run_benchmark(args))
+    args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(json.dumps(results["latency"], indent=2))
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Mixer benchmark: cost of mixing one audio block of overlapping voices.
+
+Measures the NumPy functions of app/api/audio_mixer.py on synthetic speech
+at the mixer rate. No audio device is needed. Reported per stream count:
+
+  mix_us        sum the streams of one block and clip it to 16-bit PCM
+  resample_us   resample one block of one stream from --source-rate
+  load          mix time as a share of the block's duration
+
+and the splice cost: mixing a new clip into the samples still pending
+playback, which AudioMixer pays when a clip arrives while another plays.
+
+Examples:
+
+  python -m tools.bench_mixer
+  python -m tools.bench_mixer --block-ms 10 --streams 1 2 4 8 --output mixer.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.api.audio_mixer import MIXER_SAMPLE_RATE, mix, resample, to_pcm16
+from tools.bench import git_commit
+
+#  SECTION:=============================================================
+#            Functions, helper
+#  =====================================================================
+
+
+def speech_like(frames: int, rng: np.random.Generator) -> np.ndarray:
+    """Return loud noise, so the sum of a few streams clips."""
+    return rng.normal(0, 12000, frames).astype(np.float32)
+
+
+def time_us(func, repeat: int) -> tuple[float, float]:
+    """Return the median and p99 run time of func in microseconds."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        func()
+        runs.append((time.perf_counter_ns() - start) / 1000)
+    runs.sort()
+    return statistics.median(runs), runs[int(len(runs) * 0.99) - 1]
+
+
+#  SECTION:=============================================================
+#            Functions, main
+#  =====================================================================
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    rng = np.random.default_rng(args.seed)
+    rate = args.sample_rate
+    block = int(rate * args.block_ms / 1000)
+    source_block = speech_like(int(block * args.source_rate / rate), rng)
+
+    rows = []
+    for count in args.streams:
+        streams = [speech_like(block, rng) for _ in range(count)]
+        mix_median, mix_p99 = time_us(lambda: to_pcm16(mix(streams)), args.repeat)
+        resample_median, _ = time_us(
+            lambda: resample(source_block, args.source_rate, rate), args.repeat
+        )
+        rows.append(
+            {
+                "streams": count,
+                "mix_us": round(mix_median, 2),
+                "mix_p99_us": round(mix_p99, 2),
+                "resample_us": round(resample_median, 2),
+                "load": round(mix_median / (args.block_ms * 1000), 5),
+            }
+        )
+
+    pending = speech_like(int(rate * args.splice_s), rng)
+    clip = speech_like(int(rate * args.splice_s / 2), rng)
+    splice_median, splice_p99 = time_us(
+        lambda: to_pcm16(mix([pending, clip])), max(args.repeat // 10, 10)
+    )
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "sample_rate": rate,
+        "block_ms": args.block_ms,
+        "block_frames": block,
+        "blocks": rows,
+        "splice_s": args.splice_s,
+        "splice_us": round(splice_median, 2),
+        "splice_p99_us": round(splice_p99, 2),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sample-rate", type=int, default=MIXER_SAMPLE_RATE)
+    parser.add_argument("--source-rate", type=int, default=44100)
+    parser.add_argument("--block-ms", type=float, default=20.0)
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--splice-s", type=float, default=5.0, help="pending audio")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(
+        f"{results['block_frames']} frames per {args.block_ms:g} ms block "
+        f"at {args.sample_rate} Hz"
+    )
+    for row in results["blocks"]:
+        print(
+            f"  {row['streams']:2d} streams: mix {row['mix_us']:8.2f} us "
+            f"(p99 {row['mix_p99_us']:.2f}), resample {row['resample_us']:8.2f} us, "
+            f"load {row['load']:.3%}"
+        )
+    print(
+        f"splice into {args.splice_s:g} s pending: {results['splice_us']:.1f} us "
+        f"(p99 {results['splice_p99_us']:.1f})"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""NG filter benchmark: masking throughput with a large word list.
+
+Builds app/ng_filter.py's automaton from --terms generated Japanese terms
+and measures on generated recognition text:
+
+  build_ms        compile the word list into the automaton
+  scan            mask one text, in characters per second, against the
+                  str.replace loop over every term that the automaton replaces
+  utterance       mask every interim of an utterance that grows one word at
+                  a time, scanning each interim in full or incrementally
+                  with a ScanCache, in microseconds per interim
+
+No app or network is needed.
+
+Examples:
+
+  python -m tools.bench_ng_filter
+  python -m tools.bench_ng_filter --terms 10000 50000 --output ng_filter.json
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from app.ng_filter import NgWordFilter
+from tools.bench import git_commit
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+HIRAGANA = "".join(chr(c) for c in range(ord("ぁ"), ord("ん") + 1))
+KATAKANA = "".join(chr(c) for c in range(ord("ァ"), ord("ン") + 1))
+KANJI = "日本語今配信見来始新挑戦言葉話声音楽友達時間気持大丈夫本当面白"
+ALPHABET = HIRAGANA + KATAKANA + KANJI
+
+#  SECTION:=============================================================
+#            Functions, helper
+#  =====================================================================
+
+
+def make_terms(count: int, rng: random.Random) -> dict[str, str]:
+    terms = {}
+    while len(terms) < count:
+        term = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(2, 6)))
+        terms[term] = "*" * len(term)
+    return terms
+
+
+def make_words(count: int, rng: random.Random) -> list[str]:
+    return [
+        "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 4)))
+        for _ in range(count)
+    ]
+
+
+def replace_loop(text: str, terms: dict[str, str]) -> str:
+    for term, replacement in terms.items():
+        text = text.replace(term, replacement)
+    return text
+
+
+def time_s(func, repeat: int) -> float:
+    """Return the median run time of func in seconds."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+
+#  SECTION:=============================================================
+#            Functions, main
+#  =====================================================================
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    text = "".join(make_words(args.text_chars, rng))[: args.text_chars]
+    words = make_words(args.utterance_words, rng)
+    interims = ["".join(words[:i]) for i in range(1, len(words) + 1)]
+
+    rows = []
+    for count in args.terms:
+        terms = make_terms(count, rng)
+        start = time.perf_counter()
+        ng_filter = NgWordFilter(terms)
+        build_s = time.perf_counter() - start
+
+        scan_s = time_s(lambda: ng_filter.apply(text), args.repeat)
+        loop_s = time_s(lambda: replace_loop(text, terms), max(args.repeat // 10, 3))
+
+        def full():
+            for interim in interims:
+                ng_filter.apply(interim)
+
+        def incremental():
+            cache = ng_filter.new_cache()
+            for interim in interims:
+                ng_filter.apply(interim, cache)
+
+        full_s = time_s(full, args.repeat)
+        incremental_s = time_s(incremental, args.repeat)
+        rows.append(
+            {
+                "terms": count,
+                "build_ms": round(build_s * 1000, 1),
+                "scan_chars_per_s": round(len(text) / scan_s),
+                "replace_loop_chars_per_s": round(len(text) / loop_s),
+                "full_us_per_interim": round(full_s / len(interims) * 1e6, 2),
+                "incremental_us_per_interim": round(
+                    incremental_s / len(interims) * 1e6, 2
+                ),
+            }
+        )
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "text_chars": len(text),
+        "utterance_chars": len(interims[-1]),
+        "interims": len(interims),
+        "results": rows,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terms", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--text-chars", type=int, default=10000)
+    parser.add_argument("--utterance-words", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(
+        f"{results['text_chars']} chars of text, utterance of "
+        f"{results['interims']} interims up to {results['utterance_chars']} chars"
+    )
+    for row in results["results"]:
+        print(
+            f"  {row['terms']:6d} terms: build {row['build_ms']:8.1f} ms, "
+            f"scan {row['scan_chars_per_s']:>10,} chars/s "
+            f"(replace loop {row['replace_loop_chars_per_s']:>8,}), "
+            f"interim {row['full_us_per_interim']:.1f} us full, "
+            f"{row['incremental_us_per_interim']:.1f} us incremental"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Startup benchmark: import time of the app and time until it serves.
+
+Each run starts a fresh interpreter, imports app.main and runs the FastAPI
+lifespan, so nothing is cached between runs except the bytecode. Reported
+per run:
+
+  import_ms     import app.main, including the config load
+  startup_ms    lifespan startup, until the first request could be served
+  shutdown_ms   lifespan shutdown
+
+Translation and VOICEVOX are disabled in the benchmark config by default so
+no network is touched; --config measures another config, e.g. one from
+tools/bench.py pointing at the stubs. The run fails when the median import
+time exceeds --budget-ms. Heavy feature modules that were imported are
+listed, so a disabled feature that still loads its dependencies shows up.
+
+Examples:
+
+  python -m tools.bench_startup
+  python -m tools.bench_startup --runs 10 --budget-ms 600 --importtime
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tomllib
+from pathlib import Path
+
+from tools.bench import APP_TOML, REPO_ROOT, dump_toml, git_commit
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+# Modules that only an enabled feature should import
+FEATURE_MODULES = (
+    "httpx",
+    "numpy",
+    "requests",
+    "simpleaudio",
+    "sqlite3",
+    "cProfile",
+    "uvicorn",
+    "app.api.audio_mixer",
+    "app.api.audio_post",
+    "app.api.obs_websocket",
+    "app.api.translator",
+    "app.api.tts_scheduler",
+    "app.api.tts_worker",
+    "app.api.voicevox_engine_util",
+    "app.diagnostics",
+    "app.ng_filter",
+    "app.transcript.store",
+)
+
+# Runs in the child interpreter and prints one JSON line
+CHILD = f"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def run():
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+    return started, time.perf_counter()
+
+started, stopped = asyncio.run(run())
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - imported) * 1000,
+    "shutdown_ms": (stopped - started) * 1000,
+    "modules": [m for m in {FEATURE_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+#  SECTION:=============================================================
+#            Functions, helper
+#  =====================================================================
+
+
+def write_offline_config(workdir: Path) -> Path:
+    """Write the app config with the network services disabled."""
+    with APP_TOML.open("rb") as f:
+        config = tomllib.load(f)
+    config["translation"]["enable"] = False
+    config["voicevox"]["enable"] = False
+    config["logging"]["filepath"] = str(workdir / "recog_text.log")
+    config["transcript_store"]["filepath"] = str(workdir / "transcript.sqlite3")
+    config["tracing"]["filepath"] = str(workdir / "trace.json")
+    path = workdir / "app_config.toml"
+    path.write_text(dump_toml(config), encoding="utf-8")
+    return path
+
+
+def run_once(config_path: Path, importtime: bool = False) -> tuple[dict, str]:
+    """Start a fresh interpreter and return its timings and -X importtime log."""
+    env = dict(os.environ, APP_CONFIG_PATH=str(config_path))
+    env.setdefault("GAS_ID", "bench")
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    result = subprocess.run(
+        command + ["-c", CHILD],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"App failed to start:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime_log: str, limit: int = 15) -> list[tuple[str, int]]:
+    """Return (module, self time in us) of the slowest imports."""
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        if self_us.strip().isdigit():
+            rows.append((name.strip(), int(self_us)))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:limit]
+
+
+#  SECTION:=============================================================
+#            Functions, main
+#  =====================================================================
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as tmp:
+        config_path = args.config or write_offline_config(Path(tmp))
+        # Compile bytecode once so the first run is not an outlier
+        run_once(config_path)
+        runs = [run_once(config_path)[0] for _ in range(args.runs)]
+        importtime_log = run_once(config_path, importtime=True)[1]
+
+    def median(key: str) -> float:
+        return round(statistics.median(run[key] for run in runs), 3)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "budget_ms": args.budget_ms,
+        "import_ms": median("import_ms"),
+        "startup_ms": median("startup_ms"),
+        "shutdown_ms": median("shutdown_ms"),
+        "feature_modules": runs[-1]["modules"],
+        "slowest_imports_us": slowest_imports(importtime_log),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=800.0)
+    parser.add_argument("--config", type=Path, help="app config to start with")
+    parser.add_argument("--importtime", action="store_true", help="print slowest")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(
+        f"import {results['import_ms']:.1f} ms, "
+        f"startup {results['startup_ms']:.1f} ms, "
+        f"shutdown {results['shutdown_ms']:.1f} ms "
+        f"(median of {args.runs}, budget {args.budget_ms:.0f} ms)"
+    )
+    print(f"feature modules imported: {', '.join(results['feature_modules']) or '-'}")
+    if args.importtime:
+        for name, self_us in results["slowest_imports_us"]:
+            print(f"  {self_us / 1000:8.1f} ms  {name}")
+    if results["import_ms"] > args.budget_ms:
+        print(f"FAIL: import time exceeds the budget of {args.budget_ms:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+"""Replay a transcript into the WebSocket endpoints and measure the overlays.
+
+Simulated recognizers send interim -> final sequences to the speech
+recognition endpoint the way Chrome does, while simulated overlays listen on
+the overlay endpoint, answer heartbeats and time every frame they receive.
+Each recognition text is tagged with "#<recognizer>.<sequence> " so a frame
+can be matched to the moment it was sent.
+
+Sources:
+  *.log      Transcript written by the app, "timestamp | text" per line.
+  *.sqlite3  Transcript store, using the recorded start and final times.
+  *.jsonl    Recorded recognizer messages, one JSON object per line. An
+             optional "t" key gives the send time in seconds from the start.
+
+Examples:
+
+  python -m tools.replay /tmp/recog_text_2025-01-01-00-00-00.log --speed 10
+  python -m tools.replay messages.jsonl --recognizers 8 --overlays 4 --json out.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+from websockets.asyncio.client import connect
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+DEFAULT_HOST = "ws://127.0.0.1:8000"
+RECOGNITION_PATH = "/ws/speech-recognition"
+OVERLAY_PATH = "/ws/obs-speech-overlay"
+HEARTBEAT_TEXT = "heartbeat"
+
+# Chrome sends at most one interim per throttle time (speech-recognition/config.js)
+INTERIM_INTERVAL = 0.3
+# Speaking rate used when the source has no per-utterance timing
+CHARS_PER_SECOND = 8.0
+# Pause between utterances when the source has no timing
+DEFAULT_GAP = 1.0
+# Chance that an interim revises its last characters, like Chrome does
+REVISION_RATE = 0.2
+
+TAG_PATTERN = re.compile(r"^#(\d+)\.(\d+) ")
+
+#  SECTION:=============================================================
+#            Functions, transcript sources
+#  =====================================================================
+
+
+@dataclass
+class Utterance:
+    text: str
+    start: float  # seconds from the start of the stream
+    duration: float
+
+
+def read_log(path: Path, timestamp_format: str) -> list[Utterance]:
+    """Read a text transcript written by the app. Translation lines are skipped."""
+    utterances = []
+    origin = None
+    for line in path.read_text(encoding="utf-8").splitlines():
+        timestamp, sep, text = line.partition(" | ")
+        if not sep or text.startswith("["):
+            continue
+        try:
+            t = datetime.strptime(timestamp, timestamp_format).timestamp()
+        except ValueError:
+            continue
+        origin = t if origin is None else origin
+        duration = len(text) / CHARS_PER_SECOND
+        # The log only has final times; the utterance started before it
+        utterances.append(Utterance(text, max(t - origin - duration, 0.0), duration))
+    return _space_out(utterances)
+
+
+def read_store(path: Path) -> list[Utterance]:
+    """Read utterances with their recorded timing from a transcript store."""
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        rows = conn.execute(
+            "SELECT text, started_at, finalized_at FROM utterances ORDER BY id"
+        ).fetchall()
+    if not rows:
+        return []
+    origin = rows[0][1]
+    return [
+        Utterance(text, started_at - origin, max(finalized_at - started_at, 0.0))
+        for text, started_at, finalized_at in rows
+    ]
+
+
+def _space_out(utterances: list[Utterance]) -> list[Utterance]:
+    """Keep utterances from overlapping when timestamps are too coarse."""
+    cursor = 0.0
+    for utterance in utterances:
+        utterance.start = max(utterance.start, cursor)
+        cursor = utterance.start + utterance.duration + DEFAULT_GAP / 2
+    return utterances
+
+
+def synthesize_messages(
+    utterances: list[Utterance], language_code: str, seed: int = 0
+) -> list[tuple[float, dict]]:
+    """Turn final texts into (send_time, message) interim -> final sequences.
+
+    Interims grow in chunks every INTERIM_INTERVAL and sometimes revise their
+    last characters before settling, like Chrome's interim results.
+    """
+    rng = random.Random(seed)
+    language = {"code": language_code, "label": language_code}
+    events = []
+    for utterance in utterances:
+        text = utterance.text
+        steps = max(int(utterance.duration / INTERIM_INTERVAL), 1)
+        for step in range(1, steps):
+            prefix = text[: max(len(text) * step // steps, 1)]
+            if len(prefix) > 2 and rng.random() < REVISION_RATE:
+                prefix = prefix[:-2] + rng.choice("あいうえおかきくけこ")
+            t = utterance.start + step * INTERIM_INTERVAL
+            events.append(
+                (t, {"recogText": prefix, "isFinal": False, "language": language})
+            )
+        events.append(
+            (
+                utterance.start + utterance.duration,
+                {"recogText": text, "isFinal": True, "language": language},
+            )
+        )
+    return events
+
+
+def read_messages(path: Path) -> list[tuple[float, dict]]:
+    """Read recorded recognizer messages, spacing untimed ones like Chrome."""
+    events = []
+    t = 0.0
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        message = json.loads(line)
+        t = message.pop("t", t + INTERIM_INTERVAL)
+        events.append((t, message))
+    return events
+
+
+def load_events(
+    path: Path, language_code: str, timestamp_format: str, seed: int = 0
+) -> list[tuple[float, dict]]:
+    """Load a source file as a timeline of recognizer messages."""
+    if path.suffix == ".jsonl":
+        return read_messages(path)
+    if path.suffix in (".sqlite3", ".sqlite", ".db"):
+        utterances = read_store(path)
+    else:
+        utterances = read_log(path, timestamp_format)
+    return synthesize_messages(utterances, language_code, seed)
+
+
+#  SECTION:=============================================================
+#            Functions, statistics
+#  =====================================================================
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Return the q-th percentile (0-100) by nearest rank, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(max(math.ceil(q / 100 * len(ordered)), 1), len(ordered))
+    return ordered[rank - 1]
+
+
+def summarize(values: list[float]) -> dict:
+    """Return count and p50/p95/p99/max in milliseconds."""
+    return {
+        "count": len(values),
+        "p50_ms": _ms(percentile(values, 50)),
+        "p95_ms": _ms(percentile(values, 95)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "max_ms": _ms(max(values) if values else None),
+    }
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+#  SECTION:=============================================================
+#            Class, simulated clients
+#  =====================================================================
+
+
+@dataclass
+class SentLog:
+    """Send times of tagged frames, shared by all recognizers."""
+
+    sent_at: dict[tuple[int, int], float] = field(default_factory=dict)
+    finals: set[tuple[int, int]] = field(default_factory=set)
+    errors: int = 0
+
+
+class SimulatedOverlay:
+    """Overlay client that answers heartbeats and timestamps every frame."""
+
+    def __init__(self, url: str, sent: SentLog, delta: bool = False):
+        self.url = f"{url}?delta=1" if delta else url
+        self.sent = sent
+        # Delta protocol: utterance key -> last full payload
+        self.bases: dict[str, dict] = {}
+        self.bytes_received = 0
+        self.received: set[tuple[int, int]] = set()
+        self.latencies: list[float] = []
+        self.translation_latencies: list[float] = []
+        self.frames = 0
+        self.translations = 0
+        self.heartbeats = 0
+        self.connected = asyncio.Event()
+        self.on_frame = None  # optional hook(kind, key, received_at, payload)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        async with connect(self.url, max_size=None) as ws:
+            self.connected.set()
+            receiver = asyncio.create_task(self._receive(ws))
+            await stop.wait()
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+
+    async def _receive(self, ws) -> None:
+        async for message in ws:
+            received_at = time.perf_counter()
+            self.bytes_received += len(message.encode())
+            if message == HEARTBEAT_TEXT:
+                self.heartbeats += 1
+                await ws.send("pong")
+                continue
+            self.handle_frame(message, received_at)
+
+    def handle_frame(self, message: str, received_at: float) -> None:
+        payload = json.loads(message)
+        if payload.get("type") == "snapshot":
+            return  # Recent lines from before this replay
+        if payload.get("type") == "delta":
+            payload = self.apply_delta(payload)
+            if payload is None:
+                return
+        elif "u" in payload:
+            self.bases.pop(payload["u"], None)
+            if not payload.get("isFinal"):
+                self.bases[payload["u"]] = payload
+        if payload.get("type") == "translated":
+            key = parse_tag(payload.get("original_text") or "")
+            self.translations += 1
+            if key in self.sent.sent_at:
+                self.translation_latencies.append(received_at - self.sent.sent_at[key])
+            kind = "translated"
+        else:
+            key = parse_tag(payload.get("recogText") or "")
+            self.frames += 1
+            if key in self.sent.sent_at:
+                self.received.add(key)
+                self.latencies.append(received_at - self.sent.sent_at[key])
+            kind = "original"
+        if self.on_frame is not None:
+            self.on_frame(kind, key, received_at, payload)
+
+    def apply_delta(self, payload: dict) -> dict | None:
+        """Rebuild the full payload of a delta, as delta-decoder.js does."""
+        base = self.bases.get(payload["u"])
+        if base is None:
+            return None
+        # p counts UTF-16 code units
+        kept = base["recogText"].encode("utf-16-le")[: 2 * payload["p"]]
+        full = dict(base, recogText=kept.decode("utf-16-le") + payload["s"])
+        self.bases[payload["u"]] = full
+        return full
+
+
+def parse_tag(text: str) -> tuple[int, int] | None:
+    match = TAG_PATTERN.match(text)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+class SimulatedRecognizer:
+    """Recognizer client that plays a message timeline at a speed factor."""
+
+    def __init__(self, index: int, url: str, sent: SentLog):
+        self.index = index
+        self.url = url
+        self.sent = sent
+        self.frames_sent = 0
+
+    async def run(
+        self, events: list[tuple[float, dict]], speed: float, start: float
+    ) -> None:
+        async with connect(self.url, max_size=None) as ws:
+            for seq, (t, message) in enumerate(events):
+                delay = start + t / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                key = (self.index, seq)
+                tagged = dict(message)
+                tagged["recogText"] = f"#{self.index}.{seq} {message['recogText']}"
+                self.sent.sent_at[key] = time.perf_counter()
+                if message.get("isFinal"):
+                    self.sent.finals.add(key)
+                try:
+                    await ws.send(json.dumps(tagged, ensure_ascii=False))
+                except Exception:
+                    self.sent.errors += 1
+                    raise
+                self.frames_sent += 1
+
+
+#  SECTION:=============================================================
+#            Functions, main
+#  =====================================================================
+
+
+async def replay(
+    events: list[tuple[float, dict]],
+    host: str = DEFAULT_HOST,
+    recognizers: int = 1,
+    overlays: int = 1,
+    speed: float = 1.0,
+    drain: float = 2.0,
+    overlay_hook=None,
+    sent: SentLog | None = None,
+    delta: bool = False,
+) -> dict:
+    """Play events through N recognizers into M overlays and return a report.
+
+    Args:
+        events: (send_time, message) timeline from load_events().
+        host: Base WebSocket URL of the app.
+        recognizers: Number of concurrent simulated recognizers.
+        overlays: Number of concurrent simulated overlays.
+        speed: Playback speed factor, 1.0 is real time.
+        drain: Seconds to wait for late frames after the last send.
+        overlay_hook: Optional callback set as SimulatedOverlay.on_frame.
+        sent: Optional SentLog to collect send times in, for the caller.
+        delta: Overlays receive delta-encoded interims.
+
+    Returns:
+        dict: Throughput, dropped frames and display latency summary.
+    """
+    sent = sent if sent is not None else SentLog()
+    stop = asyncio.Event()
+    overlay_clients = [
+        SimulatedOverlay(f"{host}{OVERLAY_PATH}", sent, delta) for _ in range(overlays)
+    ]
+    for overlay in overlay_clients:
+        overlay.on_frame = overlay_hook
+    overlay_tasks = [asyncio.create_task(o.run(stop)) for o in overlay_clients]
+    await asyncio.wait_for(
+        asyncio.gather(*(o.connected.wait() for o in overlay_clients)), timeout=10
+    )
+
+    recognizer_clients = [
+        SimulatedRecognizer(i, f"{host}{RECOGNITION_PATH}", sent)
+        for i in range(recognizers)
+    ]
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(r.run(events, speed, start) for r in recognizer_clients),
+        return_exceptions=True,
+    )
+    send_elapsed = time.perf_counter() - start
+    await asyncio.sleep(drain)
+    stop.set()
+    await asyncio.gather(*overlay_tasks, return_exceptions=True)
+
+    frames_sent = sum(r.frames_sent for r in recognizer_clients)
+    received = [len(o.received) for o in overlay_clients]
+    latencies = [v for o in overlay_clients for v in o.latencies]
+    translation_latencies = [
+        v for o in overlay_clients for v in o.translation_latencies
+    ]
+    return {
+        "recognizers": recognizers,
+        "overlays": overlays,
+        "speed": speed,
+        "elapsed_s": round(send_elapsed, 3),
+        "frames_sent": frames_sent,
+        "finals_sent": len(sent.finals),
+        "send_rate_per_s": (
+            round(frames_sent / send_elapsed, 1) if send_elapsed else None
+        ),
+        "frames_received": sum(o.frames for o in overlay_clients),
+        "receive_rate_per_s": (
+            round(sum(o.frames for o in overlay_clients) / send_elapsed, 1)
+            if send_elapsed
+            else None
+        ),
+        "dropped_frames": sum(frames_sent - n for n in received),
+        "translations_received": sum(o.translations for o in overlay_clients),
+        "delta": delta,
+        "overlay_bytes_received": sum(o.bytes_received for o in overlay_clients),
+        "recognizer_errors": sum(isinstance(r, Exception) for r in results),
+        "display_latency": summarize(latencies),
+        "translation_latency": summarize(translation_latencies),
+    }
+
+
+def print_report(report: dict) -> None:
+    for key, value in report.items():
+        if isinstance(value, dict):
+            value = " ".join(f"{k}={v}" for k, v in value.items())
+        print(f"{key:>22}: {value}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", type=Path, help="*.log, *.sqlite3 or *.jsonl")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--speed", type=float, default=1.0, help="1 to 100")
+    parser.add_argument("--recognizers", type=int, default=1)
+    parser.add_argument("--overlays", type=int, default=1)
+    parser.add_argument("--language", default="ja-JP")
+    parser.add_argument("--timestamp-format", default="%Y-%m-%d %H:%M:%S")
+    parser.add_argument("--limit", type=int, default=0, help="replay first N messages")
+    parser.add_argument("--drain", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--delta", action="store_true", help="delta interims")
+    parser.add_argument("--json", type=Path, help="also write the report here")
+    return parser
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    events = load_events(args.source, args.language, args.timestamp_format, args.seed)
+    if args.limit:
+        events = events[: args.limit]
+    if not events:
+        print(f"No messages in {args.source}", file=sys.stderr)
+        return 1
+    report = asyncio.run(
+        replay(
+            events,
+            host=args.host,
+            recognizers=args.recognizers,
+            overlays=args.overlays,
+            speed=args.speed,
+            drain=args.drain,
+            delta=args.delta,
+        )
+    )
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
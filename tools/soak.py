@@ -0,0 +1,339 @@
+"""Soak test: hours of simulated traffic, failing on leaked tasks or memory.
+
+Starts the app next to the VOICEVOX and gas stubs, like tools/bench.py, with
+PYTHONTRACEMALLOC set, and for --duration seconds:
+
+  - replays the built-in corpus in rounds; every round connects its
+    recognizers and overlays anew
+  - every --storm-interval seconds, opens --storm-clients recognizer and
+    overlay connections at once and drops them, half without a close
+    handshake, some in the middle of an utterance with translation and
+    VOICEVOX tasks in flight
+  - every --sample-interval seconds, reads {admin}/runtime: live tasks,
+    traced and resident memory
+
+Before and after the traffic the app is left idle for --settle seconds and
+sampled after a full garbage collection. The run fails when the idle task
+count grew by more than --max-task-growth or the traced memory by more than
+--max-memory-growth-mb, and prints the allocation sites that grew most. It
+also fails when the app exits or sampling or a storm fails. The report is
+written as JSON with the commit it ran on.
+
+Examples:
+
+  python -m tools.soak --duration 600
+  python -m tools.soak --duration 28800 --storm-interval 60 --output soak.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from websockets.asyncio.client import connect
+from websockets.exceptions import WebSocketException
+
+from tools.bench import (
+    CORPUS,
+    free_port,
+    git_commit,
+    start_app,
+    wait_for_app,
+    write_bench_config,
+)
+from tools.replay import (
+    OVERLAY_PATH,
+    RECOGNITION_PATH,
+    Utterance,
+    replay,
+    synthesize_messages,
+)
+from tools.stubs import GasStub, VoicevoxStub, serve_stub
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+ADMIN_PATH = "/admin"
+MB = 1024 * 1024
+
+#  SECTION:=============================================================
+#            Functions, helper
+#  =====================================================================
+
+
+async def read_runtime(
+    client: httpx.AsyncClient, top: int = 0, collect: bool = False
+) -> dict:
+    response = await client.get(
+        f"{ADMIN_PATH}/runtime", params={"top": top, "gc": collect}
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def sample_row(runtime: dict, started_at: float) -> dict:
+    memory = runtime["memory"]
+    return {
+        "t": round(time.monotonic() - started_at, 1),
+        "tasks": runtime["tasks"]["count"],
+        "traced_bytes": memory.get("traced_bytes"),
+        "rss_bytes": memory.get("rss_bytes"),
+        "gc_objects": memory.get("gc_objects"),
+    }
+
+
+def growth_per_hour(samples: list[dict], key: str) -> float | None:
+    """Least-squares slope of key over time, per hour."""
+    points = [(s["t"], s[key]) for s in samples if s[key] is not None]
+    if len(points) < 3:
+        return None
+    slope, _ = statistics.linear_regression(*zip(*points))
+    return slope * 3600
+
+
+async def reconnect_storm(
+    host: str, clients: int, language: str, rng: random.Random
+) -> int:
+    """Connect clients at once and drop them. Returns the failed connections."""
+
+    async def one(index: int) -> bool:
+        recognizer = index % 2 == 0
+        try:
+            ws = await connect(
+                f"{host}{RECOGNITION_PATH if recognizer else OVERLAY_PATH}",
+                open_timeout=10,
+            )
+            if recognizer:
+                await ws.send(
+                    json.dumps(
+                        {
+                            "recogText": f"storm {index}",
+                            "isFinal": rng.random() < 0.5,
+                            "language": {"code": language, "label": language},
+                        },
+                        ensure_ascii=False,
+                    )
+                )
+            if rng.random() < 0.5:
+                # Gone without a close frame, like a killed browser
+                ws.transport.abort()
+            else:
+                await ws.close()
+            return True
+        except (OSError, asyncio.TimeoutError, WebSocketException):
+            return False
+
+    results = await asyncio.gather(*(one(i) for i in range(clients)))
+    return results.count(False)
+
+
+#  SECTION:=============================================================
+#            Functions, main
+#  =====================================================================
+
+
+async def run_soak(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    voicevox = VoicevoxStub(args.voicevox_latency, args.voicevox_latency / 5)
+    gas = GasStub(args.gas_latency, args.gas_latency / 5)
+    voicevox_port, gas_port, app_port = free_port(), free_port(), free_port()
+    host = f"ws://127.0.0.1:{app_port}"
+    utterances = [
+        Utterance(text, i * 4.0, len(text) / 8.0) for i, text in enumerate(CORPUS)
+    ]
+    events = synthesize_messages(utterances, args.language, seed=args.seed)
+
+    samples: list[dict] = []
+    storms = storm_failures = rounds = 0
+    final = None
+    errors: list[str] = []
+    with tempfile.TemporaryDirectory(prefix="soak-") as tmp:
+        workdir = Path(tmp)
+        config_path = write_bench_config(workdir, voicevox_port, gas_port, True)
+        async with serve_stub(voicevox.app, voicevox_port), serve_stub(
+            gas.app, gas_port
+        ):
+            process = start_app(
+                config_path,
+                app_port,
+                workdir / "app.log",
+                {"PYTHONTRACEMALLOC": str(args.tracemalloc_frames)},
+            )
+            try:
+                await wait_for_app(
+                    f"http://127.0.0.1:{app_port}/speech-recognition", process, 30
+                )
+                async with httpx.AsyncClient(
+                    base_url=f"http://127.0.0.1:{app_port}", timeout=60
+                ) as client:
+                    # Warm up every code path once, so first-use caches and
+                    # lazy imports do not count as growth
+                    await replay(events, host, args.recognizers, args.overlays, 20)
+                    await reconnect_storm(host, args.storm_clients, args.language, rng)
+                    await asyncio.sleep(args.settle)
+                    await client.post(f"{ADMIN_PATH}/runtime/baseline")
+                    started_at = time.monotonic()
+                    baseline = await read_runtime(client, collect=True)
+                    samples.append(sample_row(baseline, started_at))
+
+                    stop = asyncio.Event()
+
+                    async def sample() -> None:
+                        while not stop.is_set():
+                            await asyncio.sleep(args.sample_interval)
+                            runtime = await read_runtime(client)
+                            samples.append(sample_row(runtime, started_at))
+                            row = samples[-1]
+                            print(
+                                f"[{row['t']:>8.0f} s] tasks {row['tasks']:4d}, "
+                                f"traced {(row['traced_bytes'] or 0) / MB:7.2f} MB, "
+                                f"rss {(row['rss_bytes'] or 0) / MB:7.1f} MB"
+                            )
+
+                    async def storm() -> None:
+                        nonlocal storms, storm_failures
+                        while not stop.is_set():
+                            await asyncio.sleep(args.storm_interval)
+                            storm_failures += await reconnect_storm(
+                                host, args.storm_clients, args.language, rng
+                            )
+                            storms += 1
+
+                    background = [
+                        asyncio.create_task(sample(), name="sampling"),
+                        asyncio.create_task(storm(), name="reconnect storm"),
+                    ]
+                    deadline = started_at + args.duration
+                    while (
+                        time.monotonic() < deadline
+                        and process.poll() is None
+                        and not any(task.done() for task in background)
+                    ):
+                        await replay(
+                            events,
+                            host,
+                            args.recognizers,
+                            args.overlays,
+                            args.speed,
+                            drain=1.0,
+                        )
+                        rounds += 1
+                    stop.set()
+                    for task in background:
+                        task.cancel()
+                    await asyncio.gather(*background, return_exceptions=True)
+                    for task in background:
+                        if not task.cancelled() and task.exception() is not None:
+                            errors.append(
+                                f"{task.get_name()} failed: {task.exception()!r}"
+                            )
+
+                    await asyncio.sleep(args.settle)
+                    # A dead app would only show up as a connection error
+                    if process.poll() is None:
+                        final = await read_runtime(client, top=args.top, collect=True)
+                        samples.append(sample_row(final, started_at))
+            finally:
+                exitcode = process.poll()
+                process.terminate()
+                await asyncio.to_thread(process.wait, 10)
+
+    first, last = samples[0], samples[-1]
+    task_growth = last["tasks"] - first["tasks"]
+    memory_growth = (last["traced_bytes"] or 0) - (first["traced_bytes"] or 0)
+    failures = []
+    if exitcode is not None:
+        failures.append(f"app exited with code {exitcode} during the soak")
+    failures.extend(errors)
+    # Growth is only measured between two idle samples
+    if final is not None and task_growth > args.max_task_growth:
+        failures.append(
+            f"idle tasks grew by {task_growth} (limit {args.max_task_growth})"
+        )
+    if final is not None and memory_growth > args.max_memory_growth_mb * MB:
+        failures.append(
+            f"traced memory grew by {memory_growth / MB:.2f} MB "
+            f"(limit {args.max_memory_growth_mb} MB)"
+        )
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "parameters": {
+            "duration_s": args.duration,
+            "recognizers": args.recognizers,
+            "overlays": args.overlays,
+            "speed": args.speed,
+            "storm_interval_s": args.storm_interval,
+            "storm_clients": args.storm_clients,
+        },
+        "rounds": rounds,
+        "storms": storms,
+        "storm_failures": storm_failures,
+        "task_growth": task_growth,
+        "traced_growth_bytes": memory_growth,
+        "traced_growth_mb_per_hour": growth_per_hour(samples[1:-1], "traced_bytes"),
+        "rss_growth_mb_per_hour": growth_per_hour(samples[1:-1], "rss_bytes"),
+        "tasks_after": final["tasks"]["top"] if final else [],
+        "top_growth": final["memory"].get("top", []) if final else [],
+        "samples": samples,
+        "failures": failures,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=600.0, help="seconds")
+    parser.add_argument("--recognizers", type=int, default=2)
+    parser.add_argument("--overlays", type=int, default=2)
+    parser.add_argument("--speed", type=float, default=5.0)
+    parser.add_argument("--language", default="ja-JP")
+    parser.add_argument("--storm-interval", type=float, default=30.0)
+    parser.add_argument("--storm-clients", type=int, default=40)
+    parser.add_argument("--sample-interval", type=float, default=10.0)
+    # Longer than a heartbeat interval, which keeps closed overlays referenced
+    parser.add_argument("--settle", type=float, default=30.0, help="idle seconds")
+    parser.add_argument("--max-task-growth", type=int, default=2)
+    parser.add_argument("--max-memory-growth-mb", type=float, default=10.0)
+    parser.add_argument("--tracemalloc-frames", type=int, default=1)
+    parser.add_argument("--top", type=int, default=10, help="sites in the report")
+    parser.add_argument("--voicevox-latency", type=float, default=0.05)
+    parser.add_argument("--gas-latency", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_soak(args))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(
+        f"{report['rounds']} rounds, {report['storms']} reconnect storms "
+        f"({report['storm_failures']} failed connections)"
+    )
+    print(
+        f"idle tasks {report['task_growth']:+d}, "
+        f"traced memory {report['traced_growth_bytes'] / MB:+.2f} MB"
+    )
+    if report["failures"]:
+        print("Largest growth since the baseline:")
+        for site in report["top_growth"]:
+            print(
+                f"  {site['size_diff_bytes'] / 1024:+10.1f} KiB "
+                f"{site['count_diff']:+7d} blocks  {site['site']}"
+            )
+        for failure in report["failures"]:
+            print(f"FAIL: {failure}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
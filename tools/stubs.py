@@ -0,0 +1,289 @@
+"""Local stand-ins for the VOICEVOX engine, the gas translate endpoint and OBS.
+
+The stubs answer like the real services with a configurable latency and
+jitter, so the app can be benchmarked offline. They record when each reply
+was sent, keyed by the text they were asked for. The OBS stub speaks the
+obs-websocket v5 protocol, authentication included, and keeps the text set
+on each input.
+
+Examples:
+
+  voicevox = VoicevoxStub(latency=0.05, jitter=0.01)
+  gas = GasStub(latency=0.3, jitter=0.1)
+  async with serve_stub(voicevox.app, 50121), serve_stub(gas.app, 50122):
+      ...
+
+  python -m tools.stubs --voicevox-port 50021 --gas-port 50022 --obs-port 4455
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import random
+import secrets
+import time
+import wave
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
+
+#  SECTION:=============================================================
+#            Constants
+#  =====================================================================
+
+SAMPLE_RATE = 24000
+# Length of synthesized audio per character, close to VOICEVOX at speed 1.0
+SECONDS_PER_CHAR = 0.12
+# obs-websocket close code of a failed Identify
+OBS_AUTHENTICATION_FAILED = 4009
+
+#  SECTION:=============================================================
+#            Functions, helper
+#  =====================================================================
+
+
+def make_wav(seconds: float, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Return a mono 16-bit WAV of silence."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wave_write:
+        wave_write.setnchannels(1)
+        wave_write.setsampwidth(2)
+        wave_write.setframerate(sample_rate)
+        wave_write.writeframes(b"\x00\x00" * int(seconds * sample_rate))
+    return buffer.getvalue()
+
+
+class _Delay:
+    """Latency with gaussian jitter, never negative."""
+
+    def __init__(self, latency: float, jitter: float, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+
+    async def wait(self) -> None:
+        delay = (
+            self._rng.gauss(self.latency, self.jitter) if self.jitter else self.latency
+        )
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+#  SECTION:=============================================================
+#            Class
+#  =====================================================================
+
+
+class VoicevoxStub:
+    """Serves audio_query, synthesis and initialize_speaker."""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, seed: int = 1):
+        self.query_delay = _Delay(latency, jitter, seed)
+        self.synthesis_delay = _Delay(latency, jitter, seed + 1)
+        # text -> perf_counter() when its synthesized audio was sent
+        self.synthesized_at: dict[str, float] = {}
+        self.requests = 0
+        self.app = FastAPI()
+        self.app.post("/audio_query")(self.audio_query)
+        self.app.post("/synthesis")(self.synthesis)
+        self.app.post("/initialize_speaker")(self.initialize_speaker)
+
+    async def audio_query(self, text: str, speaker: int) -> dict:
+        self.requests += 1
+        await self.query_delay.wait()
+        return {
+            "accent_phrases": [],
+            "speedScale": 1.0,
+            "pitchScale": 0.0,
+            "intonationScale": 1.0,
+            "volumeScale": 1.0,
+            "prePhonemeLength": 0.1,
+            "postPhonemeLength": 0.1,
+            "outputSamplingRate": SAMPLE_RATE,
+            "outputStereo": False,
+            "kana": text,
+        }
+
+    async def synthesis(self, request: Request, speaker: int) -> Response:
+        self.requests += 1
+        query = await request.json()
+        await self.synthesis_delay.wait()
+        text = query.get("kana", "")
+        audio = make_wav(len(text) * SECONDS_PER_CHAR / query.get("speedScale", 1.0))
+        self.synthesized_at[text] = time.perf_counter()
+        return Response(content=audio, media_type="audio/wav")
+
+    async def initialize_speaker(self, speaker: int) -> Response:
+        return Response(status_code=204)
+
+
+class GasStub:
+    """Serves the gas translate endpoint at /macros/s/{gas_id}/exec."""
+
+    def __init__(self, latency: float = 0.3, jitter: float = 0.0, seed: int = 2):
+        self.delay = _Delay(latency, jitter, seed)
+        self.requests = 0
+        self.app = FastAPI()
+        self.app.get("/macros/s/{gas_id}/exec")(self.translate)
+
+    async def translate(self, gas_id: str, text: str, source: str, target: str):
+        self.requests += 1
+        await self.delay.wait()
+        return Response(content=f"[{target}] {text}", media_type="text/plain")
+
+
+class ObsWebSocketStub:
+    """Serves obs-websocket v5 at /: Hello/Identify, requests and batches.
+
+    SetInputSettings and GetInputSettings work on any input name; other
+    request types fail with code 204, like an unknown request in OBS.
+    """
+
+    def __init__(
+        self,
+        password: str = "",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        seed: int = 3,
+    ):
+        self.password = password
+        self.delay = _Delay(latency, jitter, seed)
+        # input name -> text
+        self.inputs: dict[str, str] = {}
+        # text -> perf_counter() when it was set
+        self.updated_at: dict[str, float] = {}
+        self.requests = 0
+        self.batches = 0
+        self.auth_failures = 0
+        self.app = FastAPI()
+        self.app.websocket("/")(self.serve)
+
+    def _request(self, request_type: str, data: dict) -> dict:
+        self.requests += 1
+        name = data.get("inputName", "")
+        response = {"requestType": request_type}
+        if request_type == "SetInputSettings":
+            text = data.get("inputSettings", {}).get("text")
+            if text is not None:
+                self.inputs[name] = text
+                self.updated_at[text] = time.perf_counter()
+        elif request_type == "GetInputSettings":
+            response["responseData"] = {
+                "inputKind": "text_gdiplus_v3",
+                "inputSettings": {"text": self.inputs.get(name, "")},
+            }
+        else:
+            response["requestStatus"] = {"result": False, "code": 204}
+            return response
+        response["requestStatus"] = {"result": True, "code": 100}
+        return response
+
+    async def serve(self, websocket: WebSocket) -> None:
+        await websocket.accept(subprotocol="obswebsocket.json")
+        hello = {"obsWebSocketVersion": "5.5.0", "rpcVersion": 1}
+        if self.password:
+            salt, challenge = secrets.token_urlsafe(16), secrets.token_urlsafe(16)
+            hello["authentication"] = {"challenge": challenge, "salt": salt}
+        await websocket.send_json({"op": 0, "d": hello})
+        try:
+            identify = await websocket.receive_json()
+            if self.password:
+                secret = base64.b64encode(
+                    hashlib.sha256((self.password + salt).encode()).digest()
+                )
+                expected = base64.b64encode(
+                    hashlib.sha256(secret + challenge.encode()).digest()
+                ).decode()
+                if identify["d"].get("authentication") != expected:
+                    self.auth_failures += 1
+                    await websocket.close(code=OBS_AUTHENTICATION_FAILED)
+                    return
+            await websocket.send_json({"op": 2, "d": {"negotiatedRpcVersion": 1}})
+            while True:
+                message = await websocket.receive_json()
+                await self.delay.wait()
+                data = message.get("d", {})
+                if message.get("op") == 6:
+                    response = self._request(
+                        data["requestType"], data.get("requestData", {})
+                    )
+                    response["requestId"] = data.get("requestId")
+                    await websocket.send_json({"op": 7, "d": response})
+                elif message.get("op") == 8:
+                    self.batches += 1
+                    results = [
+                        self._request(r["requestType"], r.get("requestData", {}))
+                        for r in data.get("requests", [])
+                    ]
+                    await websocket.send_json(
+                        {
+                            "op": 9,
+                            "d": {
+                                "requestId": data.get("requestId"),
+                                "results": results,
+                            },
+                        }
+                    )
+        except WebSocketDisconnect:
+            pass
+
+
+@asynccontextmanager
+async def serve_stub(app: FastAPI, port: int, host: str = "127.0.0.1"):
+    """Run app with uvicorn on the current event loop while in the block."""
+    server = uvicorn.Server(
+        uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="off")
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    try:
+        yield server
+    finally:
+        server.should_exit = True
+        await task
+
+
+#  SECTION:=============================================================
+#            Functions, main
+#  =====================================================================
+
+
+async def _serve_forever(args: argparse.Namespace) -> None:
+    voicevox = VoicevoxStub(args.voicevox_latency, args.voicevox_jitter)
+    gas = GasStub(args.gas_latency, args.gas_jitter)
+    async with AsyncExitStack() as stack:
+        await stack.enter_async_context(serve_stub(voicevox.app, args.voicevox_port))
+        await stack.enter_async_context(serve_stub(gas.app, args.gas_port))
+        print(f"VOICEVOX stub: http://127.0.0.1:{args.voicevox_port}/")
+        print(f"gas stub: http://127.0.0.1:{args.gas_port}/macros/s/{{gas_id}}/exec")
+        if args.obs_port:
+            obs = ObsWebSocketStub(args.obs_password)
+            await stack.enter_async_context(serve_stub(obs.app, args.obs_port))
+            print(f"OBS stub: ws://127.0.0.1:{args.obs_port}/")
+        await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the VOICEVOX, gas and OBS stubs.")
+    parser.add_argument("--voicevox-port", type=int, default=50021)
+    parser.add_argument("--voicevox-latency", type=float, default=0.05)
+    parser.add_argument("--voicevox-jitter", type=float, default=0.0)
+    parser.add_argument("--gas-port", type=int, default=50022)
+    parser.add_argument("--gas-latency", type=float, default=0.3)
+    parser.add_argument("--gas-jitter", type=float, default=0.0)
+    parser.add_argument("--obs-port", type=int, help="also serve obs-websocket")
+    parser.add_argument("--obs-password", default="")
+    try:
+        asyncio.run(_serve_forever(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()